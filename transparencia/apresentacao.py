@@ -0,0 +1,180 @@
+"""
+Apresentação de resultados
+===========================
+
+Transforma um `Resultado` (resultados.py) em texto para o terminal,
+JSON Lines, Markdown, HTML ou CSV. Trabalha-se coluna a coluna: cada
+coluna é formatada numa só passagem e as linhas do terminal montam-se
+concatenando Series, sem iterrows(). Nem o numpy nem o pandas formatam
+"{:,.2f}" em bloco com o mesmo arredondamento do `format()`, por isso
+cada valor *distinto* de uma coluna é formatado uma vez e o resultado
+espalha-se pelos códigos (factorize); o terminal só formata os `limite`
+registos que mostra.
+"""
+
+import string
+from html import escape
+
+import numpy as np
+import pandas as pd
+
+FORMATOS = ["terminal", "jsonl", "md", "html", "csv"]
+
+_fmt = string.Formatter()
+
+
+def _distintos(serie):
+    """(códigos, valores distintos) para formatar cada valor uma só vez; None se não compensar.
+
+    Floats pelos bits (o factorize juntaria 0.0 e -0.0, "0" e "-0"); texto
+    misturado com outros tipos não se junta (1, 1.0 e True são iguais
+    para o factorize, mas não para o format).
+    """
+    v = serie.to_numpy()
+    if isinstance(serie.dtype, np.dtype) and serie.dtype.kind == "f":
+        # Preços quase todos diferentes: o factorize só acrescentaria tempo
+        amostra = v[:1000]
+        if len(v) > 1000 and len(np.unique(amostra)) > len(amostra) // 2:
+            return None
+        codigos, unicos = pd.factorize(v.view(f"i{v.dtype.itemsize}"))
+        return codigos, unicos.view(v.dtype).tolist()
+    if serie.dtype == object and pd.api.types.infer_dtype(serie, skipna=True) != "string":
+        return None
+    codigos, unicos = pd.factorize(serie)
+    return codigos, unicos.tolist()
+
+
+def _formatar(serie, spec):
+    """Formata uma coluna inteira com a mesma especificação."""
+    if not (pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie)):
+        serie = serie.astype(object).where(serie.notna(), "?")
+    distintos = _distintos(serie)
+    # Sem formato, format(v, "") == str(v); astype(str) deixaria os NaN como NaN
+    if distintos is None:
+        valores = [format(v, spec) for v in serie.tolist()]
+        return pd.Series(valores, index=serie.index, dtype=object)
+    codigos, unicos = distintos
+    valores = [format(v, spec) for v in unicos]
+    if (codigos < 0).any():
+        valores.append(format(serie[serie.isna()].iloc[0], spec))   # o código -1
+    valores = np.array(valores, dtype=object)
+    return pd.Series(valores[codigos], index=serie.index, dtype=object)
+
+
+def _verdadeiro(tabela, coluna):
+    if coluna not in tabela.columns:
+        return pd.Series(False, index=tabela.index)
+    s = tabela[coluna]
+    if pd.api.types.is_bool_dtype(s):
+        return s.fillna(False).astype(bool)
+    return s.notna() & (s.astype(str) != "")
+
+
+def _preencher(tabela, linha):
+    """Preenche um modelo "texto {coluna:formato}" para todas as linhas."""
+    saida = pd.Series("", index=tabela.index, dtype=object)
+    for literal, campo, spec, _ in _fmt.parse(linha):
+        saida = saida + literal
+        if campo is None:
+            continue
+        if campo in tabela.columns:
+            saida = saida + _formatar(tabela[campo], spec)
+        else:
+            saida = saida + "?"
+    return saida
+
+
+def _cabecalho(r):
+    linhas = ["", r.titulo]
+    if r.descricao:
+        linhas.append(r.descricao)
+    if r.separador:
+        linhas.append(r.separador)
+    return linhas
+
+
+# ════════════════════════════════════════
+# RENDERIZADORES
+# ════════════════════════════════════════
+
+def _notas(notas):
+    return [f"  {n}" if n else "" for n in notas]
+
+
+def _sem_vazias(r):
+    return [n.strip() for n in r.notas + r.rodape if n.strip()]
+
+
+def terminal(r):
+    linhas = _cabecalho(r) + _notas(r.notas)
+    t = r.tabela if r.limite is None else r.tabela.head(r.limite)
+    if r.modelo and len(t):
+        colunas = []
+        for item in r.modelo:
+            linha, cond = (item, None) if isinstance(item, str) else item
+            s = _preencher(t, linha)
+            if cond:
+                s = s.where(_verdadeiro(t, cond))
+            colunas.append(s)
+        grelha = pd.concat(colunas, axis=1, ignore_index=True)
+        # Ordem registo a registo, sem as linhas condicionais vazias
+        linhas += grelha.stack().dropna().tolist()
+    linhas += _notas(r.rodape)
+    return "\n".join(linhas) + "\n"
+
+
+def _tabela_formatada(r):
+    return pd.DataFrame({c: _formatar(r.tabela[c], r.formatos.get(c, ""))
+                         for c in r.tabela.columns}, index=r.tabela.index)
+
+
+def markdown(r):
+    # Blocos (título, descrição, notas, tabela) separados por uma só linha em branco
+    blocos = [[f"## {r.titulo.lstrip('🔍📊 ').strip()}"]]
+    if r.descricao:
+        blocos.append([r.descricao.strip()])
+    if _sem_vazias(r):
+        blocos.append([f"- {n}" for n in _sem_vazias(r)])
+    if len(r.tabela.columns):
+        t = _tabela_formatada(r).apply(lambda s: s.str.replace("|", "\\|", regex=False))
+        cab = "| " + " | ".join(t.columns) + " |"
+        sep = "|" + "---|" * len(t.columns)
+        if len(t):
+            corpo = ("| " + t.iloc[:, 0].str.cat(
+                [t[c] for c in t.columns[1:]], sep=" | ") + " |").tolist()
+        else:
+            corpo = []
+        blocos.append([cab, sep] + corpo)
+    return "\n\n".join("\n".join(b) for b in blocos) + "\n"
+
+
+def html(r):
+    partes = [f"<h2>{escape(r.titulo)}</h2>"]
+    if r.descricao:
+        partes.append(f"<p>{escape(r.descricao.strip())}</p>")
+    if _sem_vazias(r):
+        partes.append("<ul>" + "".join(f"<li>{escape(n)}</li>" for n in _sem_vazias(r)) + "</ul>")
+    partes.append(_tabela_formatada(r).to_html(index=False, escape=True, border=0))
+    return "\n".join(partes) + "\n"
+
+
+def jsonl(r):
+    return r.tabela.to_json(orient="records", lines=True, force_ascii=False,
+                            date_format="iso")
+
+
+def csv(r):
+    return r.tabela.to_csv(index=False)
+
+
+RENDERIZADORES = {
+    "terminal": terminal,
+    "jsonl": jsonl,
+    "md": markdown,
+    "html": html,
+    "csv": csv,
+}
+
+
+def renderizar(r, formato="terminal"):
+    return RENDERIZADORES[formato](r)
@@ -0,0 +1,411 @@
+"""
+Armazém particionado
+=====================
+
+Guarda os contratos normalizados numa partição por ano, ordenada pelo
+NIF da entidade adjudicante, com um ficheiro por coluna, para que uma
+investigação filtrada ("Câmara Municipal de Gondomar, 2025") leia só o
+ano e os blocos de linhas que interessam, em vez de recarregar o CSV
+inteiro.
+
+  dados_base/armazem/
+    manifesto.json                 colunas, partições e estatísticas min/max por bloco
+    ano=2025/
+      preco.npy                    float64 (mapeamento de memória)
+      data_celebracao.npy          datetime64[D]
+      nome_adjudicatario.npy       códigos int32 (mapeamento de memória)
+      nome_adjudicatario.texto.npy dicionário da partição: valores em UTF-8 unidos por \\x00
+      nome_adjudicatario.inicio.npy  posição de cada valor no dicionário
+      ...
+
+As colunas de texto são codificadas por dicionário em cada partição
+(código -1 = vazio), por isso cada partição é autónoma; uma leitura só
+descodifica os valores do dicionário que as linhas lidas usam. Cada partição
+divide-se em blocos de BLOCO linhas; como as linhas estão ordenadas por
+adjudicante, o min/max de NIF de cada bloco é estreito e um filtro por
+NIF lê só os blocos que o podem conter.
+
+`gravar(df)` escreve tudo de uma vez; o `Gravador` escreve lote a lote,
+à medida que a leitura em fluxo os entrega (ver ingestao.py).
+"""
+
+import json
+import shutil
+from pathlib import Path
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+RAIZ = Path("dados_base") / "armazem"
+
+NUMERICAS = ["preco", "preco_efetivo"]
+DATAS = ["data_celebracao"]
+
+BLOCO = 16384
+
+VERSAO = 3    # formato em disco; um armazém de outra versão é reconstruído
+
+SEP = "|"   # separador de listas de NIFs (ver partes.py)
+FIM = "\x00"  # separador dos valores no dicionário de uma coluna de texto
+
+
+def _nome_dir(ano):
+    return f"ano={ano}"
+
+
+def _tipo(col):
+    if col in NUMERICAS:
+        return "numero"
+    if col in DATAS:
+        return "data"
+    return "texto"
+
+
+# ════════════════════════════════════════
+# ESCRITA
+# ════════════════════════════════════════
+
+def _gravar_texto(destino, c, v):
+    """Códigos, dicionário (valores unidos por FIM, em UTF-8) e posições, em .npy."""
+    codigos, valores = pd.factorize(v, sort=True)
+    valores = [str(x).replace(FIM, "") for x in valores]
+    dados = [x.encode("utf-8") for x in valores]
+    # inicio[i] é onde começa o valor i; inicio[n] = fim do texto + 1
+    inicio = np.zeros(len(dados) + 1, dtype="int64")
+    np.cumsum([len(d) + 1 for d in dados], out=inicio[1:])
+    np.save(destino / f"{c}.npy", codigos.astype("int32"))
+    np.save(destino / f"{c}.texto.npy", np.frombuffer(FIM.encode().join(dados), dtype="uint8"))
+    np.save(destino / f"{c}.inicio.npy", inicio)
+    return codigos, valores
+
+
+def _min_max_nifs(codigos, valores):
+    """min/max sobre os NIFs individuais (consórcios "a|b") dos códigos dados."""
+    u = np.unique(codigos)
+    individuais = [x for i in u[u >= 0] for x in valores[i].split(SEP) if x]
+    return [min(individuais), max(individuais)] if individuais else None
+
+
+def _tipar(df):
+    """Colunas no tipo do armazém, mais `_ano` (0 quando não há data)."""
+    t = pd.DataFrame(index=df.index)
+    for c in df.columns:
+        if _tipo(c) == "numero":
+            t[c] = pd.to_numeric(df[c], errors="coerce").astype("float64")
+        elif _tipo(c) == "data":
+            t[c] = pd.to_datetime(df[c], errors="coerce")
+        else:
+            t[c] = df[c].astype("string")
+
+    t["_ano"] = (t["data_celebracao"].dt.year.fillna(0).astype(int).to_numpy()
+                 if "data_celebracao" in t else 0)
+    return t
+
+
+def _gravar_particao(raiz, a, p, colunas):
+    """Grava as linhas `p` de um ano, ordenadas por adjudicante; devolve a entrada do manifesto."""
+    if "nipc_adjudicante" in p:
+        p = p.sort_values("nipc_adjudicante", kind="stable", na_position="last")
+    destino = raiz / _nome_dir(a)
+    destino.mkdir(parents=True, exist_ok=True)
+    estat = {}
+    nifs = {}
+    for c in colunas:
+        v = p[c]
+        if _tipo(c) == "numero":
+            np.save(destino / f"{c}.npy", v.to_numpy())
+            if v.notna().any():
+                estat[c] = [float(v.min()), float(v.max())]
+        elif _tipo(c) == "data":
+            np.save(destino / f"{c}.npy", v.to_numpy().astype("datetime64[D]"))
+            if v.notna().any():
+                estat[c] = [str(v.min().date()), str(v.max().date())]
+        else:
+            codigos, valores = _gravar_texto(destino, c, v)
+            if c.startswith("nipc_"):
+                nifs[c] = (codigos, valores)
+                mm = _min_max_nifs(codigos, valores)
+                if mm:
+                    estat[c] = mm
+            elif valores:
+                estat[c] = [valores[0], valores[-1]]
+
+    blocos = []
+    for ini in range(0, len(p), BLOCO):
+        fim = min(ini + BLOCO, len(p))
+        b = {"ini": ini, "fim": fim, "estat": {}}
+        for c, (codigos, valores) in nifs.items():
+            mm = _min_max_nifs(codigos[ini:fim], valores)
+            if mm:
+                b["estat"][c] = mm
+        blocos.append(b)
+
+    nomes = sorted(p["nome_adjudicante"].dropna().astype(str).unique().tolist()) \
+        if "nome_adjudicante" in p else []
+    return {
+        "dir": _nome_dir(a), "ano": int(a), "nomes": nomes,
+        "n": len(p), "estat": estat, "blocos": blocos,
+    }
+
+
+def _gravar_manifesto(raiz, colunas, particoes, origem):
+    manifesto = {
+        "versao": VERSAO,
+        "criado_em": datetime.now().isoformat(timespec="seconds"),
+        "origem": origem,
+        "colunas": {c: _tipo(c) for c in colunas},
+        "particoes": particoes,
+    }
+    (raiz / "manifesto.json").write_text(
+        json.dumps(manifesto, ensure_ascii=False), encoding="utf-8")
+    return manifesto
+
+
+def gravar(df, origem=None, raiz=RAIZ):
+    """Reescreve o armazém a partir de um DataFrame normalizado."""
+    if raiz.exists():
+        shutil.rmtree(raiz)
+    raiz.mkdir(parents=True)
+
+    t = _tipar(df)
+    colunas = [c for c in t.columns if c != "_ano"]
+    particoes = [_gravar_particao(raiz, a, p, colunas) for a, p in t.groupby("_ano", sort=True)]
+    return _gravar_manifesto(raiz, colunas, particoes, origem)
+
+
+class Gravador:
+    """Reescreve o armazém lote a lote, à medida que os lotes chegam.
+
+    Cada lote é tipado e dividido por ano à chegada, e os pedaços vão
+    logo para disco (`_lotes/ano=…/`); `fechar` junta os pedaços de cada
+    ano e grava a partição, uma de cada vez. O resultado é o mesmo de
+    `gravar` com os lotes todos juntos. Até `fechar` não há manifesto,
+    por isso um armazém a meio nunca é lido.
+    """
+
+    def __init__(self, raiz=RAIZ):
+        if raiz.exists():
+            shutil.rmtree(raiz)
+        self.raiz, self.pedacos = raiz, raiz / "_lotes"
+        self.pedacos.mkdir(parents=True)
+        self.colunas, self.anos, self.n = None, set(), 0
+
+    def juntar(self, lote):
+        t = _tipar(lote)
+        if self.colunas is None:
+            self.colunas = [c for c in t.columns if c != "_ano"]
+        for a, p in t.groupby("_ano", sort=False):
+            destino = self.pedacos / _nome_dir(a)
+            destino.mkdir(exist_ok=True)
+            p.to_pickle(destino / f"{self.n:06d}.pkl")
+            self.anos.add(int(a))
+        self.n += 1
+
+    def fechar(self, origem=None):
+        """Grava as partições e o manifesto; devolve o manifesto."""
+        particoes = []
+        for a in sorted(self.anos):
+            pedacos = self.pedacos / _nome_dir(a)
+            p = pd.concat([pd.read_pickle(f) for f in sorted(pedacos.iterdir())], ignore_index=True)
+            particoes.append(_gravar_particao(self.raiz, a, p, self.colunas))
+            shutil.rmtree(pedacos)
+        self.pedacos.rmdir()
+        return _gravar_manifesto(self.raiz, self.colunas or [], particoes, origem)
+
+    def descartar(self):
+        shutil.rmtree(self.raiz, ignore_errors=True)
+
+
+# ════════════════════════════════════════
+# LEITURA
+# ════════════════════════════════════════
+
+def manifesto(raiz=RAIZ):
+    """Manifesto do armazém; None se não existir ou for de outro formato."""
+    caminho = raiz / "manifesto.json"
+    if not caminho.exists():
+        return None
+    m = json.loads(caminho.read_text(encoding="utf-8"))
+    return m if m.get("versao") == VERSAO else None
+
+
+def _dentro(estat, col, nif):
+    mm = estat.get(col)
+    return mm is not None and mm[0] <= nif <= mm[1]
+
+
+def _pode_conter(p, ano, adjudicante, nif):
+    """Poda pela chave da partição e pelas estatísticas min/max."""
+    if ano is not None and p["ano"] != ano:
+        return False
+    if adjudicante is not None and not any(adjudicante in n.lower() for n in p["nomes"]):
+        return False
+    if nif is not None and not (_dentro(p["estat"], "nipc_adjudicante", nif)
+                                or _dentro(p["estat"], "nipc_adjudicatario", nif)):
+        return False
+    return True
+
+
+def _linhas_candidatas(p, nif, blocos=None):
+    """Posições das linhas nos `blocos` (todos) cujo min/max pode conter o NIF (None = todas)."""
+    todos = p["blocos"] if blocos is None else blocos
+    if nif is not None:
+        todos = [b for b in todos
+                 if _dentro(b["estat"], "nipc_adjudicante", nif)
+                 or _dentro(b["estat"], "nipc_adjudicatario", nif)]
+    if blocos is None and len(todos) == len(p["blocos"]):
+        return None
+    if not todos:
+        return np.empty(0, "int64")
+    return np.concatenate([np.arange(b["ini"], b["fim"]) for b in todos])
+
+
+class _Dicionario:
+    """Dicionário de uma coluna de texto, em mapeamento de memória; descodifica a pedido."""
+
+    def __init__(self, destino, c):
+        self.texto = np.load(destino / f"{c}.texto.npy", mmap_mode="r")
+        self.inicio = np.load(destino / f"{c}.inicio.npy", mmap_mode="r")
+        self.n = len(self.inicio) - 1
+        self._todos = None
+
+    def todos(self):
+        """Todos os valores, com None no fim para o código -1."""
+        if self._todos is None:
+            valores = self.texto.tobytes().decode("utf-8").split(FIM) if self.n else []
+            self._todos = np.array(valores + [None], dtype=object)
+        return self._todos
+
+    def valores(self, codigos):
+        """Os valores dos `codigos` (-1 → None); só descodifica os que aparecem."""
+        if self._todos is not None or len(codigos) > self.n:
+            return self.todos()[codigos]
+        usados = np.flatnonzero(np.bincount(codigos + 1, minlength=self.n + 1)[1:])
+        if len(usados) > self.n // 4:
+            return self.todos()[codigos]
+        valores = np.full(self.n + 1, None, dtype=object)
+        for i, a, b in zip(usados, self.inicio[usados], self.inicio[usados + 1] - 1):
+            valores[i] = self.texto[a:b].tobytes().decode("utf-8")
+        return valores[codigos]
+
+
+def _codigos_que(valores, predicado):
+    """Códigos do dicionário cujo valor satisfaz o predicado."""
+    return np.array([i for i, v in enumerate(valores[:-1]) if predicado(v)], dtype="int32")
+
+
+def _ler_particao(destino, colunas, p, adjudicante, nif, blocos=None, dicionarios=None):
+    """Linhas da partição (só dos `blocos` dados, se vierem) que passam os filtros.
+
+    `dicionarios` guarda os dicionários já abertos, para vários blocos da
+    mesma partição não os voltarem a ler.
+    """
+    linhas = _linhas_candidatas(p, nif, blocos)
+    if linhas is not None and not len(linhas):
+        return None
+    dicionarios = {} if dicionarios is None else dicionarios
+    codigos_lidos = {}
+
+    def texto(c):
+        if c not in dicionarios:
+            dicionarios[c] = _Dicionario(destino, c)
+        if c not in codigos_lidos:
+            codigos = np.load(destino / f"{c}.npy", mmap_mode="r")
+            codigos_lidos[c] = np.asarray(codigos if linhas is None else codigos[linhas])
+        return codigos_lidos[c], dicionarios[c]
+
+    mascara = None
+    if adjudicante is not None and "nome_adjudicante" in colunas:
+        codigos, d = texto("nome_adjudicante")
+        mascara = np.isin(codigos, _codigos_que(d.todos(), lambda v: adjudicante in v.lower()))
+    if nif is not None:
+        m = None
+        for c in ["nipc_adjudicante", "nipc_adjudicatario"]:
+            if c in colunas:
+                codigos, d = texto(c)
+                mc = np.isin(codigos, _codigos_que(d.todos(), lambda v: nif in v.split(SEP)))
+                m = mc if m is None else m | mc
+        if m is not None:
+            mascara = m if mascara is None else mascara & m
+
+    sel = linhas
+    if mascara is not None:
+        sel = np.flatnonzero(mascara) if linhas is None else linhas[mascara]
+        if not len(sel):
+            return None
+
+    dados = {}
+    for c, tipo in colunas.items():
+        if tipo == "texto":
+            codigos, d = texto(c)
+            if mascara is not None:
+                codigos = codigos[mascara]
+            dados[c] = d.valores(codigos)
+        else:
+            v = np.load(destino / f"{c}.npy", mmap_mode="r")
+            dados[c] = np.asarray(v if sel is None else v[sel])
+    return pd.DataFrame(dados)
+
+
+def _particoes(m, ano, adjudicante, nif, raiz):
+    """Partições que passam os filtros, já lidas (None quando nenhuma linha passa)."""
+    adjudicante = adjudicante.lower() if adjudicante else None
+    nif = str(nif) if nif else None
+    for p in m["particoes"]:
+        if _pode_conter(p, ano, adjudicante, nif):
+            yield _ler_particao(raiz / p["dir"], m["colunas"], p, adjudicante, nif)
+
+
+def ler(ano=None, adjudicante=None, nif=None, raiz=RAIZ):
+    """Lê só as partições (e linhas) que correspondem aos filtros.
+
+    `adjudicante` é procurado (sem distinção de maiúsculas) no nome da
+    entidade adjudicante; `nif` pode ser do adjudicante ou do adjudicatário.
+    Devolve (DataFrame ou None, nº de partições lidas).
+    """
+    m = manifesto(raiz)
+    if m is None:
+        return None, 0
+
+    partes, lidas = [], 0
+    for t in _particoes(m, ano, adjudicante, nif, raiz):
+        lidas += 1
+        if t is not None:
+            partes.append(t)
+    if not partes:
+        return pd.DataFrame(columns=list(m["colunas"])), lidas
+    return pd.concat(partes, ignore_index=True), lidas
+
+
+def lotes(ano=None, adjudicante=None, nif=None, linhas=200000, raiz=RAIZ):
+    """Como `ler`, mas aos bocados de ~`linhas` registos.
+
+    Partições pequenas seguidas juntam-se; as grandes lêem-se aos grupos
+    de blocos (BLOCO linhas cada), por isso nunca há mais do que cerca de
+    `linhas` registos em memória (no mínimo um bloco). Para análises que
+    não precisam de ter o conjunto inteiro em memória.
+    """
+    m = manifesto(raiz)
+    if m is None:
+        return
+    adjudicante = adjudicante.lower() if adjudicante else None
+    nif = str(nif) if nif else None
+    passo = max(1, linhas // BLOCO)
+    juntas, n = [], 0
+    for p in m["particoes"]:
+        if not _pode_conter(p, ano, adjudicante, nif):
+            continue
+        dicionarios = {}
+        for i in range(0, len(p["blocos"]), passo):
+            t = _ler_particao(raiz / p["dir"], m["colunas"], p, adjudicante, nif,
+                              p["blocos"][i:i + passo], dicionarios)
+            if t is None:
+                continue
+            juntas.append(t)
+            n += len(t)
+            if n >= linhas:
+                yield pd.concat(juntas, ignore_index=True)
+                juntas, n = [], 0
+    if juntas:
+        yield pd.concat(juntas, ignore_index=True)
@@ -0,0 +1,354 @@
+"""
+Carregamento em massa na base de dados da aplicação Rails (SQLite)
+===================================================================
+
+Escreve os contratos normalizados directamente no esquema de
+db/schema.rb, com as mesmas regras do `ImportService`:
+
+  entities           única por (tax_identifier, country_code); is_public_body
+                     e is_company só passam de falso a verdadeiro
+  contracts          única por (external_id, country_code); campos já
+                     preenchidos não são substituídos (só se completam)
+  contract_winners   única por (contract_id, entity_id), com price_share
+
+Em vez de um INSERT por registo: `executemany` em lotes, tudo numa só
+transacção, com WAL e pragmas de carga em massa. Por omissão
+os lotes vão para tabelas temporárias sem índices e passam às tabelas
+reais com um `INSERT ... SELECT ... ON CONFLICT` por tabela; com
+`staging=False` o upsert faz-se directamente em cada lote.
+
+O `external_id` é o do SnsClient: os primeiros 20 caracteres do SHA-256
+de "nifs_adjudicantes|nifs_adjudicatarias|data|preço|objeto[:60]",
+calculado sobre o texto original, antes da conversão de tipos (ver
+`id_externo`). Quando a fonte tem `idcontrato` (dados.gov.pt) usa-se esse.
+"""
+
+import hashlib
+import sqlite3
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import partes
+
+PAIS = "PT"
+LOTE = 50000
+PRECO_MAXIMO = 1e12           # MAX_PLAUSIBLE_PRICE do ImportService
+
+BD = Path(__file__).resolve().parent.parent / "storage" / "development.sqlite3"
+
+PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = OFF",        # só durante a carga; a ligação é nossa
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",     # 256 MB
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA busy_timeout = 30000",
+]
+
+# O mesmo UPDATE que Entities::UpdateStatsService corre após cada importação
+ESTATISTICAS = """
+WITH winner_counts AS (
+  SELECT contract_id, COUNT(*) AS cnt FROM contract_winners GROUP BY contract_id
+),
+entity_sums AS (
+  SELECT c.contracting_entity_id AS entity_id, COUNT(*) AS contract_cnt,
+         COALESCE(SUM(CASE WHEN c.total_effective_price > 0 THEN c.total_effective_price
+                           WHEN wc.cnt IS NOT NULL THEN c.base_price / wc.cnt
+                           ELSE 0 END), 0) AS total_val
+  FROM contracts c LEFT JOIN winner_counts wc ON wc.contract_id = c.id
+  GROUP BY c.contracting_entity_id
+)
+UPDATE entities SET
+  contract_count = COALESCE((SELECT contract_cnt FROM entity_sums WHERE entity_sums.entity_id = entities.id), 0),
+  total_contracted_value = COALESCE((SELECT total_val FROM entity_sums WHERE entity_sums.entity_id = entities.id), 0)
+"""
+
+
+# ════════════════════════════════════════
+# IDENTIFICADOR EXTERNO
+# ════════════════════════════════════════
+
+CAMPOS_ID = ["nipc_adjudicante", "nipc_adjudicatario", "data_celebracao", "preco", "objeto"]
+
+def _texto(df, c):
+    if c not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    s = df[c]
+    # Inteiros lidos como float (p.ex. NIFs do Excel com vazios) hasheiam
+    # como no texto original: "509000101", não "509000101.0"
+    if pd.api.types.is_float_dtype(s) and (s.dropna() % 1 == 0).all():
+        s = s.astype("Int64")
+    return s.astype("string").fillna("").astype(object)
+
+
+def _identificador(df, campos):
+    """SHA-256 (20 caracteres) de "campo|campo|…", com o objecto cortado a 60."""
+    textos = [_texto(df, c).str.slice(0, 60) if c == "objeto" else _texto(df, c) for c in campos]
+    chave = textos[0].str.cat(textos[1:], sep="|")
+    # Linhas repetidas no export: cada chave diferente é hasheada uma vez
+    codigos, unicas = pd.factorize(chave)
+    hashes = np.array([hashlib.sha256(k.encode()).hexdigest()[:20] for k in unicas], dtype=object)
+    ids = pd.Series(hashes[codigos], index=df.index, dtype=object)
+    if "id_contrato" in df.columns:
+        proprio = df["id_contrato"].astype("string").str.strip()
+        ids = proprio.where(proprio.notna() & proprio.ne(""), ids).astype(object)
+    return ids
+
+
+def id_externo(df):
+    """external_id de cada contrato, como o SnsClient (ou o idcontrato da fonte)."""
+    return _identificador(df, CAMPOS_ID)
+
+
+def id_estavel(df):
+    """Como `id_externo`, mas sem o preço: o mesmo contrato entre descarregamentos.
+
+    Um preço corrigido muda o external_id; com esta chave o contrato
+    aparece como modificado, e não como um removido e outro adicionado.
+    """
+    return _identificador(df, [c for c in CAMPOS_ID if c != "preco"])
+
+
+# ════════════════════════════════════════
+# TABELAS A ESCREVER
+# ════════════════════════════════════════
+
+def _limpo(s):
+    s = s.astype("string").str.strip()
+    return s.where(s.ne(""))
+
+
+def _nif(s):
+    """NIF limpo e como inteiro em texto ("509000101.0" → "509000101")."""
+    return _limpo(s).str.replace(r"^(\d+)\.0+$", r"\1", regex=True)
+
+
+def _preco(df, c):
+    if c not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    v = pd.to_numeric(df[c], errors="coerce").round(2)
+    return v.where(v.abs() <= PRECO_MAXIMO)
+
+
+def preparar(df):
+    """DataFrames (entidades, contratos, vencedores) prontos a inserir, sem ids da BD.
+
+    Como o ImportService: só a primeira entidade adjudicante de cada
+    contrato; contratos sem objecto ou sem adjudicante ficam de fora;
+    entidades precisam de NIF e nome.
+    """
+    if "id_externo" not in df.columns:
+        df = df.assign(id_externo=id_externo(df))
+
+    a = partes.arestas(df, "adjudicante").drop_duplicates("contrato")
+    w = partes.arestas(df, "adjudicatario")
+    for e in (a, w):
+        e["nif"] = _nif(e["nif"])
+        e["nome"] = _limpo(e["nome"])
+    a = a[a["nif"].notna() & a["nome"].notna()]
+    w = w[w["nif"].notna() & w["nome"].notna()]
+
+    # Entidades: primeiro nome visto; as marcas acumulam-se (OR)
+    entidades = pd.concat([
+        pd.DataFrame({"nif": a["nif"].to_numpy(), "nome": a["nome"].to_numpy(),
+                      "publica": 1, "empresa": 0}),
+        pd.DataFrame({"nif": w["nif"].to_numpy(), "nome": w["nome"].to_numpy(),
+                      "publica": 0, "empresa": 1}),
+    ], ignore_index=True)
+    entidades = entidades.groupby("nif", sort=False).agg(
+        nome=("nome", "first"), publica=("publica", "max"), empresa=("empresa", "max")).reset_index()
+
+    objeto = _limpo(_texto(df, "objeto"))
+    adjudicante = pd.Series(pd.NA, index=range(len(df)), dtype=object)
+    adjudicante.iloc[a["contrato"].to_numpy()] = a["nif"].to_numpy()
+    data = (pd.to_datetime(df["data_celebracao"], errors="coerce").dt.strftime("%Y-%m-%d")
+            if "data_celebracao" in df.columns else pd.Series(pd.NA, index=df.index))
+    contratos = pd.DataFrame({
+        "external_id": df["id_externo"].to_numpy(),
+        "object": objeto.to_numpy(),
+        "contract_type": _limpo(_texto(df, "tipo_contrato")).to_numpy(),
+        "procedure_type": _limpo(_texto(df, "tipo_procedimento")).to_numpy(),
+        "celebration_date": data.to_numpy(),
+        "base_price": _preco(df, "preco").to_numpy(),
+        "total_effective_price": _preco(df, "preco_efetivo").to_numpy(),
+        "location": _limpo(_texto(df, "local_execucao")).to_numpy(),
+        "nif_adjudicante": adjudicante.to_numpy(),
+    })
+    valido = contratos["object"].notna() & contratos["nif_adjudicante"].notna()
+    contratos = contratos[valido]
+    # Linhas repetidas no export: fica a primeira, como o índice único faria
+    contratos = contratos.drop_duplicates("external_id")
+
+    w = w[valido.to_numpy()[w["contrato"].to_numpy()]]
+    preco = _preco(df, "preco").to_numpy()
+    vencedores = pd.DataFrame({
+        "external_id": df["id_externo"].to_numpy()[w["contrato"].to_numpy()],
+        "nif": w["nif"].to_numpy(),
+        "price_share": np.round(preco[w["contrato"].to_numpy()] / w["n_partes"].to_numpy(), 2),
+    }).drop_duplicates(["external_id", "nif"])
+    return entidades, contratos, vencedores
+
+
+# ════════════════════════════════════════
+# ESCRITA
+# ════════════════════════════════════════
+
+def _linhas(t):
+    """Tuplos com None no lugar de NaN/NA, gerados sem materializar a tabela."""
+    t = t.astype(object).where(t.notna(), None)
+    return t.itertuples(index=False, name=None)
+
+
+def _em_lotes(cur, sql, linhas, lote=LOTE):
+    n = 0
+    while True:
+        bloco = list(islice(linhas, lote))
+        if not bloco:
+            return n
+        cur.executemany(sql, bloco)
+        n += len(bloco)
+
+
+def _ids(cur, sql):
+    """Mapa texto → id a partir de uma consulta de duas colunas."""
+    pares = cur.execute(sql, (PAIS,)).fetchall()
+    return pd.Series([i for _, i in pares], index=[k for k, _ in pares], dtype="int64")
+
+
+UPSERT_ENTIDADE = """
+INSERT INTO entities (tax_identifier, name, is_public_body, is_company, country_code,
+                      created_at, updated_at)
+{origem}
+ON CONFLICT (tax_identifier, country_code) DO UPDATE SET
+  name = COALESCE(NULLIF(entities.name, ''), excluded.name),
+  is_public_body = entities.is_public_body OR excluded.is_public_body,
+  is_company = entities.is_company OR excluded.is_company,
+  updated_at = excluded.updated_at
+"""
+
+CAMPOS = ["object", "contract_type", "procedure_type", "celebration_date",
+          "base_price", "total_effective_price", "location"]
+
+UPSERT_CONTRATO = """
+INSERT INTO contracts (external_id, {campos}, contracting_entity_id, data_source_id,
+                       country_code, created_at, updated_at)
+{origem}
+ON CONFLICT (external_id, country_code) DO UPDATE SET
+  {completar},
+  contracting_entity_id = excluded.contracting_entity_id,
+  data_source_id = COALESCE(contracts.data_source_id, excluded.data_source_id),
+  updated_at = excluded.updated_at
+""".replace("{campos}", ", ".join(CAMPOS)).replace("{completar}", ",\n  ".join(
+    f"{c} = COALESCE(NULLIF(contracts.{c}, ''), excluded.{c})" for c in CAMPOS))
+
+UPSERT_VENCEDOR = """
+INSERT INTO contract_winners (contract_id, entity_id, price_share, created_at, updated_at)
+{origem}
+ON CONFLICT (contract_id, entity_id) DO UPDATE SET
+  price_share = excluded.price_share,
+  updated_at = excluded.updated_at
+"""
+
+
+def _fonte(cur):
+    """id da DataSource do SnsClient, se a aplicação já a tiver criado."""
+    linha = cur.execute("SELECT id FROM data_sources WHERE adapter_class LIKE '%SnsClient' "
+                        "AND country_code = ? ORDER BY id LIMIT 1", (PAIS,)).fetchone()
+    return linha[0] if linha else None
+
+
+def _directo(cur, entidades, contratos, vencedores, agora, fonte):
+    """Upsert lote a lote nas tabelas reais; ids resolvidos em pandas."""
+    marca = (PAIS, agora, agora)
+    n_e = _em_lotes(cur, UPSERT_ENTIDADE.format(origem="VALUES (?, ?, ?, ?, ?, ?, ?)"),
+                    (l + marca for l in _linhas(entidades[["nif", "nome", "publica", "empresa"]])))
+    ent = _ids(cur, "SELECT tax_identifier, id FROM entities WHERE country_code = ?")
+
+    c = contratos.assign(adj=ent.reindex(contratos["nif_adjudicante"]).to_numpy(), fonte=fonte)
+    sql = UPSERT_CONTRATO.format(origem="VALUES (" + ", ".join("?" * (len(CAMPOS) + 6)) + ")")
+    n_c = _em_lotes(cur, sql, (l + marca for l in _linhas(c[["external_id"] + CAMPOS + ["adj", "fonte"]])))
+    con = _ids(cur, "SELECT external_id, id FROM contracts WHERE country_code = ?")
+
+    v = pd.DataFrame({"c": con.reindex(vencedores["external_id"]).to_numpy(),
+                      "e": ent.reindex(vencedores["nif"]).to_numpy(),
+                      "p": vencedores["price_share"].to_numpy()}).dropna(subset=["c", "e"])
+    v[["c", "e"]] = v[["c", "e"]].astype("int64")
+    n_v = _em_lotes(cur, UPSERT_VENCEDOR.format(origem="VALUES (?, ?, ?, ?, ?)"),
+                    (l + (agora, agora) for l in _linhas(v)))
+    return n_e, n_c, n_v
+
+
+TEMPORARIAS = [
+    "CREATE TEMP TABLE _entidades (nif TEXT, nome TEXT, publica INTEGER, empresa INTEGER)",
+    "CREATE TEMP TABLE _contratos (external_id TEXT, object TEXT, contract_type TEXT, "
+    "procedure_type TEXT, celebration_date TEXT, base_price REAL, total_effective_price REAL, "
+    "location TEXT, nif_adjudicante TEXT)",
+    "CREATE TEMP TABLE _vencedores (external_id TEXT, nif TEXT, price_share REAL)",
+]
+
+
+def _por_staging(cur, entidades, contratos, vencedores, agora, fonte):
+    """Lotes para tabelas temporárias; um INSERT ... SELECT ... ON CONFLICT por tabela."""
+    # execute() um a um: executescript() faria COMMIT da transacção aberta
+    for sql in TEMPORARIAS:
+        cur.execute(sql)
+    n_e = _em_lotes(cur, "INSERT INTO _entidades VALUES (?, ?, ?, ?)", _linhas(entidades))
+    n_c = _em_lotes(cur, "INSERT INTO _contratos VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", _linhas(contratos))
+    n_v = _em_lotes(cur, "INSERT INTO _vencedores VALUES (?, ?, ?)", _linhas(vencedores))
+
+    # "WHERE true" desfaz a ambiguidade entre ON CONFLICT e um JOIN ... ON
+    cur.execute(UPSERT_ENTIDADE.format(origem=
+        "SELECT nif, nome, publica, empresa, :pais, :agora, :agora FROM _entidades WHERE true"),
+        {"pais": PAIS, "agora": agora})
+    cur.execute(UPSERT_CONTRATO.format(origem=
+        "SELECT s.external_id, " + ", ".join(f"s.{c}" for c in CAMPOS) + ", e.id, :fonte, "
+        ":pais, :agora, :agora FROM _contratos s JOIN entities e "
+        "ON e.tax_identifier = s.nif_adjudicante AND e.country_code = :pais WHERE true"),
+        {"pais": PAIS, "agora": agora, "fonte": fonte})
+    cur.execute(UPSERT_VENCEDOR.format(origem=
+        "SELECT c.id, e.id, s.price_share, :agora, :agora FROM _vencedores s "
+        "JOIN contracts c ON c.external_id = s.external_id AND c.country_code = :pais "
+        "JOIN entities e ON e.tax_identifier = s.nif AND e.country_code = :pais WHERE true"),
+        {"pais": PAIS, "agora": agora})
+    for t in ["_entidades", "_contratos", "_vencedores"]:
+        cur.execute(f"DROP TABLE temp.{t}")
+    return n_e, n_c, n_v
+
+
+def exportar(df, caminho=BD, staging=True):
+    """Upsert de entidades, contratos e vencedores; devolve as contagens.
+
+    A base de dados tem de existir com o esquema da aplicação
+    (`bin/rails db:prepare`). No fim actualiza contract_count e
+    total_contracted_value das entidades, como o Entities::UpdateStatsService.
+    """
+    caminho = Path(caminho)
+    if not caminho.exists():
+        raise FileNotFoundError(f"{caminho} não existe (corre primeiro: bin/rails db:prepare)")
+    entidades, contratos, vencedores = preparar(df)
+    # Formato dos datetime do Active Record em SQLite
+    agora = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+    con = sqlite3.connect(caminho, isolation_level=None)
+    try:
+        for p in PRAGMAS:
+            con.execute(p)
+        cur = con.cursor()
+        cur.execute("BEGIN IMMEDIATE")
+        try:
+            fonte = _fonte(cur)
+            escrever = _por_staging if staging else _directo
+            n_e, n_c, n_v = escrever(cur, entidades, contratos, vencedores, agora, fonte)
+            cur.execute(ESTATISTICAS)
+            cur.execute("COMMIT")
+        except BaseException:
+            cur.execute("ROLLBACK")
+            raise
+        con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        con.close()
+    return {"entidades": n_e, "contratos": n_c, "vencedores": n_v}
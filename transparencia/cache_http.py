@@ -0,0 +1,197 @@
+"""
+Cache HTTP com pedidos condicionais
+====================================
+
+Guarda, por URL, o ETag e o Last-Modified devolvidos pelo portal e envia
+`If-None-Match` / `If-Modified-Since` nos pedidos seguintes. Se os dados
+não mudaram, o servidor responde 304 e reutiliza-se a cópia local — um só
+pedido em vez de centenas de MB.
+
+Os conteúdos ficam num armazém endereçado pelo conteúdo (SHA-256):
+
+  dados_base/cache/
+    indice.json             URL → {etag, last_modified, sha256, ...}
+    objetos/ab/abcdef...    corpo da resposta (já descomprimido)
+
+O `requests` já pede a transferência comprimida (`Accept-Encoding: gzip,
+deflate`) e descomprime em fluxo, por isso o que fica guardado é o
+CSV/JSON original.
+"""
+
+import json
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+from datetime import datetime
+
+import requests
+
+RAIZ = Path("dados_base") / "cache"
+
+
+# ════════════════════════════════════════
+# ÍNDICE
+# ════════════════════════════════════════
+
+def chave(url, params=None):
+    """URL canónico (com parâmetros ordenados) usado como chave do índice."""
+    pedido = requests.Request("GET", url, params=sorted((params or {}).items()))
+    return pedido.prepare().url
+
+
+def ler_indice(raiz=RAIZ):
+    caminho = raiz / "indice.json"
+    if not caminho.exists():
+        return {}
+    try:
+        return json.loads(caminho.read_text(encoding="utf-8"))
+    except ValueError:
+        return {}
+
+
+def _gravar_indice(indice, raiz):
+    # Escrita atómica: um índice meio escrito invalidaria toda a cache
+    fd, tmp = tempfile.mkstemp(dir=raiz, suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(indice, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, raiz / "indice.json")
+
+
+def caminho_objeto(sha, raiz=RAIZ):
+    return raiz / "objetos" / sha[:2] / sha
+
+
+def _descartar(sha, indice, raiz):
+    """Apaga um objeto substituído, se nenhum outro URL do índice o usar.
+
+    Só depois de o índice novo estar gravado; os instantâneos
+    (instantaneos.py) guardam a sua própria cópia comprimida.
+    """
+    if any(e.get("sha256") == sha for e in indice.values()):
+        return
+    caminho = caminho_objeto(sha, raiz)
+    if caminho.exists():
+        os.remove(caminho)
+
+
+def entrada(url, params=None, raiz=RAIZ):
+    """Entrada do índice para o URL, só se o objeto ainda existir em disco."""
+    e = ler_indice(raiz).get(chave(url, params))
+    if e and caminho_objeto(e["sha256"], raiz).exists():
+        return e
+    return None
+
+
+# ════════════════════════════════════════
+# GRAVAÇÃO
+# ════════════════════════════════════════
+
+class Gravador:
+    """Escreve um corpo em fluxo para o armazém, calculando o SHA-256 pelo caminho.
+
+    Usado por `obter` e também pela ingestão em fluxo, que lê os mesmos
+    pedaços enquanto vão chegando.
+    """
+
+    def __init__(self, url, params, resposta, raiz=RAIZ):
+        self.url, self.params, self.resposta, self.raiz = url, params, resposta, raiz
+        (raiz / "objetos").mkdir(parents=True, exist_ok=True)
+        fd, self._tmp = tempfile.mkstemp(dir=raiz / "objetos", suffix=".parcial")
+        self._f = os.fdopen(fd, "wb")
+        self._h = hashlib.sha256()
+        self.tamanho = 0
+
+    def escrever(self, pedaço):
+        self._f.write(pedaço)
+        self._h.update(pedaço)
+        self.tamanho += len(pedaço)
+
+    def concluir(self):
+        """Move o ficheiro para o seu endereço e actualiza o índice."""
+        self._f.close()
+        sha = self._h.hexdigest()
+        destino = caminho_objeto(sha, self.raiz)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        if destino.exists():
+            os.remove(self._tmp)
+        else:
+            os.replace(self._tmp, destino)
+
+        indice = ler_indice(self.raiz)
+        anterior = indice.get(chave(self.url, self.params))
+        indice[chave(self.url, self.params)] = {
+            "etag": self.resposta.headers.get("ETag"),
+            "last_modified": self.resposta.headers.get("Last-Modified"),
+            "sha256": sha,
+            "tamanho": self.tamanho,
+            "obtido_em": datetime.now().isoformat(timespec="seconds"),
+        }
+        _gravar_indice(indice, self.raiz)
+        if anterior and anterior["sha256"] != sha:
+            _descartar(anterior["sha256"], indice, self.raiz)
+        return destino
+
+    def abortar(self):
+        self._f.close()
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+
+# ════════════════════════════════════════
+# PEDIDOS
+# ════════════════════════════════════════
+
+def pedido_condicional(url, params=None, timeout=60, raiz=RAIZ):
+    """GET em fluxo com os validadores da última resposta guardada.
+
+    Devolve (resposta, entrada); com `resposta.status_code == 304` o
+    conteúdo está em `caminho_objeto(entrada["sha256"])`.
+    """
+    cab = {}
+    e = entrada(url, params, raiz)
+    if e:
+        if e.get("etag"):
+            cab["If-None-Match"] = e["etag"]
+        if e.get("last_modified"):
+            cab["If-Modified-Since"] = e["last_modified"]
+    r = requests.get(url, params=params, headers=cab, timeout=timeout, stream=True)
+    if r.status_code != 304:
+        r.raise_for_status()
+    return r, e
+
+
+def obter(url, params=None, timeout=60, raiz=RAIZ, progresso=False):
+    """Devolve (caminho no armazém, alterado).
+
+    `alterado` é False quando o servidor respondeu 304 e nada foi transferido.
+    """
+    r, e = pedido_condicional(url, params, timeout, raiz)
+    if r.status_code == 304:
+        r.close()
+        if progresso:
+            print(f"    304 — sem alterações desde {e['obtido_em']}")
+        return caminho_objeto(e["sha256"], raiz), False
+
+    total = int(r.headers.get("content-length", 0))
+    g = Gravador(url, params, r, raiz)
+    try:
+        for pedaço in r.iter_content(65536):
+            g.escrever(pedaço)
+            if progresso and total:
+                # content-length conta bytes comprimidos: medir o que veio da rede
+                print(f"\r    {r.raw.tell()/1e6:.1f}/{total/1e6:.1f} MB", end="", flush=True)
+        if progresso and total:
+            print()
+    except BaseException:
+        g.abortar()
+        raise
+    finally:
+        r.close()
+    return g.concluir(), True
+
+
+def obter_json(url, params=None, timeout=30, raiz=RAIZ):
+    """Como `obter`, mas devolve o JSON já interpretado."""
+    caminho, _ = obter(url, params, timeout, raiz)
+    return json.loads(caminho.read_bytes())
@@ -0,0 +1,307 @@
+"""
+Cruzamento com registos externos
+=================================
+
+Cruza as partes dos contratos com listas locais — Registo Comercial
+(sócios/gerentes), autarcas e deputados, doações a partidos (ECFP/CNE) —
+colocadas em dados_base/registos/ como CSV (uma fonte por ficheiro):
+
+  registo_comercial.csv    nif;nome;cargo...
+  autarcas.csv             nome;cargo;municipio...
+  ecfp_doacoes.csv         nif;nome;partido;valor...
+
+Duas formas de correspondência, ambas sem comparar todos os pares:
+
+  · NIF exacto: os NIFs do registo ficam num vector ordenado e cada NIF
+    das partes procura-se com `np.searchsorted` (tudo de uma vez).
+  · Nome aproximado: índice invertido de trigramas. Para cada nome
+    distinto das partes só se consideram os registos que partilham um
+    dos trigramas mais raros do nome (filtro por prefixo), e a
+    semelhança de Dice calcula-se para esses. Os nomes são consultados
+    em lote, sem ciclo por nome: as listas invertidas concatenam-se, os
+    pares candidatos saem de np.unique e só eles se verificam, por isso o
+    custo segue o número de candidatos e não nomes × registos.
+
+O resultado são correspondências ao nível do contrato.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import partes
+
+COLUNAS_NIF = ["nif", "nipc", "nif_empresa", "nif_doador", "nif_entidade"]
+COLUNAS_NOME = ["nome", "designacao", "nome_pessoa", "doador", "firma", "entidade"]
+
+# Palavras que não distinguem ninguém (formas societárias, partículas)
+PALAVRAS_VAZIAS = {"lda", "limitada", "sa", "s", "a", "unipessoal", "unip", "sociedade",
+                   "de", "da", "do", "das", "dos", "e", "ip", "epe", "crl"}
+
+
+# ════════════════════════════════════════
+# NORMALIZAÇÃO DE NOMES
+# ════════════════════════════════════════
+
+def normalizar_nome(s):
+    """Minúsculas, sem acentos, pontuação nem palavras vazias (coluna inteira)."""
+    t = (s.astype("string").str.normalize("NFKD")
+          .str.encode("ascii", "ignore").str.decode("ascii")
+          .str.lower().str.replace(r"[^a-z0-9]+", " ", regex=True))
+    palavras = t.str.split()
+    return palavras.map(lambda p: " ".join(x for x in p if x not in PALAVRAS_VAZIAS)
+                        if isinstance(p, list) else "")
+
+
+def trigramas(nome):
+    n = f"  {nome} "
+    return {n[i:i + 3] for i in range(len(n) - 2)}
+
+
+# ════════════════════════════════════════
+# ÍNDICES
+# ════════════════════════════════════════
+
+class IndiceNif:
+    """NIFs do registo ordenados; procura vectorizada com searchsorted."""
+
+    def __init__(self, codigos):
+        codigos = np.asarray(codigos, dtype="int64")
+        self.ordem = np.argsort(codigos, kind="stable")
+        self.ordenados = codigos[self.ordem]
+
+    def procurar(self, codigos):
+        """Devolve (posições na consulta, posições no registo) de cada par igual."""
+        codigos = np.asarray(codigos, dtype="int64")
+        esq = np.searchsorted(self.ordenados, codigos, side="left")
+        dir_ = np.searchsorted(self.ordenados, codigos, side="right")
+        n = dir_ - esq
+        n[codigos < 0] = 0                              # sem NIF numérico
+        consulta = np.repeat(np.arange(len(codigos)), n)
+        # Para cada consulta, as posições esq..dir-1 do vector ordenado
+        desloc = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        return consulta, self.ordem[np.repeat(esq, n) + desloc]
+
+
+class IndiceNomes:
+    """Índice invertido de trigramas sobre nomes já normalizados.
+
+    Os trigramas são códigos inteiros (três caracteres em 21 bits cada),
+    calculados para todos os nomes de uma vez; `reg_chave` tem os pares
+    (registo, trigrama) ordenados, para verificar pertenças com searchsorted.
+    """
+
+    def __init__(self, nomes):
+        linhas, cod = _trigramas_lote(nomes)
+        cods, self.codigos = pd.factorize(cod, sort=True)
+        cods = cods.astype("int64")
+        self.tamanho = np.bincount(linhas, minlength=len(nomes))
+        # Listas invertidas: registos de cada trigrama, por ordem crescente
+        ordem = np.argsort(cods, kind="stable")
+        self.freq = np.bincount(cods, minlength=len(self.codigos))
+        self.tri_ptr = np.concatenate([[0], np.cumsum(self.freq)])
+        self.tri_reg = linhas[ordem]
+        self.reg_chave = np.sort(linhas * len(self.codigos) + cods)
+
+    def procurar(self, nome, limiar=0.85):
+        """Registos com semelhança de Dice ≥ limiar: (posições, semelhanças)."""
+        _, reg, sim = self.procurar_lote([nome], limiar)
+        return reg, sim
+
+    def procurar_lote(self, nomes, limiar=0.85, volume=1 << 22):
+        """Todas as consultas de uma vez: (consulta, registo, semelhança).
+
+        Dice ≥ t obriga a partilhar pelo menos t·nq/(2−t) trigramas; basta
+        então juntar as listas invertidas dos nq − mínimo + 1 trigramas mais
+        raros de cada nome (filtro por prefixo). Os pares candidatos são os
+        únicos dessas listas e só eles se verificam contra os restantes
+        trigramas. Os nomes processam-se em blocos de cerca de `volume`
+        entradas das listas, para limitar a memória.
+        """
+        q_pos, q_cod = _trigramas_lote(nomes)
+        nq = np.bincount(q_pos, minlength=len(nomes))
+        i = np.searchsorted(self.codigos, q_cod)
+        i_ok = np.minimum(i, max(len(self.codigos) - 1, 0))
+        conhecido = (i < len(self.codigos)) & (self.codigos[i_ok] == q_cod) if len(self.codigos) \
+            else np.zeros(len(q_cod), bool)
+        q_pos, q_cod = q_pos[conhecido], i[conhecido]
+
+        minimo = np.ceil(limiar * nq / (2 - limiar)).astype("int64")
+        k = nq - minimo + 1
+        ordem = np.lexsort((self.freq[q_cod], q_pos))        # por nome, raros primeiro
+        qp, qc = q_pos[ordem], q_cod[ordem]
+        inicio = np.flatnonzero(np.r_[True, qp[1:] != qp[:-1]])
+        rank = np.arange(len(qp)) - np.repeat(inicio, np.diff(np.r_[inicio, len(qp)]))
+        raro = rank < k[qp]
+        # Trigramas restantes de cada nome, em CSR e por código crescente,
+        # para a verificação
+        resto = np.bincount(qp[~raro], minlength=len(nomes))
+        resto_ptr = np.concatenate([[0], np.cumsum(resto)])
+        resto_cod = np.sort(qp[~raro] * len(self.codigos) + qc[~raro]) % max(len(self.codigos), 1)
+        qp, qc = qp[raro], qc[raro]
+
+        # Blocos de nomes inteiros, cortados pelo volume acumulado das listas
+        vol = np.bincount(qp, weights=self.freq[qc], minlength=len(nomes))
+        bloco = ((np.cumsum(vol) - vol) // volume).astype("int64")
+        cortes = np.r_[0, np.flatnonzero(np.diff(bloco)) + 1, len(nomes)]
+        limites = np.searchsorted(qp, cortes)
+        partes_ = [self._bloco(qp[a:b], qc[a:b], nq, resto, resto_ptr, resto_cod, limiar)
+                   for a, b in zip(limites[:-1], limites[1:]) if b > a]
+        if not partes_:
+            return np.empty(0, "int64"), np.empty(0, "int64"), np.empty(0)
+        return tuple(np.concatenate(x) for x in zip(*partes_))
+
+    def _bloco(self, qp, qc, nq, resto, resto_ptr, resto_cod, limiar):
+        """Candidatos e semelhança exacta para um bloco de consultas."""
+        n_reg = len(self.tamanho)
+        # Candidatos: listas invertidas dos trigramas raros, concatenadas; os
+        # pares repetidos contam os trigramas raros em comum
+        tam = self.freq[qc]
+        reg = self.tri_reg[np.repeat(self.tri_ptr[qc], tam) + _desloc(tam)]
+        par, comum = np.unique(np.repeat(qp, tam) * n_reg + reg, return_counts=True)
+        cq, cr = par // n_reg, par % n_reg
+
+        # Limite superior do Dice: o tamanho do registo e os trigramas que
+        # ainda podem coincidir (mesma expressão que o Dice final, sem erros
+        # de arredondamento a separar os dois)
+        n, nr = nq[cq], self.tamanho[cr]
+        teto = np.minimum(np.minimum(comum + resto[cq], n), nr)
+        ok = 2 * teto / (n + nr) >= limiar
+        cq, cr, comum, n, nr = cq[ok], cr[ok], comum[ok], n[ok], nr[ok]
+
+        # Verificação: os restantes trigramas do nome, procurados nos pares
+        # (registo, trigrama) ordenados do índice. Os pares vêm por nome e
+        # registo crescentes, por isso as chaves procuradas também vêm por
+        # ordem (dentro de cada nome), o que poupa acessos à memória
+        m = resto[cq]
+        chave = (np.repeat(cr, m) * len(self.codigos)
+                 + resto_cod[np.repeat(resto_ptr[cq], m) + _desloc(m)])
+        j = np.minimum(np.searchsorted(self.reg_chave, chave), len(self.reg_chave) - 1)
+        achou = self.reg_chave[j] == chave
+        comum = comum + np.bincount(np.repeat(np.arange(len(cq)), m)[achou], minlength=len(cq))
+        dice = 2 * comum / (n + nr)
+        ok = dice >= limiar
+        return cq[ok], cr[ok], dice[ok]
+
+
+def _desloc(tam):
+    """0..t−1 para cada t de `tam`, concatenados."""
+    return np.arange(tam.sum()) - np.repeat(np.cumsum(tam) - tam, tam)
+
+
+def _trigramas_lote(nomes):
+    """(linha, código) de cada trigrama distinto de cada nome, por linha.
+
+    Os nomes juntam-se num só texto (com o mesmo enchimento de `trigramas`)
+    e lêem-se como pontos de código UTF-32; o código de um trigrama é
+    c0·2⁴² + c1·2²¹ + c2. Nomes vazios não têm trigramas.
+    """
+    nomes = [x if isinstance(x, str) else "" for x in nomes]
+    tam = np.fromiter(map(len, nomes), dtype="int64", count=len(nomes))
+    n_tri = np.where(tam > 0, tam + 1, 0)
+    texto = "".join(f"  {x} " for x in nomes)
+    c = np.frombuffer(texto.encode("utf-32-le"), dtype="<u4").astype("int64")
+    inicio = np.cumsum(tam + 3) - (tam + 3)
+    linha = np.repeat(np.arange(len(nomes)), n_tri)
+    pos = np.repeat(inicio, n_tri) + _desloc(n_tri)
+    cod = c[pos] << 42 | c[pos + 1] << 21 | c[pos + 2]
+    # Trigramas repetidos no mesmo nome contam uma vez, como no conjunto
+    ids, unicos = pd.factorize(cod)
+    v = max(len(unicos), 1)
+    chave = np.sort(linha * v + ids)
+    chave = chave[np.r_[True, chave[1:] != chave[:-1]]] if len(chave) else chave
+    return chave // v, unicos[chave % v]
+
+
+# ════════════════════════════════════════
+# REGISTOS
+# ════════════════════════════════════════
+
+def _escolher(colunas, candidatas):
+    baixas = {c.lower().strip(): c for c in colunas}
+    return next((baixas[c] for c in candidatas if c in baixas), None)
+
+
+def carregar_registo(caminho):
+    """Lê um CSV de registo: nif_cod (-1 sem NIF), nome, nome_norm, detalhe, fonte."""
+    caminho = Path(caminho)
+    with open(caminho, encoding="utf-8-sig") as f:
+        linha = f.readline()
+    sep = max([";", ",", "\t"], key=linha.count)
+    r = pd.read_csv(caminho, sep=sep, dtype=str, encoding="utf-8-sig")
+    cn, cm = _escolher(r.columns, COLUNAS_NIF), _escolher(r.columns, COLUNAS_NOME)
+    if cn is None and cm is None:
+        raise ValueError(f"{caminho.name}: sem coluna de NIF nem de nome")
+
+    outras = [c for c in r.columns if c not in (cn, cm)]
+    if outras:
+        partes_ = [(c + "=" + r[c].fillna("")) for c in outras]
+        detalhe = partes_[0].str.cat(partes_[1:], sep="; ") if len(partes_) > 1 else partes_[0]
+    else:
+        detalhe = pd.Series("", index=r.index)
+    nif = (pd.to_numeric(r[cn].str.replace(r"\D", "", regex=True), errors="coerce")
+           if cn else pd.Series(np.nan, index=r.index))
+    nome = r[cm] if cm else pd.Series("", index=r.index)
+    return pd.DataFrame({
+        "nif_cod": nif.fillna(-1).astype("int64"),
+        "nome": nome,
+        "nome_norm": normalizar_nome(nome.fillna("")),
+        "detalhe": detalhe,
+        "fonte": caminho.stem,
+    })
+
+
+def carregar_registos(pasta):
+    ficheiros = sorted(Path(pasta).glob("*.csv"))
+    if not ficheiros:
+        return None
+    return pd.concat([carregar_registo(f) for f in ficheiros], ignore_index=True)
+
+
+# ════════════════════════════════════════
+# CRUZAMENTO
+# ════════════════════════════════════════
+
+def cruzar(df, registos, papel="adjudicatario", limiar=0.85):
+    """Correspondências contrato ↔ registo, por NIF exacto e por nome aproximado.
+
+    Devolve uma linha por (contrato, parte, entrada do registo) com
+    `contrato` (posição em df), `tipo` ("nif"/"nome") e `semelhanca`.
+    """
+    e = partes.arestas(df, papel)
+    colunas = ["contrato", "nif", "nome", "registo", "tipo", "semelhanca"]
+    achados = []
+
+    # 1. NIF exacto, para todas as arestas de uma vez
+    com_nif = registos["nif_cod"].to_numpy() >= 0
+    if com_nif.any():
+        idx = IndiceNif(registos["nif_cod"].to_numpy()[com_nif])
+        i_e, i_r = idx.procurar(e["nif_cod"].to_numpy())
+        achados.append(pd.DataFrame({
+            "contrato": e["contrato"].to_numpy()[i_e], "nif": e["nif"].to_numpy()[i_e],
+            "nome": e["nome"].to_numpy()[i_e], "registo": np.flatnonzero(com_nif)[i_r],
+            "tipo": "nif", "semelhanca": 1.0}))
+
+    # 2. Nome aproximado, todos os nomes distintos num lote (não por contrato)
+    distintos = pd.Series(e["nome"].cat.categories)
+    normais = normalizar_nome(distintos)
+    indice = IndiceNomes(registos["nome_norm"].tolist())
+    q_cat, q_reg, q_sim = indice.procurar_lote(normais.tolist(), limiar)
+    if len(distintos):
+        q = pd.DataFrame({"cat": q_cat, "registo": q_reg, "semelhanca": q_sim})
+        arestas_cat = pd.DataFrame({"cat": e["nome"].cat.codes.to_numpy(),
+                                    "contrato": e["contrato"].to_numpy(),
+                                    "nif": e["nif"].to_numpy(), "nome": e["nome"].to_numpy()})
+        achados.append(arestas_cat.merge(q, on="cat").assign(tipo="nome")[colunas])
+
+    if not achados:
+        return pd.DataFrame(columns=colunas + ["fonte", "nome_registo", "detalhe"])
+    h = pd.concat(achados, ignore_index=True)
+    # A mesma entrada achada por NIF e por nome conta uma vez (fica o NIF)
+    h = h.drop_duplicates(["contrato", "nif", "registo"], keep="first")
+    reg = registos.iloc[h["registo"].to_numpy()]
+    h["fonte"] = reg["fonte"].to_numpy()
+    h["nome_registo"] = reg["nome"].to_numpy()
+    h["detalhe"] = reg["detalhe"].to_numpy()
+    return h.reset_index(drop=True)
@@ -11,6 +11,9 @@ import numpy as np
 import json
 from pathlib import Path
 
+import apresentacao
+from resultados import Resultado
+
 np.random.seed(42)
 
 # ============================================================
@@ -261,10 +264,6 @@ def gerar_entidades():
 # ============================================================
 
 def analise_fragmentacao(df, limiar=20000, min_contratos=10):
-    print("\n🔍 ANÁLISE 1: Fragmentação de contratos")
-    print("   Múltiplos ajustes diretos à mesma empresa abaixo de €20K")
-    print("-" * 60)
-    
     mask_tipo = df["tipoProcedimento"].str.contains("Direto|Directo|Simplificado", case=False, na=False)
     mask_preco = df["precoContratual"] < limiar
     sub = df[mask_tipo & mask_preco].copy()
@@ -278,69 +277,89 @@ def analise_fragmentacao(df, limiar=20000, min_contratos=10):
     ).reset_index()
     
     suspeitos = agg[agg["n_contratos"] >= min_contratos].sort_values("total", ascending=False)
-    
-    print(f"\n  ⚠️  {len(suspeitos)} PARES SUSPEITOS (≥{min_contratos} ajustes diretos <€{limiar:,})\n")
-    
-    for _, row in suspeitos.iterrows():
-        print(f"  ┌─ ALERTA ─────────────────────────────────────────────")
-        print(f"  │ Adjudicatário: {row['nomeAdjudicatario']}")
-        print(f"  │ NIPC:          {row['nifAdjudicatario']}")
-        print(f"  │ Adjudicante:   {row['nomeAdjudicante']}")
-        print(f"  │ Contratos:     {row['n_contratos']}")
-        print(f"  │ Valor total:   €{row['total']:,.2f}")
-        print(f"  │ Média:         €{row['media']:,.2f}")
-        print(f"  │ Range:         €{row['min_val']:,.2f} — €{row['max_val']:,.2f}")
-        if row['max_val'] < limiar and row['min_val'] > limiar * 0.6:
-            print(f"  │ 🚩 PADRÃO: Valores consistentemente próximos do limiar")
-        print(f"  └──────────────────────────────────────────────────────\n")
-    
-    return suspeitos
+    suspeitos = suspeitos.reset_index(drop=True)
+    suspeitos["junto_limiar"] = (suspeitos["max_val"] < limiar) & (suspeitos["min_val"] > limiar * 0.6)
+    
+    return Resultado(
+        "fragmentacao", "🔍 ANÁLISE 1: Fragmentação de contratos", suspeitos,
+        descricao="   Múltiplos ajustes diretos à mesma empresa abaixo de €20K",
+        notas=["", f"⚠️  {len(suspeitos)} PARES SUSPEITOS (≥{min_contratos} ajustes diretos <€{limiar:,})", ""],
+        modelo=[
+            "  ┌─ ALERTA ─────────────────────────────────────────────",
+            "  │ Adjudicatário: {nomeAdjudicatario}",
+            "  │ NIPC:          {nifAdjudicatario}",
+            "  │ Adjudicante:   {nomeAdjudicante}",
+            "  │ Contratos:     {n_contratos}",
+            "  │ Valor total:   €{total:,.2f}",
+            "  │ Média:         €{media:,.2f}",
+            "  │ Range:         €{min_val:,.2f} — €{max_val:,.2f}",
+            ["  │ 🚩 PADRÃO: Valores consistentemente próximos do limiar", "junto_limiar"],
+            "  └──────────────────────────────────────────────────────\n",
+        ],
+        formatos={"total": ",.2f", "media": ",.2f", "min_val": ",.2f", "max_val": ",.2f"},
+        separador="-" * 60,
+    )
+
+
+MESES_PT = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun",
+            "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
 
 
 def analise_concentracao_temporal(df):
-    print("\n🔍 ANÁLISE 2: Concentração temporal de contratos")
-    print("   Concentração anómala em meses específicos por entidade")
-    print("-" * 60)
-    
-    df = df.copy()
-    df["_data"] = pd.to_datetime(df["dataCelebracaoContrato"], errors="coerce")
-    df["_mes"] = df["_data"].dt.month
-    
-    meses_pt = ["Jan", "Fev", "Mar", "Abr", "Mai", "Jun",
-                "Jul", "Ago", "Set", "Out", "Nov", "Dez"]
+    mes = pd.to_datetime(df["dataCelebracaoContrato"], errors="coerce").dt.month
     
     # Global
-    por_mes = df.dropna(subset=["_mes"]).groupby("_mes").size()
+    por_mes = mes.dropna().astype(int).value_counts().reindex(range(1, 13), fill_value=0)
     media = por_mes.mean()
     
-    print(f"\n  Distribuição global ({len(df):,} contratos):\n")
-    for m in range(1, 13):
-        n = por_mes.get(m, 0)
-        pct = n / media * 100
-        bar = "█" * int(pct / 8)
-        flag = " ⚠️  PICO" if pct > 150 else ""
-        print(f"    {meses_pt[m-1]}: {n:>5}  ({pct:>5.0f}%) {bar}{flag}")
-    
-    # Por entidade — detetar quem concentra
-    print(f"\n  Entidades com concentração anómala (>40% num só mês):\n")
-    for ent in df["nomeAdjudicante"].unique():
-        sub = df[df["nomeAdjudicante"] == ent].dropna(subset=["_mes"])
-        if len(sub) < 20:
-            continue
-        por_mes_ent = sub.groupby("_mes").size()
-        max_mes = por_mes_ent.idxmax()
-        max_pct = por_mes_ent.max() / por_mes_ent.sum() * 100
-        if max_pct > 25:
-            print(f"  ┌─ {ent}")
-            print(f"  │ {por_mes_ent.max()} de {por_mes_ent.sum()} contratos ({max_pct:.0f}%) em {meses_pt[int(max_mes)-1]}")
-            print(f"  └──────────────────────────────────────────────────────")
+    t = pd.DataFrame({"mes": por_mes.index, "nome_mes": MESES_PT, "n": por_mes.to_numpy()})
+    t["pct"] = t["n"] / media * 100
+    t["barra"] = pd.Series("█", index=t.index).str.repeat((t["pct"] / 8).astype(int).tolist())
+    t["aviso"] = (t["pct"] > 150).map({True: " ⚠️  PICO", False: ""})
+    
+    return Resultado(
+        "temporal", "🔍 ANÁLISE 2: Concentração temporal de contratos", t,
+        descricao="   Concentração anómala em meses específicos por entidade",
+        notas=["", f"Distribuição global ({len(df):,} contratos):", ""],
+        modelo=["    {nome_mes}: {n:>5}  ({pct:>5.0f}%) {barra}{aviso}"],
+        formatos={"pct": ".0f"},
+        separador="-" * 60,
+    )
+
+
+def analise_concentracao_entidade(df, min_contratos=20, pct_min=25):
+    """Entidades que concentram uma fatia anómala dos contratos num só mês."""
+    t = pd.DataFrame({
+        "nomeAdjudicante": df["nomeAdjudicante"],
+        "mes": pd.to_datetime(df["dataCelebracaoContrato"], errors="coerce").dt.month,
+    }).dropna(subset=["mes"])
+    
+    # Uma só passagem: contagens (entidade, mês) e o mês máximo por entidade
+    cont = t.groupby(["nomeAdjudicante", "mes"]).size().rename("n_mes").reset_index()
+    tot = cont.groupby("nomeAdjudicante")["n_mes"].transform("sum")
+    cont["total"] = tot
+    topo = cont.loc[cont.groupby("nomeAdjudicante")["n_mes"].idxmax()]
+    topo = topo[topo["total"] >= min_contratos].copy()
+    topo["pct"] = topo["n_mes"] / topo["total"] * 100
+    topo = topo[topo["pct"] > pct_min].sort_values("pct", ascending=False).reset_index(drop=True)
+    topo["nome_mes"] = topo["mes"].astype(int).map(dict(enumerate(MESES_PT, 1)))
+    
+    return Resultado(
+        # Título tal como o original (que diz >40% com o corte em 25%)
+        "temporal_entidades", "  Entidades com concentração anómala (>40% num só mês):",
+        topo,
+        notas=[""],
+        modelo=[
+            "  ┌─ {nomeAdjudicante}",
+            "  │ {n_mes} de {total} contratos ({pct:.0f}%) em {nome_mes}",
+            "  └──────────────────────────────────────────────────────",
+        ],
+        formatos={"pct": ".0f"},
+        separador="",
+    )
 
 
 def analise_fornecedor_dominante(df):
-    print("\n🔍 ANÁLISE 3: Fornecedores dominantes por entidade")
-    print("   Fornecedor com >30% do valor total de uma entidade")
-    print("-" * 60)
-    
     total_adj = df.groupby("nomeAdjudicante")["precoContratual"].sum().reset_index(name="total_ent")
     par = df.groupby(["nomeAdjudicante", "nomeAdjudicatario", "nifAdjudicatario"]).agg(
         n=("precoContratual", "count"),
@@ -352,38 +371,52 @@ def analise_fornecedor_dominante(df):
     
     suspeitos = merged[merged["quota"] >= 25].sort_values("quota", ascending=False)
     
-    print(f"\n  ⚠️  {len(suspeitos)} PARES com fornecedor dominante (≥25% do valor)\n")
-    
-    for _, row in suspeitos.head(10).iterrows():
-        print(f"  ┌─ ALERTA ─────────────────────────────────────────────")
-        print(f"  │ Fornecedor:  {row['nomeAdjudicatario']}")
-        print(f"  │ NIPC:        {row['nifAdjudicatario']}")
-        print(f"  │ Entidade:    {row['nomeAdjudicante']}")
-        print(f"  │ Quota:       {row['quota']}% do valor total da entidade")
-        print(f"  │ Valor:       €{row['total']:,.2f} de €{row['total_ent']:,.2f}")
-        print(f"  │ Contratos:   {row['n']}")
-        print(f"  └──────────────────────────────────────────────────────\n")
+    return Resultado(
+        "dominante", "🔍 ANÁLISE 3: Fornecedores dominantes por entidade",
+        suspeitos.reset_index(drop=True),
+        descricao="   Fornecedor com >30% do valor total de uma entidade",
+        notas=["", f"⚠️  {len(suspeitos)} PARES com fornecedor dominante (≥25% do valor)", ""],
+        modelo=[
+            "  ┌─ ALERTA ─────────────────────────────────────────────",
+            "  │ Fornecedor:  {nomeAdjudicatario}",
+            "  │ NIPC:        {nifAdjudicatario}",
+            "  │ Entidade:    {nomeAdjudicante}",
+            "  │ Quota:       {quota}% do valor total da entidade",
+            "  │ Valor:       €{total:,.2f} de €{total_ent:,.2f}",
+            "  │ Contratos:   {n}",
+            "  └──────────────────────────────────────────────────────\n",
+        ],
+        formatos={"total": ",.2f", "total_ent": ",.2f"},
+        limite=10,
+        separador="-" * 60,
+    )
 
 
 def analise_mesma_morada(df_ent):
-    print("\n🔍 ANÁLISE 4: Empresas com mesma morada fiscal")
-    print("   Possível indicador de empresas de fachada")
-    print("-" * 60)
-    
-    dup = df_ent.groupby("morada").agg(
-        n=("nif", "count"),
-        empresas=("designacao", list),
-        nipcs=("nif", list),
-    ).reset_index()
-    dup = dup[dup["n"] >= 3].sort_values("n", ascending=False)
-    
-    print(f"\n  ⚠️  {len(dup)} MORADAS partilhadas por ≥3 entidades\n")
-    for _, row in dup.iterrows():
-        print(f"  ┌─ {row['morada']}")
-        print(f"  │ {row['n']} entidades:")
-        for nome, nipc in zip(row["empresas"], row["nipcs"]):
-            print(f"  │   • {nome} (NIPC: {nipc})")
-        print(f"  └──────────────────────────────────────────────────────\n")
+    n = df_ent.groupby("morada")["nif"].transform("count")
+    sub = df_ent[n >= 3].assign(n=n[n >= 3])
+    
+    # Lista de empresas por morada, construída por colunas e unida por grupo
+    item = "  │   • " + sub["designacao"] + " (NIPC: " + sub["nif"] + ")"
+    dup = (sub.assign(item=item)
+              .groupby("morada")
+              .agg(n=("n", "first"), empresas=("item", "\n".join))
+              .reset_index()
+              .sort_values("n", ascending=False)
+              .reset_index(drop=True))
+    
+    return Resultado(
+        "mesma_morada", "🔍 ANÁLISE 4: Empresas com mesma morada fiscal", dup,
+        descricao="   Possível indicador de empresas de fachada",
+        notas=["", f"⚠️  {len(dup)} MORADAS partilhadas por ≥3 entidades", ""],
+        modelo=[
+            "  ┌─ {morada}",
+            "  │ {n} entidades:",
+            "{empresas}",
+            "  └──────────────────────────────────────────────────────\n",
+        ],
+        separador="-" * 60,
+    )
 
 
 # ============================================================
@@ -412,10 +445,14 @@ def main():
     print(f"   Período: {df['dataCelebracaoContrato'].min()} a {df['dataCelebracaoContrato'].max()}")
     print(f"   Tipos de procedimento: {df['tipoProcedimento'].value_counts().to_dict()}")
     
-    analise_fragmentacao(df)
-    analise_concentracao_temporal(df)
-    analise_fornecedor_dominante(df)
-    analise_mesma_morada(df_ent)
+    for r in [
+        analise_fragmentacao(df),
+        analise_concentracao_temporal(df),
+        analise_concentracao_entidade(df),
+        analise_fornecedor_dominante(df),
+        analise_mesma_morada(df_ent),
+    ]:
+        print(apresentacao.terminal(r), end="")
     
     print("""
 ╔══════════════════════════════════════════════════════════════════╗
@@ -9,22 +9,94 @@ de dados abertos que funciona sem ficheiros com carimbos temporais.
 
 Fonte alternativa: dados.gov.pt (descarregamento manual)
 
+Os descarregamentos passam pela cache HTTP (cache_http.py): se o portal
+não mudou, basta um pedido condicional com resposta 304.
+
 Uso:
   pip install pandas requests
-  python extrair_base.py
+  python extrair_base.py                      # tudo, como antes
+  python extrair_base.py sync                 # só descarregar (condicional)
+  python extrair_base.py load                 # carregar, normalizar, armazém
+  python extrair_base.py analyse fragmentacao --adjudicante Gondomar --ano 2025
+  python extrair_base.py analyse cruzamentos  # cruzar com dados_base/registos/*.csv
+  python extrair_base.py analyse deriva --lotes   # em blocos, memória limitada
+  python extrair_base.py analyse risco        # pontuação por contrato (todas as análises)
+  python extrair_base.py report               # re-mostrar a última análise
+  python extrair_base.py export               # escrever na BD SQLite da aplicação
+  python extrair_base.py diff                 # o que mudou entre os dois últimos
+
+O pandas e o requests só são importados pelos subcomandos que precisam
+deles: `--help` e `report` arrancam de imediato.
 """
 
+import os
 import sys
 import json
+import importlib
+import shutil
+import argparse
+import threading
 from pathlib import Path
 from datetime import datetime
 
-try:
-    import pandas as pd
-    import requests
-except ImportError:
-    print("Instala: pip install pandas requests")
-    sys.exit(1)
+
+class _Adiado:
+    """Módulo (ou atributo dele) importado só no primeiro uso.
+
+    Na primeira vez que se lhe acede, importa o módulo e substitui o nome
+    global por ele; `--help` e `report` arrancam sem pandas, e quem importar
+    este ficheiro como biblioteca pode usar qualquer função directamente.
+    """
+
+    def __init__(self, global_, modulo, atributo=None):
+        vars(self).update(_global=global_, _modulo=modulo, _atributo=atributo)
+
+    def _resolver(self):
+        try:
+            alvo = importlib.import_module(self._modulo)
+        except ImportError:
+            if self._modulo not in ("pandas", "numpy", "requests"):
+                raise
+            print("Instala: pip install pandas requests")
+            sys.exit(1)
+        if self._atributo:
+            alvo = getattr(alvo, self._atributo)
+        globals()[self._global] = alvo
+        return alvo
+
+    def __getattr__(self, nome):
+        return getattr(self._resolver(), nome)
+
+    def __setattr__(self, nome, valor):
+        setattr(self._resolver(), nome, valor)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolver()(*args, **kwargs)
+
+
+pd = _Adiado("pd", "pandas")
+np = _Adiado("np", "numpy")
+requests = _Adiado("requests", "requests")
+armazem = _Adiado("armazem", "armazem")
+cache_http = _Adiado("cache_http", "cache_http")
+ingestao = _Adiado("ingestao", "ingestao")
+tipos = _Adiado("tipos", "tipos")
+partes = _Adiado("partes", "partes")
+resultados = _Adiado("resultados", "resultados")
+apresentacao = _Adiado("apresentacao", "apresentacao")
+cruzamento = _Adiado("cruzamento", "cruzamento")
+bd_rails = _Adiado("bd_rails", "bd_rails")
+instantaneos = _Adiado("instantaneos", "instantaneos")
+risco = _Adiado("risco", "risco")
+Resultado = _Adiado("Resultado", "resultados", "Resultado")
+
+
+def _importar():
+    """Importa já as dependências pesadas (falha cedo se faltar o pandas)."""
+    for valor in list(globals().values()):
+        if isinstance(valor, _Adiado):
+            valor._resolver()
+
 
 DIR = Path("dados_base")
 DIR.mkdir(exist_ok=True)
@@ -56,15 +128,72 @@ SNS_COMPLETO = f"{SNS_BASE}/explore/dataset/{SNS_DATASET}/download/?format=csv&t
 def contar_registos():
     """Consulta quantos registos existem no conjunto de dados."""
     try:
-        r = requests.get(SNS_RECORDS, params={"limit": 0}, timeout=30)
-        r.raise_for_status()
-        total = r.json().get("total_count", 0)
+        total = cache_http.obter_json(SNS_RECORDS, {"limit": 0}, timeout=30).get("total_count", 0)
         return total
     except Exception as e:
         print(f"  ⚠ Erro ao consultar API: {e}")
         return 0
 
 
+# Arquivamentos em curso: (thread, mensagens a mostrar no fim)
+_ARQUIVOS = []
+
+
+def _arquivar(path, fonte, sha, mensagens):
+    try:
+        e = instantaneos.guardar(path, fonte=fonte, sha=sha)
+    except Exception as erro:
+        mensagens.append(f"  ⚠ Instantâneo não arquivado: {erro}")
+        return
+    aviso = "" if instantaneos.zstandard else "  (gzip — instala: pip install zstandard)"
+    mensagens.append(f"  ✓ Instantâneo {e['sha256'][:12]} ({e['tamanho']/1e6:.1f} → "
+                     f"{e['comprimido']/1e6:.1f} MB){aviso}")
+
+
+def arquivar(path, fonte, sha=None):
+    """Guarda o descarregamento no arquivo de instantâneos (ver instantaneos.py).
+
+    A compressão corre numa thread à parte, enquanto o carregamento e as
+    análises avançam; `esperar_arquivos` espera por ela no fim.
+    """
+    mensagens = []
+    t = threading.Thread(target=_arquivar, args=(path, fonte, sha, mensagens), name="arquivo")
+    t.start()
+    _ARQUIVOS.append((t, mensagens))
+
+
+def esperar_arquivos():
+    """Espera pelos arquivamentos em curso e mostra o resultado."""
+    while _ARQUIVOS:
+        t, mensagens = _ARQUIVOS.pop(0)
+        if t.is_alive():
+            print("\n  … a terminar o arquivo do instantâneo")
+        t.join()
+        for m in mensagens:
+            print(m)
+
+
+def _copiar_da_cache(objeto, path, alterado, fonte="completo"):
+    """Coloca em `path` o objecto guardado na cache (só se mudou) e arquiva-o.
+
+    `path` fica uma ligação (hardlink) para o objecto, sem segunda cópia
+    em disco; só se copia quando a ligação não é possível (p.ex. outro
+    sistema de ficheiros).
+    """
+    actual = path.exists() and (os.path.samefile(objeto, path) or (
+        not alterado and path.stat().st_size == objeto.stat().st_size))
+    if not actual:
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.unlink(missing_ok=True)
+        try:
+            os.link(objeto, tmp)
+        except OSError:
+            shutil.copyfile(objeto, tmp)
+        os.replace(tmp, path)
+    # O nome do objecto na cache já é o SHA-256 do conteúdo
+    arquivar(path, fonte, sha=objeto.name)
+
+
 def descarregar_via_export(path, limit=10000):
     """Descarrega via interface de exportação (rápido, até 10 mil registos)."""
     print(f"  ↓ A descarregar via exportação (limite: {limit})...")
@@ -75,10 +204,8 @@ def descarregar_via_export(path, limit=10000):
         "offset": 0,
     }
     try:
-        r = requests.get(SNS_EXPORT, params=params, timeout=120)
-        r.raise_for_status()
-        with open(path, "wb") as f:
-            f.write(r.content)
+        objeto, alterado = cache_http.obter(SNS_EXPORT, params, timeout=120, progresso=True)
+        _copiar_da_cache(objeto, path, alterado, fonte=f"exportação ({limit})")
         print(f"  ✓ {path.name} ({path.stat().st_size / 1e6:.1f} MB)")
         return True
     except Exception as e:
@@ -87,20 +214,11 @@ def descarregar_via_export(path, limit=10000):
 
 
 def descarregar_completo(path):
-    """Descarrega o CSV completo via ligação directa."""
+    """Descarrega o CSV completo via ligação directa (condicional, via cache)."""
     print(f"  ↓ A descarregar CSV completo...")
     try:
-        r = requests.get(SNS_COMPLETO, timeout=300, stream=True)
-        r.raise_for_status()
-        total = int(r.headers.get("content-length", 0))
-        recebido = 0
-        with open(path, "wb") as f:
-            for pedaço in r.iter_content(65536):
-                f.write(pedaço)
-                recebido += len(pedaço)
-                if total:
-                    print(f"\r    {recebido/1e6:.1f}/{total/1e6:.1f} MB", end="", flush=True)
-        print()
+        objeto, alterado = cache_http.obter(SNS_COMPLETO, timeout=300, progresso=True)
+        _copiar_da_cache(objeto, path, alterado)
         if path.stat().st_size > 100:
             print(f"  ✓ {path.name} ({path.stat().st_size / 1e6:.1f} MB)")
             return True
@@ -143,25 +261,33 @@ def descarregar_paginado(path, lote=100):
     print()
     if registos:
         df = pd.DataFrame(registos)
+        # `path` pode ser uma ligação para um objecto da cache: não escrever por cima
+        path.unlink(missing_ok=True)
         df.to_csv(path, index=False, encoding="utf-8-sig", sep=";")
         print(f"  ✓ {path.name} ({len(registos):,} registos)")
+        arquivar(path, "paginado")
         return True
     return False
 
 
-def obter_dados():
+def ficheiro_local():
+    """Primeiro CSV/XLSX não vazio em DIR, se existir (sem contar o resultado exportado)."""
+    for padrao in ["*.csv", "*.xlsx"]:
+        for f in DIR.glob(padrao):
+            if f.name != "resultado.csv" and f.stat().st_size > 1000:
+                return f
+    return None
+
+
+def obter_dados(tentar_completo=True):
     """Tenta várias formas de obter os dados."""
     print("\n═══ FASE 1: DESCARREGAMENTO ═══\n")
     
     # Verificar ficheiro local
-    for f in DIR.glob("*.csv"):
-        if f.stat().st_size > 1000:
-            print(f"  ✓ Ficheiro local encontrado: {f.name} ({f.stat().st_size/1e6:.1f} MB)")
-            return f
-    for f in DIR.glob("*.xlsx"):
-        if f.stat().st_size > 1000:
-            print(f"  ✓ Ficheiro local encontrado: {f.name} ({f.stat().st_size/1e6:.1f} MB)")
-            return f
+    f = ficheiro_local()
+    if f:
+        print(f"  ✓ Ficheiro local encontrado: {f.name} ({f.stat().st_size/1e6:.1f} MB)")
+        return f
     
     path = DIR / "portal_base.csv"
     
@@ -171,7 +297,7 @@ def obter_dados():
         print(f"  📊 {total:,} registos disponíveis na API")
     
     # Tentativa 1: Descarregamento completo
-    if descarregar_completo(path):
+    if tentar_completo and descarregar_completo(path):
         return path
     
     # Tentativa 2: Exportação por lotes
@@ -197,7 +323,12 @@ def obter_dados():
 # ════════════════════════════════════════
 
 def carregar(path):
-    """Carrega CSV ou XLSX."""
+    """Carrega CSV ou XLSX.
+
+    O CSV é lido como texto, como na leitura em fluxo (ingestao.py): o
+    `id_externo` é calculado sobre o texto original e a conversão de
+    tipos fica para `tipar`.
+    """
     print(f"\n  📄 A ler {path.name}...")
     
     if path.suffix == ".xlsx":
@@ -211,7 +342,7 @@ def carregar(path):
         for sep in [";", ",", "\t"]:
             for enc in ["utf-8-sig", "utf-8", "latin-1", "cp1252"]:
                 try:
-                    df = pd.read_csv(path, sep=sep, encoding=enc, low_memory=False)
+                    df = pd.read_csv(path, sep=sep, encoding=enc, dtype=str)
                     if len(df.columns) > 3:
                         break
                 except:
@@ -229,66 +360,115 @@ def carregar(path):
     return df
 
 
-def normalizar(df):
-    """Normaliza nomes de colunas — suporta tanto dados.gov.pt como transparencia.sns.gov.pt."""
-    
-    # Mapeamento: nome interno → lista de variantes possíveis nas fontes
-    correspondencias = {
-        "nipc_adjudicatario": [
-            "nifs_das_adjudicatarias",          # transparencia.sns.gov.pt
-            "nifadjudicatario",                  # dados.gov.pt
-            "adjudicatarionif", "adjudicatario_nif",
-        ],
-        "nome_adjudicatario": [
-            "entidades_adjudicatarias_normalizado",  # transparencia.sns.gov.pt
-            "nomeadjudicatario",                      # dados.gov.pt
-            "adjudicatariodesignacao", "adjudicatario_designacao",
-        ],
-        "nipc_adjudicante": [
-            "nifs_dos_adjudicantes",             # transparencia.sns.gov.pt
-            "nifadjudicante",                    # dados.gov.pt
-            "adjudicantenif", "adjudicante_nif",
-        ],
-        "nome_adjudicante": [
-            "entidades_adjudicantes_normalizado",  # transparencia.sns.gov.pt
-            "nomeadjudicante",                      # dados.gov.pt
-            "adjudicantedesignacao", "adjudicante_designacao",
-        ],
-        "preco": [
-            "preco_contratual",                  # transparencia.sns.gov.pt
-            "precocontratual",                   # dados.gov.pt
-            "precoefetivo",
-        ],
-        "tipo_procedimento": [
-            "tipo_de_procedimento",              # transparencia.sns.gov.pt
-            "tipoprocedimento",                  # dados.gov.pt
-            "tipodeprocedimento",
-        ],
-        "data_celebracao": [
-            "data_de_celebracao_do_contrato",    # transparencia.sns.gov.pt
-            "datacelebracaocontrato",            # dados.gov.pt
-            "datacelebracao", "data_celebracao",
-        ],
-        "objeto": [
-            "objeto_do_contrato",                # transparencia.sns.gov.pt
-            "objectocontrato",                   # dados.gov.pt
-            "objetocontrato",
-        ],
-        "tipo_contrato": [
-            "tipos_de_contrato",                 # transparencia.sns.gov.pt
-            "tipocontrato",                      # dados.gov.pt
-        ],
-        "local_execucao": [
-            "local_de_execucao",                 # transparencia.sns.gov.pt
-        ],
-        "preco_efetivo": [
-            "preco_total_efetivo",               # transparencia.sns.gov.pt
-        ],
-    }
-    
+def carregar_em_fluxo(path, linhas=50000):
+    """Descarrega e lê o CSV completo ao mesmo tempo (ver ingestao.py).
+
+    Cada lote é normalizado, identificado (`id_externo`, sobre o texto
+    original), tipado e gravado no armazém à chegada, com os formatos
+    detectados no primeiro lote. No fim o CSV fica também em `path`, para
+    as execuções seguintes. Devolve None se falhar.
+    """
+    print(f"  ↓ A descarregar e ler CSV completo em fluxo...")
+    estado, formatos, relatorio = {}, {}, {}
+    gravador = armazem.Gravador()
+    lotes, renomear, n = [], None, 0
+    try:
+        for lote in ingestao.lotes_em_fluxo(SNS_COMPLETO, linhas=linhas, estado=estado):
+            if renomear is None:
+                renomear = mapa_colunas(lote.columns)
+            lote = lote.rename(columns=renomear)
+            lote["id_externo"] = bd_rails.id_externo(lote)
+            lote, r = tipos.tipar(lote, formatos)
+            for c, x in r.items():
+                relatorio.setdefault(c, {**x, "invalidos": 0})["invalidos"] += x["invalidos"]
+            gravador.juntar(lote)
+            lotes.append(lote)
+            n += len(lote)
+            print(f"\r    {estado.get('recebido', 0)/1e6:.1f} MB · {n:,} registos", end="", flush=True)
+        print()
+    except Exception as e:
+        print(f"\n  ✗ {e}")
+        gravador.descartar()
+        return None
+    if not lotes:
+        gravador.descartar()
+        return None
+
+    _copiar_da_cache(estado["objeto"], path, True)
+    df = pd.concat(lotes, ignore_index=True)
+    print(f"  ✓ {path.name} ({path.stat().st_size / 1e6:.1f} MB)")
+    print(f"  → {len(df):,} registos, {len(df.columns)} colunas")
+    if renomear:
+        print(f"  → Colunas normalizadas: {list(renomear.values())}")
+    mostrar_tipos(relatorio)
+    m = gravador.fechar(origem=origem(path))
+    print(f"  ✓ Armazém: {len(m['particoes']):,} partições em {armazem.RAIZ}")
+    return df
+
+
+# Mapeamento: nome interno → lista de variantes possíveis nas fontes
+CORRESPONDENCIAS = {
+    "id_contrato": [
+        "idcontrato",                        # dados.gov.pt
+    ],
+    "nipc_adjudicatario": [
+        "nifs_das_adjudicatarias",          # transparencia.sns.gov.pt
+        "nifadjudicatario",                  # dados.gov.pt
+        "adjudicatarionif", "adjudicatario_nif",
+    ],
+    "nome_adjudicatario": [
+        "entidades_adjudicatarias_normalizado",  # transparencia.sns.gov.pt
+        "nomeadjudicatario",                      # dados.gov.pt
+        "adjudicatariodesignacao", "adjudicatario_designacao",
+    ],
+    "nipc_adjudicante": [
+        "nifs_dos_adjudicantes",             # transparencia.sns.gov.pt
+        "nifadjudicante",                    # dados.gov.pt
+        "adjudicantenif", "adjudicante_nif",
+    ],
+    "nome_adjudicante": [
+        "entidades_adjudicantes_normalizado",  # transparencia.sns.gov.pt
+        "nomeadjudicante",                      # dados.gov.pt
+        "adjudicantedesignacao", "adjudicante_designacao",
+    ],
+    "preco": [
+        "preco_contratual",                  # transparencia.sns.gov.pt
+        "precocontratual",                   # dados.gov.pt
+        "precoefetivo",
+    ],
+    "tipo_procedimento": [
+        "tipo_de_procedimento",              # transparencia.sns.gov.pt
+        "tipoprocedimento",                  # dados.gov.pt
+        "tipodeprocedimento",
+    ],
+    "data_celebracao": [
+        "data_de_celebracao_do_contrato",    # transparencia.sns.gov.pt
+        "datacelebracaocontrato",            # dados.gov.pt
+        "datacelebracao", "data_celebracao",
+    ],
+    "objeto": [
+        "objeto_do_contrato",                # transparencia.sns.gov.pt
+        "objectocontrato",                   # dados.gov.pt
+        "objetocontrato",
+    ],
+    "tipo_contrato": [
+        "tipos_de_contrato",                 # transparencia.sns.gov.pt
+        "tipocontrato",                      # dados.gov.pt
+    ],
+    "local_execucao": [
+        "local_de_execucao",                 # transparencia.sns.gov.pt
+    ],
+    "preco_efetivo": [
+        "preco_total_efetivo",               # transparencia.sns.gov.pt
+    ],
+}
+
+
+def mapa_colunas(colunas):
+    """Nome real → nome interno, para as colunas reconhecidas."""
     # Criar índice das colunas reais (sem espaços, sublinhados, hífenes)
     indice = {}
-    for c in df.columns:
+    for c in colunas:
         chave = c.lower().strip().replace(" ","").replace("-","")
         indice[chave] = c
         # Também sem sublinhados para apanhar variantes
@@ -296,11 +476,11 @@ def normalizar(df):
         indice[chave2] = c
     
     renomear = {}
-    for alvo, candidatos in correspondencias.items():
+    for alvo, candidatos in CORRESPONDENCIAS.items():
         for cand in candidatos:
             # Tentar com sublinhados
-            if cand in [c.lower() for c in df.columns]:
-                col_real = [c for c in df.columns if c.lower() == cand][0]
+            if cand in [c.lower() for c in colunas]:
+                col_real = [c for c in colunas if c.lower() == cand][0]
                 renomear[col_real] = alvo
                 break
             # Tentar sem sublinhados
@@ -308,7 +488,12 @@ def normalizar(df):
             if limpo in indice:
                 renomear[indice[limpo]] = alvo
                 break
-    
+    return renomear
+
+
+def normalizar(df):
+    """Normaliza nomes de colunas — suporta tanto dados.gov.pt como transparencia.sns.gov.pt."""
+    renomear = mapa_colunas(df.columns)
     if renomear:
         df = df.rename(columns=renomear)
         print(f"  → Colunas normalizadas: {list(renomear.values())}")
@@ -316,20 +501,36 @@ def normalizar(df):
     return df
 
 
+def tipar(df):
+    """Converte preços e datas uma só vez, com o formato detectado numa amostra."""
+    df, relatorio = tipos.tipar(df)
+    mostrar_tipos(relatorio)
+    return df
+
+
+def mostrar_tipos(relatorio):
+    for col, r in relatorio.items():
+        aviso = f"  ⚠ {r['invalidos']:,} valores ilegíveis" if r["invalidos"] else ""
+        print(f"  → {col}: formato {r['formato']}{aviso}")
+
+
 # ════════════════════════════════════════
 # 3. ANÁLISES
 # ════════════════════════════════════════
 
 def analise_fragmentacao(df, limiar=20000, minimo=5):
-    """Detecta fragmentação: ajustes directos repetidos abaixo do limiar legal."""
-    print("\n🔍 FRAGMENTAÇÃO DE CONTRATOS")
-    print(f"   Ajustes directos repetidos abaixo de €{limiar:,}")
-    print("─" * 55)
+    """Detecta fragmentação: ajustes directos repetidos abaixo do limiar legal.
+
+    Agrega por parte real (cada membro de um consórcio conta à parte); o
+    limiar compara-se com o preço do contrato.
+    """
+    r = Resultado("fragmentacao", "🔍 FRAGMENTAÇÃO DE CONTRATOS", pd.DataFrame(),
+                  descricao=f"   Ajustes directos repetidos abaixo de €{limiar:,}")
     
     if "preco" not in df.columns:
-        print("  ⚠ Sem coluna de preço"); return
+        r.notas = ["⚠ Sem coluna de preço"]; return r
     
-    t = df.copy()
+    t = partes.por_partes(df, COLUNAS_PARTES)
     t["_p"] = pd.to_numeric(t["preco"], errors="coerce")
     
     if "tipo_procedimento" in t.columns:
@@ -339,120 +540,511 @@ def analise_fragmentacao(df, limiar=20000, minimo=5):
     
     colunas = [c for c in ["nome_adjudicante","nome_adjudicatario","nipc_adjudicatario"] if c in t.columns]
     if not colunas:
-        print("  ⚠ Sem colunas de agrupamento"); return
+        r.notas = ["⚠ Sem colunas de agrupamento"]; return r
     
-    a = t.groupby(colunas).agg(
+    a = t.groupby(colunas, observed=True).agg(
         n=("_p","count"), total=("_p","sum"), media=("_p","mean"),
         mn=("_p","min"), mx=("_p","max")
     ).reset_index()
     
-    s = a[a["n"] >= minimo].sort_values("total", ascending=False)
+    s = a[a["n"] >= minimo].sort_values("total", ascending=False).reset_index(drop=True)
+    s["junto_limiar"] = (s["mx"] < limiar) & (s["mn"] > limiar * 0.6)
     
-    print(f"\n  ⚠ {len(s)} pares suspeitos (≥{minimo} ajustes directos <€{limiar:,})\n")
-    for _, r in s.head(15).iterrows():
-        print(f"  ┌ {r.get('nome_adjudicatario','?')}")
-        nipc = r.get('nipc_adjudicatario','')
-        if nipc:
-            print(f"  │ NIPC: {nipc}")
-        print(f"  │ ← {r.get('nome_adjudicante','?')}")
-        print(f"  │ {r['n']} contratos  €{r['total']:,.0f} (média €{r['media']:,.0f})")
-        if r["mx"] < limiar and r["mn"] > limiar * 0.6:
-            print(f"  │ 🚩 Valores sistematicamente junto ao limiar!")
-        print(f"  └{'─'*53}\n")
+    r.tabela = s
+    r.notas = ["", f"⚠ {len(s)} pares suspeitos (≥{minimo} ajustes directos <€{limiar:,})", ""]
+    r.modelo = [
+        "  ┌ {nome_adjudicatario}",
+        ["  │ NIPC: {nipc_adjudicatario}", "nipc_adjudicatario"],
+        "  │ ← {nome_adjudicante}",
+        "  │ {n} contratos  €{total:,.0f} (média €{media:,.0f})",
+        ["  │ 🚩 Valores sistematicamente junto ao limiar!", "junto_limiar"],
+        f"  └{'─'*53}\n",
+    ]
+    r.formatos = {"total": ",.2f", "media": ",.2f", "mn": ",.2f", "mx": ",.2f"}
+    r.limite = 15
+    return r
+
+
+LIMIARES = [5000, 20000, 30000, 75000]
+MINIMOS = [3, 5, 10]
+FAIXAS = [0.6, 0.8, 0.9]
+
+
+def analise_sensibilidade(df, limiares=LIMIARES, minimos=MINIMOS, faixas=FAIXAS):
+    """Fragmentação para uma grelha de (limiar, mínimo, faixa) numa só passagem.
+
+    Os preços de cada par adjudicante–adjudicatário são classificados uma
+    vez contra todos os limites (limiares e limiar × faixa); histogramas
+    acumulados por par respondem depois a todas as combinações sem voltar
+    a agrupar. Cada linha do cubo corresponde a correr analise_fragmentacao
+    com esses parâmetros (`junto` = pares com todos os valores na faixa).
+    """
+    r = Resultado("sensibilidade", "🔍 SENSIBILIDADE DA FRAGMENTAÇÃO", pd.DataFrame(),
+                  descricao="   Pares sinalizados por limiar, mínimo de contratos e faixa junto ao limiar")
+
+    colunas = [c for c in ["nome_adjudicante","nome_adjudicatario","nipc_adjudicatario"] if c in df.columns]
+    if "preco" not in df.columns or not colunas:
+        r.notas = ["⚠ Sem coluna de preço ou de agrupamento"]; return r
+
+    t = partes.por_partes(df, COLUNAS_PARTES)
+    if "tipo_procedimento" in t.columns:
+        t = t[t["tipo_procedimento"].str.contains("direto|directo|simplif", case=False, na=False)]
+    p = pd.to_numeric(t["preco"], errors="coerce").to_numpy(dtype="float64")
+    g = t.groupby(colunas, observed=True).ngroup().to_numpy()
+    # Grupos com chave vazia ficam de fora (ngroup dá NaN, e g passa a float)
+    ok = (g >= 0) & ~np.isnan(p)
+    p, g = p[ok], g[ok].astype("int64")
+    G = int(g.max()) + 1 if len(g) else 0
+
+    L = np.asarray(limiares, dtype="float64")
+    M = np.asarray(minimos)
+    F = np.asarray(faixas, dtype="float64")
+    bordas = np.unique(np.concatenate([L, np.outer(L, F).ravel()]))
+    E = len(bordas) + 1
+    # menor[:, k] = nº de preços < bordas[k]; ate[:, k] = nº de preços ≤ bordas[k]
+    b_menor = np.searchsorted(bordas, p, side="right")
+    b_ate = np.searchsorted(bordas, p, side="left")
+    menor = np.bincount(g * E + b_menor, minlength=G * E).reshape(G, E).cumsum(axis=1)
+    ate = np.bincount(g * E + b_ate, minlength=G * E).reshape(G, E).cumsum(axis=1)
+    valor = np.bincount(g * E + b_menor, weights=p, minlength=G * E).reshape(G, E).cumsum(axis=1)
+
+    iL = np.searchsorted(bordas, L)                          # coluna de cada limiar
+    iLF = np.searchsorted(bordas, np.outer(L, F))            # (limiar, faixa)
+    n = menor[:, iL]                                         # (pares, limiar)
+    v = valor[:, iL]
+    fora = ate[:, iLF]                                       # preços ≤ limiar × faixa
+
+    sinal = n[:, :, None] >= M[None, None, :]                # (pares, limiar, mínimo)
+    junto = sinal[:, :, :, None] & (fora[:, :, None, :] == 0)  # (…, faixa)
+    cubo_pares = sinal.sum(axis=0)
+    cubo_contratos = (sinal * n[:, :, None]).sum(axis=0)
+    cubo_valor = (sinal * v[:, :, None]).sum(axis=0)
+    cubo_junto = junto.sum(axis=0)
+
+    il, im, jf = np.meshgrid(np.arange(len(L)), np.arange(len(M)), np.arange(len(F)), indexing="ij")
+    il, im, jf = il.ravel(), im.ravel(), jf.ravel()
+    s = pd.DataFrame({
+        "limiar": L[il].astype("int64"), "minimo": M[im], "faixa": F[jf],
+        "pares": cubo_pares[il, im], "contratos": cubo_contratos[il, im],
+        "valor": cubo_valor[il, im], "junto": cubo_junto[il, im, jf],
+    })
+
+    r.tabela = s
+    r.notas = ["", f"{G:,} pares com ajustes directos · {len(L)}×{len(M)}×{len(F)} combinações", ""]
+    r.modelo = ["    <€{limiar:>7,} ≥{minimo:>3}  faixa >{faixa:.0%}: {pares:>6,} pares  "
+                "{contratos:>8,} contratos  €{valor:>15,.0f}  junto ao limiar: {junto:>5,}"]
+    r.formatos = {"valor": ",.2f", "faixa": ".2f"}
+    return r
 
 
 def analise_temporal(df):
     """Detecta concentração temporal anómala."""
-    print("\n🔍 CONCENTRAÇÃO TEMPORAL")
-    print("─" * 55)
+    r = Resultado("temporal", "🔍 CONCENTRAÇÃO TEMPORAL", pd.DataFrame())
     
     if "data_celebracao" not in df.columns:
-        print("  ⚠ Sem coluna de data"); return
-    
-    t = df.copy()
-    t["_d"] = pd.to_datetime(t["data_celebracao"], errors="coerce")
-    t["_m"] = t["_d"].dt.month
+        r.notas = ["⚠ Sem coluna de data"]; return r
     
     meses = ["Jan","Fev","Mar","Abr","Mai","Jun","Jul","Ago","Set","Out","Nov","Dez"]
-    pm = t.dropna(subset=["_m"]).groupby("_m").size()
+    m = pd.to_datetime(df["data_celebracao"], errors="coerce").dt.month
+    pm = m.dropna().astype(int).value_counts().reindex(range(1, 13), fill_value=0)
     media = pm.mean()
     
-    print(f"\n  Média: {media:.0f} contratos/mês\n")
-    for m in range(1,13):
-        n = pm.get(m,0)
-        p = n/media*100 if media else 0
-        print(f"    {meses[m-1]}: {n:>6,}  ({p:>5.0f}%) {'█'*int(p/8)}{'  ⚠ PICO' if p>150 else ''}")
+    t = pd.DataFrame({"mes": pm.index, "nome_mes": meses, "n": pm.to_numpy()})
+    t["pct"] = t["n"] / media * 100 if media else 0.0
+    t["barra"] = pd.Series("█", index=t.index).str.repeat((t["pct"] / 8).astype(int).tolist())
+    t["pico"] = t["pct"] > 150
+    t["aviso"] = t["pico"].map({True: "  ⚠ PICO", False: ""})
+    
+    r.tabela = t
+    r.notas = ["", f"Média: {media:.0f} contratos/mês", ""]
+    r.modelo = ["    {nome_mes}: {n:>6,}  ({pct:>5.0f}%) {barra}{aviso}"]
+    r.formatos = {"pct": ".0f"}
+    return r
 
 
 def analise_dominante(df, quota_min=25):
-    """Detecta fornecedores dominantes numa entidade."""
-    print(f"\n🔍 FORNECEDORES DOMINANTES (>{quota_min}%)")
-    print("─" * 55)
-    
-    if "preco" not in df.columns: return
-    t = df.copy()
-    t["_p"] = pd.to_numeric(t["preco"], errors="coerce")
+    """Detecta fornecedores dominantes numa entidade (por parte real, com a quota do preço)."""
+    r = Resultado("dominante", f"🔍 FORNECEDORES DOMINANTES (>{quota_min}%)", pd.DataFrame())
     
     ca = "nome_adjudicante"
     cf = "nome_adjudicatario"
-    if ca not in t.columns or cf not in t.columns: return
+    if "preco" not in df.columns or ca not in df.columns or cf not in df.columns:
+        return r
+    t = partes.por_partes(df)
+    t["_p"] = t["quota"]
     
-    te = t.groupby(ca)["_p"].sum().reset_index(name="te")
-    pa = t.groupby([ca,cf]).agg(n=("_p","count"), total=("_p","sum")).reset_index()
+    te = t.groupby(ca, observed=True)["_p"].sum().reset_index(name="te")
+    pa = t.groupby([ca,cf], observed=True).agg(n=("_p","count"), total=("_p","sum")).reset_index()
     m = pa.merge(te, on=ca)
     m["quota"] = (m["total"]/m["te"]*100).round(1)
     
-    s = m[m["quota"] >= quota_min].sort_values("quota", ascending=False)
-    print(f"\n  ⚠ {len(s)} pares com fornecedor dominante\n")
-    for _,r in s.head(10).iterrows():
-        print(f"  {r[cf][:50]}")
-        print(f"    → {r[ca][:50]}  {r['quota']}%  €{r['total']:,.0f} ({r['n']} contratos)\n")
+    s = m[m["quota"] >= quota_min].sort_values("quota", ascending=False).reset_index(drop=True)
+    r.tabela = s
+    r.notas = ["", f"⚠ {len(s)} pares com fornecedor dominante", ""]
+    r.modelo = [
+        "  {nome_adjudicatario:.50}",
+        "    → {nome_adjudicante:.50}  {quota}%  €{total:,.0f} ({n} contratos)\n",
+    ]
+    r.formatos = {"total": ",.2f", "te": ",.2f"}
+    r.limite = 10
+    return r
 
 
 def analise_top(df, n=20):
-    """Maiores adjudicatários por valor total."""
-    print(f"\n🔍 MAIORES ADJUDICATÁRIOS (TOP {n})")
-    print("─" * 55)
-    
-    if "preco" not in df.columns: return
-    t = df.copy()
-    t["_p"] = pd.to_numeric(t["preco"], errors="coerce")
+    """Maiores adjudicatários por valor total (por parte real, com a quota do preço)."""
+    r = Resultado("top", f"🔍 MAIORES ADJUDICATÁRIOS (TOP {n})", pd.DataFrame())
     
     cf = "nome_adjudicatario"
-    if cf not in t.columns: return
+    if "preco" not in df.columns or cf not in df.columns:
+        return r
+    t = partes.por_partes(df)
+    t["_p"] = t["quota"]
     
-    a = t.groupby(cf).agg(n=("_p","count"), total=("_p","sum")).reset_index()
-    a = a.sort_values("total", ascending=False)
+    a = t.groupby(cf, observed=True).agg(n=("_p","count"), total=("_p","sum")).reset_index()
+    a = a.sort_values("total", ascending=False).head(n).reset_index(drop=True)
+    a.insert(0, "posicao", range(1, len(a) + 1))
     
-    print()
-    for i, (_, r) in enumerate(a.head(n).iterrows(), 1):
-        print(f"  {i:>2}. {r[cf][:55]:<57} {r['n']:>5} contratos  €{r['total']:>14,.2f}")
+    r.tabela = a
+    r.notas = [""]
+    r.modelo = ["  {posicao:>2}. {nome_adjudicatario:<57.55} {n:>5} contratos  €{total:>14,.2f}"]
+    r.formatos = {"total": ",.2f"}
+    return r
+
+
+GRUPOS_DERIVA = {
+    "adjudicante": "nome_adjudicante",
+    "adjudicatario": "nome_adjudicatario",
+    "procedimento": "tipo_procedimento",
+}
+
+
+def _deriva(lote):
+    """log(preço efetivo / preço contratual) por contrato (NaN sem os dois preços)."""
+    p = pd.to_numeric(lote["preco"], errors="coerce").to_numpy(dtype="float64")
+    e = pd.to_numeric(lote["preco_efetivo"], errors="coerce").to_numpy(dtype="float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = np.log(e / p)
+    x[~((p > 0) & (e > 0))] = np.nan
+    return x
+
+
+def _grupos_deriva(lote, d):
+    """(posição do contrato, grupo) para a dimensão d.
+
+    Adjudicantes e adjudicatários são as partes individuais (partes.arestas):
+    um contrato de consórcio conta para cada membro e a cadeia "A|B" nunca
+    forma grupo. O tipo de procedimento é um por contrato.
+    """
+    if d in partes.PAPEIS:
+        e = partes.arestas(lote, d)
+        return e["contrato"].to_numpy(), e["nome"].to_numpy(dtype=object)
+    return np.arange(len(lote)), lote[GRUPOS_DERIVA[d]].to_numpy(dtype=object)
+
+
+def analise_deriva_lotes(lotes, z_min=3.0, grupo_min=10, razao_min=1.2):
+    """Deriva de preço em duas passagens sobre lotes; `lotes()` devolve um iterador.
+
+    1ª passagem: momentos de log(efetivo/contratual) — n, Σx, Σx² — por
+    adjudicante, adjudicatário (cada membro dos consórcios) e tipo de
+    procedimento, somáveis entre lotes. 2ª passagem: cada contrato
+    compara-se com a distribuição do seu grupo (z ≥ z_min em grupos com
+    ≥ grupo_min contratos; com vários membros, o maior z) e só conta se
+    o efetivo passar razao_min × o contratual.
+    """
+    r = Resultado("deriva", "🔍 DERIVA DE PREÇO (EFETIVO vs CONTRATUAL)", pd.DataFrame(),
+                  descricao=f"   Contratos ≥{razao_min:.1f}× o preço contratual e atípicos no seu grupo (z ≥ {z_min:.0f})")
+
+    momentos = {d: None for d in GRUPOS_DERIVA}
+    total = com_ambos = acima = 0
+    for lote in lotes():
+        if "preco" not in lote.columns or "preco_efetivo" not in lote.columns:
+            r.notas = ["⚠ Sem colunas de preço contratual e efetivo"]; return r
+        x = _deriva(lote)
+        ok = ~np.isnan(x)
+        total += len(lote); com_ambos += int(ok.sum()); acima += int((x[ok] > 0).sum())
+        for d, c in GRUPOS_DERIVA.items():
+            if c not in lote.columns:
+                continue
+            pos, grupo = _grupos_deriva(lote, d)
+            v = ok[pos]
+            t = pd.DataFrame({"x": x[pos[v]], "x2": x[pos[v]] ** 2})
+            m = t.groupby(grupo[v]).agg(n=("x", "count"), s=("x", "sum"), s2=("x2", "sum"))
+            momentos[d] = m if momentos[d] is None else momentos[d].add(m, fill_value=0)
+
+    estat = {}
+    for d, m in momentos.items():
+        if m is None:
+            continue
+        media = m["s"] / m["n"]
+        dp = np.sqrt((m["s2"] / m["n"] - media ** 2).clip(lower=0) * m["n"] / (m["n"] - 1))
+        estat[d] = pd.DataFrame({"n": m["n"], "media": media, "dp": dp})
+
+    sinalizados = []
+    for lote in lotes():
+        x = _deriva(lote)
+        suspeito = x >= np.log(razao_min)
+        if not suspeito.any():
+            continue
+        s = lote[suspeito].reset_index(drop=True)
+        s["razao"] = np.exp(x[suspeito])
+        motivos = pd.Series("", index=s.index, dtype=object)
+        for d, e in estat.items():
+            pos, grupo = _grupos_deriva(lote, d)
+            v = suspeito[pos]
+            g = e.reindex(grupo[v])
+            zm = (x[pos[v]] - g["media"].to_numpy()) / g["dp"].to_numpy()
+            zm[~(g["n"].to_numpy() >= grupo_min)] = np.nan
+            # O maior z entre os membros do contrato (fmax ignora NaN)
+            z = np.full(len(lote), np.nan)
+            np.fmax.at(z, pos[v], zm)
+            z = z[suspeito]
+            s[f"z_{d}"] = z
+            motivos = motivos + np.where(z >= z_min, d + " ", "")
+        s["motivos"] = motivos.str.strip()
+        sinalizados.append(s[s["motivos"].ne("")])
+
+    colunas = (["nome_adjudicante", "nome_adjudicatario", "tipo_procedimento", "objeto",
+                "preco", "preco_efetivo", "razao", "motivos"] + [f"z_{d}" for d in estat]
+               + ["id_externo"])
+    if sinalizados:
+        s = pd.concat(sinalizados, ignore_index=True)
+        s = s[[c for c in colunas if c in s.columns]]
+        s = s.sort_values("razao", ascending=False, kind="stable").reset_index(drop=True)
+    else:
+        s = pd.DataFrame(columns=colunas)
+
+    r.tabela = s
+    r.notas = ["", f"{com_ambos:,} de {total:,} contratos com preço contratual e efetivo",
+               f"{acima:,} com efetivo acima do contratual"
+               + (f" ({acima / com_ambos:.1%})" if com_ambos else ""),
+               f"⚠ {len(s):,} contratos com deriva atípica"]
+    if "adjudicante" in estat:
+        e = estat["adjudicante"]
+        e = e[e["n"] >= grupo_min].sort_values("media", ascending=False).head(5)
+        r.notas += ["Adjudicantes com maior deriva média:"] + [
+            f"  {nome[:50]:<50} ×{np.exp(m):.2f}  ({int(n):,} contratos)"
+            for nome, m, n in zip(e.index, e["media"], e["n"])]
+    r.notas.append("")
+    r.modelo = [
+        "  ┌ {objeto:.60}",
+        "  │ {nome_adjudicante:.40} → {nome_adjudicatario:.40}",
+        "  │ €{preco:,.0f} → €{preco_efetivo:,.0f}  (×{razao:.2f})  atípico por: {motivos}",
+        f"  └{'─'*53}\n",
+    ]
+    r.formatos = {"preco": ",.2f", "preco_efetivo": ",.2f", "razao": ".3f",
+                  **{f"z_{d}": ".2f" for d in estat}}
+    r.limite = 15
+    return r
+
+
+def analise_deriva(df, **kw):
+    """Deriva de preço sobre o conjunto inteiro (um só lote)."""
+    return analise_deriva_lotes(lambda: iter([df]), **kw)
+
+
+REGISTOS = DIR / "registos"
+
+
+def analise_cruzamentos(df, pasta=None, limiar=0.85):
+    """Cruza os adjudicatários com os registos externos em dados_base/registos/.
+
+    NIF exacto e nome aproximado (trigramas), ver cruzamento.py; uma linha
+    por contrato e entrada do registo encontrada.
+    """
+    pasta = pasta or REGISTOS
+    r = Resultado("cruzamentos", "🔍 CRUZAMENTO COM REGISTOS EXTERNOS", pd.DataFrame())
+    registos = cruzamento.carregar_registos(pasta)
+    if registos is None:
+        r.notas = [f"⚠ Sem registos em {pasta}/ (CSV com colunas nif e/ou nome)"]
+        return r
+
+    h = cruzamento.cruzar(df, registos, limiar=limiar)
+    contexto = [c for c in ["nome_adjudicante", "preco", "data_celebracao", "objeto"]
+                if c in df.columns]
+    linhas = df[contexto].iloc[h["contrato"].to_numpy()].reset_index(drop=True)
+    t = pd.concat([h.drop(columns="registo"), linhas], axis=1)
+    if "preco" in t.columns:
+        t = t.sort_values("preco", ascending=False, kind="stable").reset_index(drop=True)
+
+    r.tabela = t
+    r.notas = ["", f"{len(registos):,} entradas em {registos['fonte'].nunique()} registos"]
+    por_fonte = t.groupby("fonte")["contrato"].nunique() if len(t) else pd.Series(dtype=int)
+    r.notas += [f"⚠ {n:,} contratos com correspondência em {f}" for f, n in por_fonte.items()]
+    r.notas.append("")
+    r.modelo = [
+        "  ┌ {nome:.50}  (NIF {nif})",
+        "  │ ≈ {nome_registo:.50}  [{fonte}, {tipo} {semelhanca:.2f}]",
+        ["  │   {detalhe:.70}", "detalhe"],
+        "  │ ← {nome_adjudicante:.50}  €{preco:,.0f}",
+        f"  └{'─'*53}\n",
+    ]
+    r.formatos = {"preco": ",.2f", "semelhanca": ".2f"}
+    r.limite = 15
+    return r
+
+
+# Análises de que a pontuação de risco depende (ver risco.DETECTORES)
+RISCO_DEPENDE = ["fragmentacao", "temporal", "dominante", "deriva", "cruzamentos"]
+
+
+def analise_risco(df, feitos=None, longo=None, n=50):
+    """Pontuação de risco por contrato, juntando os sinais das outras análises.
+
+    Reaproveita os Resultados já calculados nesta execução (`feitos`) e
+    calcula os que faltam. Sinais e pontuação de todos os contratos ficam
+    em relatorios/risco.npz; a tabela tem os `n` contratos de maior risco.
+    """
+    feitos = dict(feitos or {})
+    if longo is None:
+        longo = partes.por_partes(df, COLUNAS_PARTES)
+    for nome in RISCO_DEPENDE:
+        if nome not in feitos:
+            feitos[nome] = ANALISES[nome](longo if nome in POR_PARTES else df)
+    sinais, pontuacao = risco.pontuar(df, feitos, longo)
+
+    RELATORIOS.mkdir(exist_ok=True)
+    extra = {"id_externo": df["id_externo"].to_numpy(dtype="U20")} if "id_externo" in df.columns else {}
+    np.savez_compressed(RELATORIOS / "risco.npz", sinais=sinais, pontuacao=pontuacao, **extra)
+
+    idx = risco.top(pontuacao, n)
+    contexto = [c for c in ["nome_adjudicante", "nome_adjudicatario", "objeto", "preco",
+                            "data_celebracao", "id_externo"] if c in df.columns]
+    t = df[contexto].iloc[idx].reset_index(drop=True)
+    t.insert(0, "pontuacao", pontuacao[idx])
+    t.insert(1, "gravidade", risco.gravidade(pontuacao[idx]))
+    t.insert(2, "sinais", sinais[idx])
+    t.insert(3, "detectores", risco.descrever(sinais[idx]))
+
+    r = Resultado("risco", "🔍 PONTUAÇÃO DE RISCO POR CONTRATO", t,
+                  descricao=f"   Os {len(t)} contratos com mais sinais (soma dos pesos dos detectores)")
+    r.notas = ["", f"{int((sinais > 0).sum()):,} de {len(df):,} contratos com pelo menos um sinal"]
+    g = pd.Series(risco.gravidade(pontuacao)).value_counts()
+    r.notas += [f"  {nome:<8} {int(g.get(nome, 0)):>9,}  (pontuação ≥ {limite})"
+                for limite, nome in risco.GRAVIDADES]
+    r.notas += ["Por detector:"] + [
+        f"  {nome:<14} {int(((sinais >> bit) & 1).sum()):>9,}  (peso {peso}) {descricao}"
+        for nome, (bit, peso, descricao) in risco.DETECTORES.items()]
+    if "nome_adjudicatario" in df.columns:
+        e = risco.por_entidade(df, sinais, pontuacao).head(5)
+        r.notas += ["Adjudicatários com maior pontuação acumulada:"] + [
+            f"  {str(nome)[:50]:<50} {c:>6,} contratos  €{x:,.0f}"
+            for nome, c, x in zip(e["nome_adjudicatario"], e["contratos"], e["exposicao"])]
+    r.notas.append("")
+    r.modelo = [
+        "  ┌ [{pontuacao}] {gravidade}: {detectores}",
+        "  │ {objeto:.60}",
+        "  │ {nome_adjudicante:.40} → {nome_adjudicatario:.40}  €{preco:,.0f}",
+        f"  └{'─'*53}\n",
+    ]
+    r.formatos = {"preco": ",.2f"}
+    r.limite = 20
+    return r
 
 
 def resumo(df):
     """Resumo do conjunto de dados."""
-    print(f"\n📊 RESUMO")
-    print("─" * 55)
-    print(f"  Registos:  {len(df):,}")
+    r = Resultado("resumo", "📊 RESUMO", pd.DataFrame())
+    r.notas = [f"Registos:  {len(df):,}"]
     if "preco" in df.columns:
         v = pd.to_numeric(df["preco"], errors="coerce")
-        print(f"  Valor total: €{v.sum():,.2f}")
-        print(f"  Mediana:     €{v.median():,.2f}")
+        r.notas += [f"Valor total: €{v.sum():,.2f}", f"Mediana:     €{v.median():,.2f}"]
     if "tipo_procedimento" in df.columns:
-        print(f"\n  Procedimentos:")
-        for proc, n in df["tipo_procedimento"].value_counts().head(8).items():
-            print(f"    {proc:<50} {n:>6,}")
+        vc = df["tipo_procedimento"].value_counts().head(8)
+        r.tabela = pd.DataFrame({"tipo_procedimento": vc.index, "n": vc.to_numpy()})
+        r.notas += ["", "Procedimentos:"]
+        r.modelo = ["    {tipo_procedimento:<50} {n:>6,}"]
     if "data_celebracao" in df.columns:
         d = pd.to_datetime(df["data_celebracao"], errors="coerce")
-        print(f"\n  Período: {d.min()} — {d.max()}")
+        r.rodape = ["", f"Período: {d.min()} — {d.max()}"]
+    return r
 
 
 # ════════════════════════════════════════
 # PRINCIPAL
 # ════════════════════════════════════════
 
-def main():
-    print("""
+def origem(caminho):
+    """Identifica a versão do ficheiro de origem do armazém."""
+    st = caminho.stat()
+    return {"ficheiro": caminho.name, "tamanho": st.st_size, "modificado": st.st_mtime}
+
+
+def armazem_actual():
+    """Manifesto do armazém, só se foi construído a partir do ficheiro local actual."""
+    m = armazem.manifesto()
+    fonte = ficheiro_local()
+    if m is None or fonte is None or m.get("origem") != origem(fonte):
+        return None
+    return m
+
+
+def ler_filtrado(args):
+    """Lê do armazém particionado só os contratos pedidos."""
+    print("\n═══ FASE 2: CARREGAMENTO (ARMAZÉM) ═══")
+    inicio = datetime.now()
+    df, lidas = armazem.ler(ano=args.ano, adjudicante=args.adjudicante, nif=args.nif)
+    total = len(armazem.manifesto()["particoes"])
+    segundos = (datetime.now() - inicio).total_seconds()
+    print(f"\n  → {lidas} de {total:,} partições lidas em {segundos:.2f}s")
+    print(f"  → {len(df):,} registos")
+    return df
+
+
+def carregar_tudo():
+    """Descarrega (se preciso), carrega, normaliza e actualiza o armazém."""
+    if ficheiro_local() is None:
+        # Sem cópia local: descarregar, ler e gravar o armazém em simultâneo
+        print("\n═══ FASE 1+2: DESCARREGAMENTO E CARREGAMENTO ═══\n")
+        df = carregar_em_fluxo(DIR / "portal_base.csv")
+        if df is not None:
+            return df
+    
+    caminho = obter_dados(tentar_completo=False)
+    
+    if caminho is None:
+        sys.exit(1)
+    
+    print("\n═══ FASE 2: CARREGAMENTO ═══")
+    df = carregar(caminho)
+    if df is None:
+        sys.exit(1)
+    
+    df = normalizar(df)
+    
+    # external_id da aplicação Rails: calculado sobre o texto original
+    df["id_externo"] = bd_rails.id_externo(df)
+    df = tipar(df)
+    
+    # Armazém particionado para as execuções filtradas seguintes
+    fonte = ficheiro_local()
+    if fonte and armazem_actual() is None:
+        armazem.gravar(df, origem=origem(fonte))
+        print(f"  ✓ Armazém: {len(armazem.manifesto()['particoes']):,} partições em {armazem.RAIZ}")
+    return df
+
+
+ANALISES = {
+    "fragmentacao": analise_fragmentacao,
+    "sensibilidade": analise_sensibilidade,
+    "temporal": analise_temporal,
+    "dominante": analise_dominante,
+    "top": analise_top,
+    "deriva": analise_deriva,
+    "cruzamentos": analise_cruzamentos,
+    "risco": analise_risco,
+}
+
+# Análises que também correm lote a lote sobre o armazém (`analyse --lotes`)
+EM_LOTES = {"deriva": analise_deriva_lotes}
+
+# Análises que agregam por parte (consórcios explodidos, ver partes.py)
+POR_PARTES = {"fragmentacao", "sensibilidade", "dominante", "top"}
+# Colunas do contrato que essas análises lêem na tabela longa, além das partes
+COLUNAS_PARTES = ["preco", "tipo_procedimento"]
+
+RELATORIOS = DIR / "relatorios"
+
+BANNER = """
 ╔══════════════════════════════════════════════════════╗
 ║  OBSERVATÓRIO DE INTEGRIDADE — PORTUGAL             ║
 ║  Extração Portal BASE v3                            ║
@@ -460,43 +1052,320 @@ def main():
 ║  Fonte: transparencia.sns.gov.pt (Portal BASE)      ║
 ║  Licença: Dados abertos — Domínio Público           ║
 ╚══════════════════════════════════════════════════════╝
-    """)
+    """
+
+
+def executar_analises(df, nomes, args):
+    """Corre as análises pedidas, mostra-as e guarda-as para `report`.
+
+    Guarda a tabela de cada resultado (para outros formatos) e o texto já
+    renderizado para o terminal (para `report` sem pandas).
+    """
+    RELATORIOS.mkdir(exist_ok=True)
+    longo = None
+    feitos = {}
+    for nome in ["resumo"] + nomes:
+        funcao = resumo if nome == "resumo" else ANALISES[nome]
+        if nome == "risco":
+            # Junta os resultados anteriores; calcula só os que faltam
+            if longo is None:
+                longo = partes.por_partes(df, COLUNAS_PARTES)
+            r = funcao(df, feitos, longo)
+        elif nome in POR_PARTES:
+            # A tabela contrato × parte calcula-se uma vez para todas
+            if longo is None:
+                longo = partes.por_partes(df, COLUNAS_PARTES)
+            r = funcao(longo)
+        else:
+            r = funcao(df)
+        feitos[nome] = r
+        mostrar_e_guardar(r)
+        if nome == "resumo":
+            print("\n═══ FASE 3: ANÁLISE ═══")
+    gravar_indice(["resumo"] + nomes, len(df), args)
+
+
+def mostrar_e_guardar(r):
+    texto = apresentacao.terminal(r)
+    print(texto, end="")
+    resultados.guardar(r, RELATORIOS)
+    (RELATORIOS / f"{r.nome}.txt").write_text(texto, encoding="utf-8")
+
+
+def gravar_indice(nomes, registos, args):
+    indice = {
+        "gerado_em": datetime.now().isoformat(timespec="seconds"),
+        "filtros": {"ano": args.ano, "adjudicante": args.adjudicante, "nif": args.nif},
+        "registos": registos,
+        "analises": nomes,
+    }
+    (RELATORIOS / "indice.json").write_text(
+        json.dumps(indice, ensure_ascii=False, indent=1), encoding="utf-8")
+
+
+def executar_em_lotes(nomes, args):
+    """Corre as análises com modo por lotes, partição a partição do armazém.
+
+    O armazém entrega lotes de ~`args.lotes` registos (partições grandes
+    partidas em grupos de blocos, no mínimo um bloco de armazem.BLOCO
+    linhas), por isso a memória fica limitada a isso de cada vez.
+    """
+    if armazem_actual() is None:
+        carregar_tudo()
+    ignoradas = [n for n in nomes if n not in EM_LOTES]
+    if ignoradas:
+        print(f"  ⚠ Sem modo por lotes (ignoradas): {', '.join(ignoradas)}")
+    nomes = [n for n in nomes if n in EM_LOTES]
+    vistos = []
+
+    def lotes():
+        n = 0
+        for lote in armazem.lotes(ano=args.ano, adjudicante=args.adjudicante,
+                                  nif=args.nif, linhas=args.lotes):
+            n += len(lote)
+            yield lote
+        vistos.append(n)
+
+    RELATORIOS.mkdir(exist_ok=True)
+    print("\n═══ FASE 3: ANÁLISE (POR LOTES) ═══")
+    for nome in nomes:
+        mostrar_e_guardar(EM_LOTES[nome](lotes))
+    gravar_indice(nomes, vistos[0] if vistos else 0, args)
+
+
+def carregar_para_analise(args):
+    """Dados para as análises.
+
+    Com filtros, lê do armazém (reconstruído antes se o ficheiro local
+    mudou); sem filtros, o CSV em memória é mais rápido que o armazém.
+    """
+    filtrado = args.ano is not None or args.adjudicante or args.nif
+    if filtrado and armazem_actual() is not None:
+        return ler_filtrado(args)
+    df = carregar_tudo()
+    return ler_filtrado(args) if filtrado else df
+
+
+# ════════════════════════════════════════
+# SUBCOMANDOS
+# ════════════════════════════════════════
+
+def cmd_sync(args):
+    """Descarrega o CSV completo (pedido condicional: 304 se nada mudou)."""
+    _importar()
+    print("\n═══ FASE 1: DESCARREGAMENTO ═══\n")
+    path = DIR / "portal_base.csv"
+    if not descarregar_completo(path):
+        if obter_dados(tentar_completo=False) is None:
+            sys.exit(1)
+    if armazem.manifesto() is not None and armazem_actual() is None:
+        print("  ⚠ Armazém desactualizado: é reconstruído no próximo load/analyse")
+
+
+def cmd_load(args):
+    """Carrega, normaliza e (re)constrói o armazém particionado."""
+    _importar()
+    carregar_tudo()
+
+
+def cmd_analyse(args):
+    """Corre uma análise (ou todas) sobre o armazém, com os filtros dados."""
+    _importar()
+    nomes = list(ANALISES) if args.nome == "todas" else [args.nome]
+    if args.lotes:
+        executar_em_lotes(nomes, args)
+        return
+    df = carregar_para_analise(args)
+    executar_analises(df, nomes, args)
+
+
+def cmd_report(args):
+    """Mostra os resultados guardados da última análise, sem ler os dados."""
+    caminho = RELATORIOS / "indice.json"
+    # `diff` guarda o seu resultado sem índice de análises
+    avulso = args.nome and (RELATORIOS / f"{args.nome}.json").exists()
+    if not caminho.exists() and not avulso:
+        print("  ✗ Sem análises guardadas. Corre primeiro: extrair_base.py analyse todas")
+        sys.exit(1)
+    indice = json.loads(caminho.read_text(encoding="utf-8")) if caminho.exists() else None
+    nomes = [args.nome] if args.nome else indice["analises"]
     
-    caminho = obter_dados()
+    if args.formato == "terminal":
+        # Texto já renderizado: não é preciso importar o pandas
+        if indice:
+            filtros = {k: v for k, v in indice["filtros"].items() if v is not None}
+            print(f"\n  Relatório de {indice['gerado_em']} — {indice['registos']:,} registos"
+                  + (f" — filtros: {filtros}" if filtros else ""))
+        for nome in nomes:
+            f = RELATORIOS / f"{nome}.txt"
+            if f.exists():
+                print(f.read_text(encoding="utf-8"), end="")
+            else:
+                print(f"\n  ⚠ Análise não guardada: {nome}")
+        return
     
-    if caminho is None:
+    _importar()
+    for nome in nomes:
+        if (RELATORIOS / f"{nome}.json").exists():
+            sys.stdout.write(apresentacao.renderizar(resultados.carregar(nome, RELATORIOS),
+                                                     args.formato))
+
+
+def cmd_export(args):
+    """Escreve contratos e entidades na base de dados SQLite da aplicação Rails."""
+    _importar()
+    df = carregar_para_analise(args)
+    print(f"\n═══ EXPORTAÇÃO: {args.bd} ═══\n")
+    inicio = datetime.now()
+    try:
+        n = bd_rails.exportar(df, args.bd, staging=not args.sem_staging)
+    except FileNotFoundError as e:
+        print(f"  ✗ {e}")
         sys.exit(1)
-    
-    print("\n═══ FASE 2: CARREGAMENTO ═══")
-    df = carregar(caminho)
-    if df is None:
+    segundos = (datetime.now() - inicio).total_seconds()
+    print(f"  ✓ {n['contratos']:,} contratos, {n['entidades']:,} entidades, "
+          f"{n['vencedores']:,} adjudicatários em {segundos:.1f}s")
+
+
+def _chave_contrato(lote):
+    """Identidade de cada registo de um lote em bruto, sem o preço (ver bd_rails.id_estavel)."""
+    return bd_rails.id_estavel(lote.rename(columns=mapa_colunas(lote.columns)))
+
+
+def cmd_snapshots(args):
+    """Lista os instantâneos arquivados dos descarregamentos."""
+    _importar()
+    indice = instantaneos.ler_indice()
+    if not indice:
+        print("  Sem instantâneos. Corre primeiro: extrair_base.py sync")
+        return
+    print()
+    for i, e in enumerate(indice, 1):
+        print(f"  {i:>3}. {e['data']}  {e['sha256'][:12]}  {e['tamanho']/1e6:>8.1f} MB "
+              f"→ {e['comprimido']/1e6:>7.1f} MB  {e['fonte']}")
+
+
+def cmd_diff(args):
+    """Contratos adicionados, removidos e modificados entre dois instantâneos."""
+    _importar()
+    try:
+        a, b = instantaneos.resolver(args.a), instantaneos.resolver(args.b)
+    except KeyError as e:
+        print(f"  ✗ {e.args[0]}  (ver: extrair_base.py snapshots)")
         sys.exit(1)
+    inicio = datetime.now()
+    t, resumo = instantaneos.diferencas(a, b, chave=_chave_contrato)
+    segundos = (datetime.now() - inicio).total_seconds()
+
+    r = Resultado("diferencas", "🔍 DIFERENÇAS ENTRE DESCARREGAMENTOS",
+                  t.rename(columns=mapa_colunas(t.columns)),
+                  descricao=f"   {a['sha256'][:12]} ({a['data']}) → {b['sha256'][:12]} ({b['data']})")
+    r.notas = [
+        "",
+        f"{resumo['registos_a']:,} → {resumo['registos_b']:,} registos  ({segundos:.1f}s)",
+        f"+ {resumo['adicionados']:,} adicionados",
+        f"− {resumo['removidos']:,} removidos",
+        f"~ {resumo['modificados']:,} modificados",
+    ]
+    if resumo["colunas_novas"] or resumo["colunas_retiradas"]:
+        r.notas.append(f"⚠ Colunas novas: {resumo['colunas_novas']}  "
+                       f"retiradas: {resumo['colunas_retiradas']}")
+    r.notas.append("")
+    r.modelo = [
+        "  {estado:<10} {chave}  {objeto:.60}",
+        "             {nome_adjudicante:.40} → {nome_adjudicatario:.40}  {preco}",
+        ["             Δ {alteracoes:.200}", "alteracoes"],
+    ]
+    r.limite = args.limite
+    texto = apresentacao.terminal(r)
+    print(texto, end="")
+    RELATORIOS.mkdir(exist_ok=True)
+    resultados.guardar(r, RELATORIOS)
+    (RELATORIOS / "diferencas.txt").write_text(texto, encoding="utf-8")
+
+
+def cmd_tudo(args):
+    """Pipeline completo (comportamento sem subcomando)."""
+    _importar()
+    filtrado = args.ano is not None or args.adjudicante or args.nif
+    print(BANNER)
     
-    df = normalizar(df)
-    resumo(df)
+    if filtrado and armazem_actual() is not None:
+        df = ler_filtrado(args)
+    else:
+        df = carregar_tudo()
+        if filtrado:
+            df = ler_filtrado(args)
     
-    print("\n═══ FASE 3: ANÁLISE ═══")
-    analise_fragmentacao(df)
-    analise_temporal(df)
-    analise_dominante(df)
-    analise_top(df)
+    executar_analises(df, list(ANALISES), args)
     
-    # Exportar resultado limpo
-    saida = DIR / "resultado.csv"
-    df.to_csv(saida, index=False, encoding="utf-8-sig")
-    print(f"\n  ✓ Exportado: {saida}")
+    # Exportar resultado limpo (só nas execuções completas)
+    if not filtrado:
+        saida = DIR / "resultado.csv"
+        df.to_csv(saida, index=False, encoding="utf-8-sig")
+        print(f"\n  ✓ Exportado: {saida}")
     
     print(f"""
 {'═'*55}
   Concluído. {len(df):,} contratos analisados.
   
-  Próximos passos:
-  · Cruzar NIPC com Registo Comercial (sócios/gerentes)
-  · Cruzar nomes com listas de autarcas e deputados
-  · Cruzar com doações a partidos (ECFP/CNE)
+  Próximos passos (cruzamentos):
+  · Coloca em {REGISTOS}/ os CSV do Registo Comercial (sócios/gerentes),
+    listas de autarcas e deputados e doações a partidos (ECFP/CNE)
+  · python extrair_base.py analyse cruzamentos
 {'═'*55}
     """)
 
 
+def argumentos(argv=None):
+    filtros = argparse.ArgumentParser(add_help=False)
+    filtros.add_argument("--ano", type=int, help="só contratos celebrados neste ano")
+    filtros.add_argument("--adjudicante", help="parte do nome da entidade adjudicante")
+    filtros.add_argument("--nif", help="NIF do adjudicante ou do adjudicatário")
+
+    ap = argparse.ArgumentParser(description="Extração e análise do Portal BASE",
+                                 parents=[filtros])
+    ap.set_defaults(funcao=cmd_tudo)
+    sub = ap.add_subparsers(title="subcomandos")
+
+    sub.add_parser("sync", help=cmd_sync.__doc__).set_defaults(funcao=cmd_sync)
+    sub.add_parser("load", help=cmd_load.__doc__).set_defaults(funcao=cmd_load)
+
+    a = sub.add_parser("analyse", help=cmd_analyse.__doc__, parents=[filtros])
+    a.add_argument("nome", choices=list(ANALISES) + ["todas"])
+    a.add_argument("--lotes", type=int, nargs="?", const=200000, metavar="REGISTOS",
+                   help="ler o armazém aos bocados (só análises com modo por lotes)")
+    a.set_defaults(funcao=cmd_analyse)
+
+    r = sub.add_parser("report", help=cmd_report.__doc__)
+    r.add_argument("nome", nargs="?", choices=["resumo"] + list(ANALISES) + ["diferencas"])
+    r.add_argument("--formato", default="terminal",
+                   choices=["terminal", "jsonl", "md", "html", "csv"])
+    r.set_defaults(funcao=cmd_report)
+
+    e = sub.add_parser("export", help=cmd_export.__doc__, parents=[filtros])
+    e.add_argument("--bd", default=Path(__file__).resolve().parent.parent / "storage" / "development.sqlite3",
+                   type=Path, help="base de dados SQLite (por omissão storage/development.sqlite3)")
+    e.add_argument("--sem-staging", action="store_true",
+                   help="upsert directo em cada lote, sem tabelas temporárias")
+    e.set_defaults(funcao=cmd_export)
+
+    sub.add_parser("snapshots", help=cmd_snapshots.__doc__).set_defaults(funcao=cmd_snapshots)
+    d = sub.add_parser("diff", help=cmd_diff.__doc__)
+    d.add_argument("a", nargs="?", default="-2", help="instantâneo antigo (nº ou SHA-256; por omissão o penúltimo)")
+    d.add_argument("b", nargs="?", default="-1", help="instantâneo novo (por omissão o último)")
+    d.add_argument("--limite", type=int, default=30, help="registos a mostrar no terminal")
+    d.set_defaults(funcao=cmd_diff)
+    return ap.parse_args(argv)
+
+
+def main(argv=None):
+    args = argumentos(argv)
+    try:
+        args.funcao(args)
+    finally:
+        esperar_arquivos()
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
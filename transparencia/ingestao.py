@@ -0,0 +1,128 @@
+"""
+Ingestão em fluxo
+==================
+
+Lê o CSV do portal enquanto ainda está a chegar: uma thread recebe os
+bytes da rede (e grava-os na cache HTTP), a thread principal vai
+interpretando-os com o leitor incremental do pandas. A transferência e a
+leitura sobrepõem-se, em vez de se somarem.
+
+  for lote in lotes_em_fluxo(url):
+      ...                     # DataFrame com `linhas` registos
+"""
+
+import io
+import queue
+import threading
+
+import pandas as pd
+
+import cache_http
+
+_FIM = object()
+
+
+class FluxoBytes(io.RawIOBase):
+    """Ficheiro só de leitura alimentado por uma fila de pedaços de bytes."""
+
+    def __init__(self, fila):
+        self._fila = fila
+        self._resto = b""
+        self._acabou = False
+
+    def readable(self):
+        return True
+
+    def _proximo(self):
+        item = self._fila.get()
+        if item is _FIM:
+            self._acabou = True
+            return b""
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    def espreitar(self):
+        """Primeiro pedaço disponível, sem o consumir."""
+        while not self._resto and not self._acabou:
+            self._resto = self._proximo()
+        return self._resto
+
+    def readinto(self, b):
+        while not self._resto and not self._acabou:
+            self._resto = self._proximo()
+        n = min(len(b), len(self._resto))
+        b[:n] = self._resto[:n]
+        self._resto = self._resto[n:]
+        return n
+
+
+def _receber(resposta, gravador, fila, parar, estado):
+    """Thread produtora: rede → cache + fila."""
+    try:
+        for pedaço in resposta.iter_content(1 << 20):
+            if parar.is_set():
+                gravador.abortar()
+                return
+            gravador.escrever(pedaço)
+            estado["recebido"] = resposta.raw.tell()
+            fila.put(pedaço)
+        estado["objeto"] = gravador.concluir()
+        fila.put(_FIM)
+    except BaseException as e:
+        gravador.abortar()
+        fila.put(e)
+    finally:
+        resposta.close()
+
+
+def detectar_separador(amostra):
+    """Escolhe entre ';', ',' e tabulação pela primeira linha."""
+    linha = amostra.split(b"\n", 1)[0]
+    return max([";", ",", "\t"], key=lambda s: linha.count(s.encode()))
+
+
+def lotes_em_fluxo(url, params=None, linhas=50000, timeout=300, estado=None):
+    """Gera DataFrames de `linhas` registos à medida que o CSV é recebido.
+
+    Se o servidor responder 304, lê os mesmos lotes da cópia em cache.
+    Todas as colunas chegam como texto, para que os lotes tenham o mesmo
+    esquema; a conversão de tipos fica para depois.
+    `estado` (dict opcional) recebe "recebido" (bytes da rede) e "objeto".
+    """
+    estado = {} if estado is None else estado
+    r, e = cache_http.pedido_condicional(url, params, timeout)
+
+    if r.status_code == 304:
+        r.close()
+        objeto = cache_http.caminho_objeto(e["sha256"])
+        estado["objeto"] = objeto
+        with open(objeto, "rb") as f:
+            sep = detectar_separador(f.read(65536))
+        yield from pd.read_csv(objeto, sep=sep, encoding="utf-8-sig",
+                               dtype=str, chunksize=linhas)
+        return
+
+    # Fila limitada: se a leitura atrasar, a rede espera (memória constante)
+    fila = queue.Queue(maxsize=64)
+    parar = threading.Event()
+    g = cache_http.Gravador(url, params, r)
+    t = threading.Thread(target=_receber, args=(r, g, fila, parar, estado), daemon=True)
+    t.start()
+
+    fluxo = FluxoBytes(fila)
+    try:
+        sep = detectar_separador(fluxo.espreitar())
+        leitor = pd.read_csv(io.BufferedReader(fluxo, 1 << 20), sep=sep,
+                             encoding="utf-8-sig", dtype=str, chunksize=linhas)
+        with leitor:
+            yield from leitor
+    finally:
+        parar.set()
+        # Desbloquear a produtora se estiver à espera de espaço na fila
+        while t.is_alive():
+            try:
+                fila.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        t.join()
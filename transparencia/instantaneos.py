@@ -0,0 +1,285 @@
+"""
+Arquivo de instantâneos e diferenças entre descarregamentos
+============================================================
+
+Cada descarregamento do portal fica guardado, comprimido com zstd, num
+arquivo endereçado pelo conteúdo — o mesmo CSV descarregado duas vezes
+ocupa espaço uma só vez:
+
+  dados_base/instantaneos/
+    indice.json                    lista por ordem: sha256, data, fonte, tamanhos
+    objetos/ab/abcdef....csv.zst   CSV original comprimido
+
+Sem o pacote `zstandard` usa-se gzip (biblioteca padrão).
+
+`diferencas(a, b, chave)` compara dois instantâneos em fluxo, por lotes:
+primeiro só se guardam dois inteiros por registo (hash da chave do
+contrato e hash do registo inteiro), que se juntam de forma vectorizada
+(ordenação + searchsorted); depois uma segunda passagem vai buscar apenas
+os registos adicionados, removidos ou modificados. Nenhum dos dois CSV é
+carregado inteiro em memória.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+RAIZ = Path("dados_base") / "instantaneos"
+LINHAS = 200000
+BLOCO = 1 << 20
+
+
+# ════════════════════════════════════════
+# ARQUIVO
+# ════════════════════════════════════════
+
+def ler_indice(raiz=RAIZ):
+    caminho = raiz / "indice.json"
+    if not caminho.exists():
+        return []
+    return json.loads(caminho.read_text(encoding="utf-8"))
+
+
+def _gravar_indice(indice, raiz):
+    fd, tmp = tempfile.mkstemp(dir=raiz, suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(indice, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, raiz / "indice.json")
+
+
+def caminho_objeto(entrada, raiz=RAIZ):
+    sha = entrada["sha256"]
+    return raiz / "objetos" / sha[:2] / f"{sha}.csv.{entrada['compressao']}"
+
+
+def _comprimir(origem, destino, sha=None):
+    """Comprime `origem` para `destino`; calcula o SHA-256 ao mesmo tempo se não vier dado."""
+    h = hashlib.sha256() if sha is None else None
+    with open(origem, "rb") as fin, open(destino, "wb") as fout:
+        if zstandard is not None:
+            saida = zstandard.ZstdCompressor(level=10, threads=-1).stream_writer(fout, closefd=False)
+        else:
+            saida = gzip.GzipFile(fileobj=fout, mode="wb", compresslevel=6)
+        with saida:
+            while bloco := fin.read(BLOCO):
+                if h is not None:
+                    h.update(bloco)
+                saida.write(bloco)
+    return sha or h.hexdigest()
+
+
+def guardar(caminho, fonte="completo", sha=None, raiz=RAIZ):
+    """Arquiva um descarregamento; devolve a entrada do índice.
+
+    `sha` (o SHA-256 do conteúdo) evita reler o ficheiro quando já é
+    conhecido, p.ex. pela cache HTTP. Se o conteúdo já estiver arquivado
+    só se acrescenta ao índice quando difere do último instantâneo.
+    """
+    caminho = Path(caminho)
+    (raiz / "objetos").mkdir(parents=True, exist_ok=True)
+    indice = ler_indice(raiz)
+    existente = next((e for e in indice if e["sha256"] == sha), None) if sha else None
+
+    if existente is None:
+        fd, tmp = tempfile.mkstemp(dir=raiz / "objetos", suffix=".tmp")
+        os.close(fd)
+        sha = _comprimir(caminho, tmp, sha)
+        existente = next((e for e in indice if e["sha256"] == sha), None)
+        if existente is None:
+            entrada = {"sha256": sha, "compressao": "zst" if zstandard else "gz",
+                       "tamanho": caminho.stat().st_size, "comprimido": os.path.getsize(tmp)}
+            destino = caminho_objeto(entrada, raiz)
+            destino.parent.mkdir(exist_ok=True)
+            os.chmod(tmp, 0o644)            # mkstemp cria com 0600
+            os.replace(tmp, destino)
+        else:
+            os.remove(tmp)
+    if existente is not None:
+        entrada = {k: existente[k] for k in ["sha256", "compressao", "tamanho", "comprimido"]}
+
+    if indice and indice[-1]["sha256"] == entrada["sha256"]:
+        return indice[-1]
+    entrada.update({"data": datetime.now().isoformat(timespec="seconds"),
+                    "fonte": fonte, "ficheiro": caminho.name})
+    indice.append(entrada)
+    _gravar_indice(indice, raiz)
+    return entrada
+
+
+def resolver(ref, raiz=RAIZ):
+    """Entrada do índice por posição (1, 2, … ou -1 = último) ou prefixo do SHA-256."""
+    indice = ler_indice(raiz)
+    try:
+        n = int(ref)
+        return indice[n - 1 if n > 0 else n]
+    except ValueError:
+        achados = [e for e in indice if e["sha256"].startswith(str(ref))]
+        if len(achados) != 1:
+            raise KeyError(f"instantâneo ambíguo ou inexistente: {ref}")
+        return achados[0]
+    except IndexError:
+        raise KeyError(f"não há instantâneo {ref} ({len(indice)} arquivados)")
+
+
+def abrir(entrada, raiz=RAIZ):
+    """Fluxo binário com o CSV descomprimido."""
+    f = open(caminho_objeto(entrada, raiz), "rb")
+    if entrada["compressao"] == "gz":
+        return gzip.GzipFile(fileobj=f)
+    if zstandard is None:
+        f.close()
+        raise RuntimeError("Instala: pip install zstandard (instantâneo comprimido com zstd)")
+    return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f, closefd=True))
+
+
+# ════════════════════════════════════════
+# LEITURA POR LOTES
+# ════════════════════════════════════════
+
+def cabecalho(entrada, raiz=RAIZ):
+    """(separador, colunas) a partir da primeira linha."""
+    with abrir(entrada, raiz) as f:
+        linha = f.readline().decode("utf-8-sig", errors="replace").rstrip("\r\n")
+    sep = max([";", ",", "\t"], key=linha.count)
+    return sep, pd.read_csv(io.StringIO(linha), sep=sep, nrows=0).columns.tolist()
+
+
+def lotes(entrada, colunas, linhas=LINHAS, raiz=RAIZ):
+    """Lotes de texto (vazio = "") com as `colunas` pela ordem dada."""
+    sep, _ = cabecalho(entrada, raiz)
+    with abrir(entrada, raiz) as f:
+        for lote in pd.read_csv(f, sep=sep, dtype=str, keep_default_na=False, usecols=colunas,
+                                chunksize=linhas, encoding="utf-8-sig", encoding_errors="replace"):
+            yield lote[colunas]
+
+
+# ════════════════════════════════════════
+# DIFERENÇAS
+# ════════════════════════════════════════
+
+def _hash(x):
+    return pd.util.hash_pandas_object(x, index=False).to_numpy()
+
+
+def _chave_por_omissao(lote):
+    """idcontrato quando existe; senão o próprio registo (só adições e remoções)."""
+    for c in lote.columns:
+        if c.lower().replace("_", "") == "idcontrato":
+            return lote[c]
+    return pd.Series(_hash(lote), index=lote.index).astype(str)
+
+
+def _assinaturas(entrada, colunas, chave, raiz):
+    """(chave, hash do registo, nº da linha), ordenados pela chave.
+
+    Uma chave repetida no ficheiro junta o nº de ocorrência ao hash (a
+    n-ésima linha com essa chave em `a` compara-se com a n-ésima em `b`),
+    por isso cada linha tem a sua chave e as contagens são de linhas.
+    """
+    ks, hs = [], []
+    for lote in lotes(entrada, colunas, raiz=raiz):
+        ks.append(_hash(chave(lote)))
+        hs.append(_hash(lote))
+    k = np.concatenate(ks) if ks else np.empty(0, "uint64")
+    h = np.concatenate(hs) if hs else np.empty(0, "uint64")
+    linha = np.argsort(k, kind="stable")
+    k, h = k[linha], h[linha]
+    if not len(k):
+        return k, h, linha
+    inicio = np.r_[True, k[1:] != k[:-1]]
+    ocorrencia = np.arange(len(k)) - np.maximum.accumulate(np.where(inicio, np.arange(len(k)), 0))
+    if ocorrencia.any():
+        k = k + ocorrencia.astype("uint64") * np.uint64(0x9E3779B97F4A7C15)
+        ordem = np.argsort(k, kind="stable")
+        k, h, linha = k[ordem], h[ordem], linha[ordem]
+    return k, h, linha
+
+
+def _recolher(entrada, colunas, chave, linhas, k, raiz):
+    """Registos nas `linhas` dadas (ordenadas), numa passagem, com a chave `k` de cada uma."""
+    partes, inicio = [], 0
+    for lote in lotes(entrada, colunas, raiz=raiz):
+        pos = np.arange(inicio, inicio + len(lote))
+        inicio += len(lote)
+        m = np.isin(pos, linhas)
+        if m.any():
+            partes.append(lote[m].assign(_chave=chave(lote)[m].to_numpy(),
+                                         _k=k[np.searchsorted(linhas, pos[m])]))
+    if not partes:
+        return pd.DataFrame(columns=colunas + ["_chave", "_k"])
+    return pd.concat(partes, ignore_index=True)
+
+
+def diferencas(a, b, chave=None, raiz=RAIZ):
+    """Contratos adicionados, removidos e modificados de `a` para `b`.
+
+    `chave(lote)` devolve o identificador de cada contrato (Series de
+    texto); chaves repetidas emparelham-se pela ordem em que aparecem. Compara só as colunas comuns aos dois instantâneos; devolve
+    (tabela, resumo) com `estado`, `chave`, `alteracoes` e as colunas
+    do registo (o novo, para os modificados).
+    """
+    chave = chave or _chave_por_omissao
+    _, ca = cabecalho(a, raiz)
+    _, cb = cabecalho(b, raiz)
+    colunas = [c for c in ca if c in cb]
+
+    ka, ha, la = _assinaturas(a, colunas, chave, raiz)
+    kb, hb, lb = _assinaturas(b, colunas, chave, raiz)
+    pos = np.searchsorted(ka, kb)
+    pos_ok = np.minimum(pos, max(len(ka) - 1, 0))
+    em_a = (pos < len(ka)) & (ka[pos_ok] == kb) if len(ka) else np.zeros(len(kb), bool)
+    visto = np.zeros(len(ka), bool)
+    visto[pos[em_a]] = True
+    mod_b = em_a & (ha[pos_ok] != hb)
+    mod_a = np.zeros(len(ka), bool)
+    mod_a[pos[mod_b]] = True
+    adicionados, modificados, removidos = kb[~em_a], kb[mod_b], ka[~visto]
+
+    sel_a, sel_b = ~visto | mod_a, ~em_a | mod_b
+    ordem_a, ordem_b = np.argsort(la[sel_a]), np.argsort(lb[sel_b])
+    antes = _recolher(a, colunas, chave, la[sel_a][ordem_a], ka[sel_a][ordem_a], raiz)
+    depois = _recolher(b, colunas, chave, lb[sel_b][ordem_b], kb[sel_b][ordem_b], raiz)
+
+    estado_antes = np.where(np.isin(antes["_k"], removidos), "removido", "modificado")
+    estado_depois = np.where(np.isin(depois["_k"], adicionados), "adicionado", "modificado")
+    tabela = pd.concat([
+        depois.assign(estado=estado_depois),
+        antes[estado_antes == "removido"].assign(estado="removido"),
+    ], ignore_index=True)
+    tabela["alteracoes"] = ""
+
+    # Colunas alteradas dos modificados: antes e depois alinhados pela chave
+    mod = tabela["estado"].eq("modificado")
+    if mod.any():
+        velho = antes.set_index("_k").reindex(tabela.loc[mod, "_k"])[colunas].to_numpy()
+        novo = tabela.loc[mod, colunas].to_numpy()
+        diff = velho != novo
+        tabela.loc[mod, "alteracoes"] = [
+            "; ".join(f"{colunas[j]}: {velho[i, j]} → {novo[i, j]}" for j in np.flatnonzero(d))
+            for i, d in enumerate(diff)]
+
+    ordem = {"adicionado": 0, "modificado": 1, "removido": 2}
+    tabela = (tabela.sort_values("estado", key=lambda s: s.map(ordem), kind="stable")
+              .drop(columns="_k").rename(columns={"_chave": "chave"}).reset_index(drop=True))
+    tabela = tabela[["estado", "chave", "alteracoes"] + colunas]
+    resumo = {
+        "registos_a": len(ka), "registos_b": len(kb),
+        "adicionados": len(adicionados), "removidos": len(removidos),
+        "modificados": len(modificados),
+        "colunas_novas": [c for c in cb if c not in ca],
+        "colunas_retiradas": [c for c in ca if c not in cb],
+    }
+    return tabela, resumo
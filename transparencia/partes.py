@@ -0,0 +1,144 @@
+"""
+Partes dos contratos (consórcios e aquisições conjuntas)
+=========================================================
+
+No export do SNS (`list_separator: "|"`), `nifs_das_adjudicatarias` e
+`nifs_dos_adjudicantes` podem ter vários NIFs: "509000101|509000102".
+Tratados como texto, os consórcios ficam agrupados sob uma chave
+concatenada que não corresponde a nenhuma empresa real.
+
+Aqui essas colunas passam a uma tabela longa contrato → parte, como o
+modelo `ContractWinner` da aplicação Rails:
+
+  contrato  nif        nif_cod     nome                 n_partes
+  17        509000101  509000101   TecnoServ, Lda.      2
+  17        509000102  509000102   Digital360, Lda.     2
+
+Só as linhas que têm o separador são divididas e "explodidas"; as
+restantes (a grande maioria) passam directamente. NIFs e nomes ficam
+como categorias e `nif_cod` como inteiro (-1 quando não é numérico).
+"""
+
+import numpy as np
+import pandas as pd
+
+SEP = "|"
+
+PAPEIS = {
+    "adjudicatario": ("nipc_adjudicatario", "nome_adjudicatario"),
+    "adjudicante": ("nipc_adjudicante", "nome_adjudicante"),
+}
+
+
+def _categoria(valores):
+    """Categórica de texto limpo, via factorize.
+
+    Muito mais rápido do que astype("category") em colunas de texto, e o
+    strip() só corre sobre os valores distintos.
+    """
+    codigos, unicos = pd.factorize(pd.Series(valores, dtype=object))
+    limpos = pd.Series(unicos, dtype="string").str.strip()
+    limpos = limpos.where(limpos.ne(""))
+    c2, u2 = pd.factorize(limpos)
+    if len(c2):
+        # Sem valores (coluna vazia) os códigos já são todos -1; c2[-1] falharia
+        codigos = np.where(codigos >= 0, c2[codigos], -1)
+    return pd.Categorical.from_codes(codigos, pd.Index(u2, dtype="string"))
+
+
+def _coluna(df, c):
+    if c in df.columns:
+        s = df[c]
+        # NIFs lidos como números não podem ter separador; via Int64 para que
+        # 509000101.0 (float, por causa de vazios) fique "509000101"
+        if pd.api.types.is_numeric_dtype(s):
+            return s.round().astype("Int64").astype("string")
+        return s
+    return pd.Series(pd.NA, index=df.index, dtype=object)
+
+
+def arestas(df, papel="adjudicatario", sep=SEP):
+    """Uma linha por (contrato, parte); `contrato` é a posição da linha em df."""
+    cn, cm = PAPEIS[papel]
+    nif, nome = _coluna(df, cn), _coluna(df, cm)
+    pos = np.arange(len(df), dtype="int64")
+    if nif.isna().all():
+        multi = np.zeros(len(df), dtype=bool)
+    else:
+        multi = nif.str.contains(sep, regex=False).fillna(False).to_numpy(dtype=bool)
+
+    contratos = [pos[~multi]]
+    nifs = [nif.to_numpy(dtype=object)[~multi]]
+    nomes = [nome.to_numpy(dtype=object)[~multi]]
+    if multi.any():
+        ln = nif[multi].str.split(sep)
+        lm = nome[multi].str.split(sep)
+        k = ln.str.len()
+        # Nomes só se emparelham com os NIFs quando o número coincide;
+        # caso contrário cada NIF leva o nome completo do registo
+        alinhado = (lm.str.len() == k).fillna(False)
+        if not alinhado.all():
+            # Só se percorrem as linhas com vários NIFs, que são poucas
+            lm = [x if ok else [nm] * n
+                  for x, ok, nm, n in zip(lm, alinhado, nome[multi], k)]
+        m = pd.DataFrame({"contrato": pos[multi], "nif": ln.to_numpy(), "nome": list(lm)})
+        m = m.explode(["nif", "nome"], ignore_index=True)
+        contratos.append(m["contrato"].to_numpy(dtype="int64"))
+        nifs.append(m["nif"].to_numpy(dtype=object))
+        nomes.append(m["nome"].to_numpy(dtype=object))
+
+    contrato = np.concatenate(contratos)
+    ordem = np.argsort(contrato, kind="stable") if multi.any() else slice(None)
+    cat_nif = _categoria(np.concatenate(nifs)[ordem])
+    # Códigos inteiros calculados só sobre os NIFs distintos
+    por_nif = pd.to_numeric(pd.Series(cat_nif.categories), errors="coerce").fillna(-1)
+    por_nif = np.append(por_nif.to_numpy(dtype="int64"), -1)   # código -1 → -1
+    e = pd.DataFrame({
+        "contrato": contrato[ordem],
+        "nif": cat_nif,
+        "nif_cod": por_nif[cat_nif.codes],
+        "nome": _categoria(np.concatenate(nomes)[ordem]),
+    })
+    e["n_partes"] = np.bincount(e["contrato"].to_numpy(), minlength=len(df))[e["contrato"]].astype("int16")
+    return e
+
+
+def por_partes(df, colunas=(), sep=SEP):
+    """Tabela ao nível (contrato, adjudicante, adjudicatário), só com as partes.
+
+    Colunas: `_contrato` (posição da linha em df); NIF, nome e `nif_cod`
+    de cada papel (`nif_cod_adjudicatario`, `nif_cod_adjudicante`); e
+    `quota`, o preço repartido por igual pelas combinações, para que as
+    somas por parte não contem duas vezes o mesmo contrato. As restantes
+    colunas do contrato não se copiam: só as pedidas em `colunas`, ou o
+    chamador junta-as por `_contrato`. Idempotente: uma tabela já
+    explodida volta igual.
+    """
+    if "_contrato" in df.columns:
+        return df
+    w = arestas(df, "adjudicatario", sep).add_suffix("_w").rename(columns={"contrato_w": "contrato"})
+    a = arestas(df, "adjudicante", sep).add_suffix("_a").rename(columns={"contrato_a": "contrato"})
+    if len(a) == len(df):
+        # Um só adjudicante por contrato (o caso comum): alinhar por posição
+        par = w.join(a.drop(columns="contrato").iloc[w["contrato"].to_numpy()]
+                     .reset_index(drop=True))
+    else:
+        par = w.merge(a, on="contrato")
+
+    contrato = par["contrato"].to_numpy()
+    longo = pd.DataFrame({"_contrato": contrato})
+    for papel, sufixo in [("adjudicatario", "_w"), ("adjudicante", "_a")]:
+        cn, cm = PAPEIS[papel]
+        if cn in df.columns:
+            longo[cn] = par["nif" + sufixo].array
+            longo["nif_cod_" + papel] = par["nif_cod" + sufixo].to_numpy()
+        if cm in df.columns:
+            longo[cm] = par["nome" + sufixo].array
+    if "preco" in df.columns:
+        divisor = (par["n_partes_w"].to_numpy() * par["n_partes_a"].to_numpy()).astype("float64")
+        preco = pd.to_numeric(df["preco"], errors="coerce").to_numpy(dtype="float64")
+        longo["quota"] = preco[contrato] / divisor
+    for c in colunas:
+        if c in df.columns:
+            longo[c] = df[c].array[contrato]
+    return longo
@@ -0,0 +1,57 @@
+"""
+Resultados das análises
+========================
+
+Cada `analise_*` devolve um `Resultado`: a tabela com as linhas
+sinalizadas mais o que é preciso para a mostrar (título, notas de
+resumo e o modelo de linhas do terminal). Mostrar é trabalho de
+apresentacao.py; aqui só se define o tipo e como se guarda em disco.
+
+Em disco, cada resultado são dois ficheiros:
+  <nome>.jsonl     a tabela, um registo por linha
+  <nome>.json      os metadados (título, notas, modelo, formatos)
+"""
+
+import json
+from dataclasses import dataclass, field, fields
+
+import pandas as pd
+
+
+@dataclass
+class Resultado:
+    nome: str                   # identificador curto, p.ex. "fragmentacao"
+    titulo: str                 # cabeçalho, p.ex. "🔍 FRAGMENTAÇÃO DE CONTRATOS"
+    tabela: pd.DataFrame
+    descricao: str = ""
+    # Linhas de resumo, antes dos registos ("" = linha em branco no terminal)
+    notas: list = field(default_factory=list)
+    rodape: list = field(default_factory=list)     # linhas depois dos registos
+    # Linhas do terminal por registo: "texto {coluna:formato}" ou
+    # [texto, coluna] para só mostrar quando a coluna for verdadeira
+    modelo: list = field(default_factory=list)
+    formatos: dict = field(default_factory=dict)   # coluna → formato (md/html)
+    limite: int = None          # máximo de registos no terminal
+    separador: str = "─" * 55   # régua sob o título no terminal
+
+
+METADADOS = [f.name for f in fields(Resultado) if f.name != "tabela"]
+
+
+def guardar(r, pasta):
+    pasta.mkdir(parents=True, exist_ok=True)
+    meta = {k: getattr(r, k) for k in METADADOS}
+    (pasta / f"{r.nome}.json").write_text(
+        json.dumps(meta, ensure_ascii=False, indent=1), encoding="utf-8")
+    r.tabela.to_json(pasta / f"{r.nome}.jsonl", orient="records", lines=True,
+                     force_ascii=False, date_format="iso")
+
+
+def carregar(nome, pasta):
+    meta = json.loads((pasta / f"{nome}.json").read_text(encoding="utf-8"))
+    caminho = pasta / f"{nome}.jsonl"
+    if caminho.stat().st_size:
+        tabela = pd.read_json(caminho, orient="records", lines=True, dtype=False)
+    else:
+        tabela = pd.DataFrame()
+    return Resultado(tabela=tabela, **meta)
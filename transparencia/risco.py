@@ -0,0 +1,207 @@
+"""
+Pontuação de risco por contrato
+================================
+
+Junta as saídas das análises (extrair_base.py) numa vista única por
+contrato, como os modelos `Flag` / `FlagEntityStat` da aplicação Rails:
+
+  sinais       uint16   um bit por detector que disparou
+  pontuacao    uint16   soma dos pesos dos detectores (tabela por máscara)
+
+As análises devolvem tabelas agregadas (pares, meses, contratos); aqui
+cada uma é juntada de volta às linhas dos contratos com merges
+vectorizados, sem objectos Python por contrato. Top-N usa
+`np.partition` e os totais por entidade `np.bincount` sobre códigos.
+"""
+
+import numpy as np
+import pandas as pd
+
+import partes
+
+# nome: (bit, peso, descrição) — pesos na escala dos `score` da aplicação Rails
+DETECTORES = {
+    "fragmentacao":  (0, 40, "ajustes directos repetidos abaixo do limiar"),
+    "junto_limiar":  (1, 20, "valores sistematicamente junto ao limiar"),
+    "temporal":      (2, 10, "celebrado num mês de pico"),
+    "dominante":     (3, 30, "fornecedor dominante na entidade"),
+    "deriva":        (4, 40, "preço efetivo atípico face ao contratual"),
+    "preco_atipico": (5, 25, "preço atípico para o tipo de procedimento"),
+    "cruzamento":    (6, 45, "adjudicatário em registo externo"),
+}
+
+# Pontuação de cada máscara possível: pontuacao = PESOS[sinais]
+PESOS = np.array([sum(p for b, p, _ in DETECTORES.values() if m >> b & 1)
+                  for m in range(1 << len(DETECTORES))], dtype="uint16")
+
+GRAVIDADES = [(100, "critica"), (60, "alta"), (30, "media"), (1, "baixa")]
+
+# O mesmo filtro de procedimento que analise_fragmentacao
+AJUSTE_DIRECTO = "direto|directo|simplif"
+
+CHAVE_NATURAL = ["nome_adjudicante", "nome_adjudicatario", "objeto", "preco", "preco_efetivo"]
+
+
+# ════════════════════════════════════════
+# DETECTORES → POSIÇÕES DOS CONTRATOS
+# ════════════════════════════════════════
+
+def _texto(t, colunas):
+    return t[colunas].astype("string")
+
+
+def _pares(longo, tabela, chaves):
+    """Linhas de `longo` (com _contrato) cujo par está na tabela da análise."""
+    chaves = [c for c in chaves if c in longo.columns and c in tabela.columns]
+    if not chaves or not len(tabela):
+        return None
+    esq = _texto(longo, chaves).assign(_contrato=longo["_contrato"].to_numpy())
+    dir_ = _texto(tabela, chaves).join(tabela.drop(columns=chaves)).drop_duplicates(chaves)
+    return esq.merge(dir_, on=chaves)
+
+
+def _fragmentacao(df, longo, tabela):
+    """Contratos contados em pares sinalizados: ajuste directo até ao máximo do par."""
+    m = _pares(longo, tabela, ["nome_adjudicante", "nome_adjudicatario", "nipc_adjudicatario"])
+    if m is None or "preco" not in df.columns:
+        return np.empty(0, "int64"), np.empty(0, "int64")
+    # Preço e procedimento vêm do contrato (a tabela longa só tem as partes)
+    contrato = m["_contrato"].to_numpy()
+    ok = pd.to_numeric(df["preco"].iloc[contrato], errors="coerce").to_numpy() <= m["mx"].to_numpy()
+    if "tipo_procedimento" in df.columns:
+        ok &= (df["tipo_procedimento"].iloc[contrato].astype("string")
+               .str.contains(AJUSTE_DIRECTO, case=False, na=False).to_numpy(dtype=bool))
+    m = m[ok]
+    junto = m["junto_limiar"].fillna(False).astype(bool) if "junto_limiar" in m else False
+    return m["_contrato"].to_numpy(), m.loc[junto, "_contrato"].to_numpy()
+
+
+def _temporal(df, tabela):
+    if not len(tabela) or "data_celebracao" not in df.columns:
+        return np.empty(0, "int64")
+    picos = tabela.loc[tabela["pico"].astype(bool), "mes"].to_numpy()
+    mes = pd.to_datetime(df["data_celebracao"], errors="coerce").dt.month.to_numpy()
+    return np.flatnonzero(np.isin(mes, picos))
+
+
+def _dominante(longo, tabela):
+    m = _pares(longo, tabela, ["nome_adjudicante", "nome_adjudicatario"])
+    return np.empty(0, "int64") if m is None else m["_contrato"].to_numpy()
+
+
+def _por_contrato(df, tabela):
+    """Linhas de uma tabela ao nível do contrato, de volta às posições em df."""
+    if not len(tabela):
+        return np.empty(0, "int64")
+    chave = (["id_externo"] if "id_externo" in df.columns and "id_externo" in tabela.columns
+             else [c for c in CHAVE_NATURAL if c in df.columns and c in tabela.columns])
+    if not chave:
+        return np.empty(0, "int64")
+    esq = df[chave].assign(_pos=np.arange(len(df)))
+    return esq.merge(tabela[chave].drop_duplicates(), on=chave)["_pos"].to_numpy()
+
+
+def preco_atipico(df, z_min=3.0, grupo_min=30):
+    """log(preço) com z ≥ z_min dentro do seu tipo de procedimento."""
+    if "preco" not in df.columns or "tipo_procedimento" not in df.columns:
+        return np.empty(0, "int64")
+    p = pd.to_numeric(df["preco"], errors="coerce").to_numpy(dtype="float64")
+    x = pd.Series(np.log(np.where(p > 0, p, np.nan)), index=df.index)
+    g = x.groupby(df["tipo_procedimento"].to_numpy(dtype=object))
+    z = (x - g.transform("mean")) / g.transform("std")
+    z[g.transform("count") < grupo_min] = np.nan
+    return np.flatnonzero((z >= z_min).to_numpy())
+
+
+# ════════════════════════════════════════
+# PONTUAÇÃO
+# ════════════════════════════════════════
+
+def pontuar(df, resultados, longo):
+    """Vectores (sinais, pontuacao) alinhados com df, a partir dos Resultados.
+
+    `resultados` é nome → Resultado; `longo` a tabela de partes.por_partes(df).
+    Detectores sem resultado simplesmente não disparam.
+    """
+    sinais = np.zeros(len(df), dtype="uint16")
+
+    def marcar(nome, posicoes):
+        sinais[np.asarray(posicoes, dtype="int64")] |= np.uint16(1 << DETECTORES[nome][0])
+
+    def tabela(nome):
+        r = resultados.get(nome)
+        return r.tabela if r is not None else pd.DataFrame()
+
+    frag, junto = _fragmentacao(df, longo, tabela("fragmentacao"))
+    marcar("fragmentacao", frag)
+    marcar("junto_limiar", junto)
+    marcar("temporal", _temporal(df, tabela("temporal")))
+    marcar("dominante", _dominante(longo, tabela("dominante")))
+    marcar("deriva", _por_contrato(df, tabela("deriva")))
+    marcar("preco_atipico", preco_atipico(df))
+    t = tabela("cruzamentos")
+    if "contrato" in t.columns:
+        marcar("cruzamento", t["contrato"].to_numpy())
+    return sinais, PESOS[sinais]
+
+
+def gravidade(pontuacao):
+    g = np.full(len(pontuacao), "", dtype=object)
+    for limite, nome in reversed(GRAVIDADES):
+        g[pontuacao >= limite] = nome
+    return g
+
+
+def descrever(sinais):
+    """Nomes dos detectores de cada máscara ("fragmentacao dominante")."""
+    s = pd.Series("", index=range(len(sinais)), dtype=object)
+    for nome, (bit, _, _) in DETECTORES.items():
+        s = s + np.where(np.asarray(sinais) >> bit & 1, nome + " ", "")
+    return s.str.strip()
+
+
+def top(pontuacao, n):
+    """Posições dos n contratos com maior pontuação, por ordem decrescente.
+
+    Empates pela posição: no corte (a n-ésima pontuação, via np.partition)
+    entram os primeiros contratos com esse valor.
+    """
+    n = min(n, int((pontuacao > 0).sum()))
+    if n <= 0:
+        return np.empty(0, "int64")
+    corte = np.partition(pontuacao, -n)[-n]
+    acima = np.flatnonzero(pontuacao > corte)
+    idx = np.r_[acima, np.flatnonzero(pontuacao == corte)[:n - len(acima)]]
+    return idx[np.argsort(-pontuacao[idx].astype("int64"), kind="stable")]
+
+
+def por_entidade(df, sinais, pontuacao, papel="adjudicatario"):
+    """Totais por entidade, como o FlagEntityStat: contratos, exposição, contagem por detector.
+
+    As entidades são as partes individuais (partes.arestas), pelo NIF ou,
+    sem NIF, pelo nome: cada membro de um consórcio conta o contrato e
+    nenhuma cadeia "A|B" passa por entidade. Só contam os contratos com
+    pelo menos um sinal; `exposicao` soma a parte do preço de cada membro.
+    """
+    e = partes.arestas(df, papel)
+    e = e[sinais[e["contrato"].to_numpy()] > 0]
+    contrato = e["contrato"].to_numpy()
+    nif, nome = e["nif"].to_numpy(dtype=object), e["nome"].to_numpy(dtype=object)
+    codigos, _ = pd.factorize(np.where(pd.notna(nif), nif, nome))
+    ok = codigos >= 0
+    c, contrato = codigos[ok], contrato[ok]
+    k = int(c.max()) + 1 if len(c) else 0
+    primeiro = np.unique(c, return_index=True)[1]        # nome e NIF da 1.ª ocorrência
+    preco = (pd.to_numeric(df["preco"], errors="coerce").fillna(0).to_numpy()
+             if "preco" in df.columns else np.zeros(len(df)))
+    quota = preco[contrato] / e["n_partes"].to_numpy()[ok]
+    t = pd.DataFrame({
+        "nif": nif[ok][primeiro],
+        partes.PAPEIS[papel][1]: nome[ok][primeiro],
+        "contratos": np.bincount(c, minlength=k),
+        "exposicao": np.bincount(c, weights=quota, minlength=k),
+        "pontuacao": np.bincount(c, weights=pontuacao[contrato], minlength=k),
+    })
+    for detector, (bit, _, _) in DETECTORES.items():
+        t[detector] = np.bincount(c, weights=(sinais[contrato] >> bit) & 1, minlength=k).astype("int64")
+    return t.sort_values(["pontuacao", "exposicao"], ascending=False).reset_index(drop=True)
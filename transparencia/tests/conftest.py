@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Os módulos importam-se uns aos outros pelo nome (import partes, ...)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,51 @@
+import pandas as pd
+
+import apresentacao
+from resultados import Resultado
+
+
+def _r(**kw):
+    t = pd.DataFrame({"nome": ["A", "B"], "total": [1234.5, None], "sinal": [True, False]})
+    return Resultado("x", "🔍 TESTE", t, **kw)
+
+
+def test_terminal_notas_e_rodape():
+    r = _r(notas=["", "⚠ 2 pares", ""], modelo=["  {nome}: €{total:,.0f}",
+                                                 ["  🚩 sinal", "sinal"]],
+           rodape=["", "Período: x"], separador="─" * 3)
+    assert apresentacao.terminal(r) == (
+        "\n🔍 TESTE\n───\n\n  ⚠ 2 pares\n\n"
+        "  A: €1,234\n  🚩 sinal\n  B: €nan\n\n  Período: x\n")
+
+
+def test_aviso_sem_linhas_em_branco():
+    r = Resultado("x", "🔍 TESTE", pd.DataFrame(), notas=["⚠ Sem coluna de data"], separador="─")
+    assert apresentacao.terminal(r) == "\n🔍 TESTE\n─\n  ⚠ Sem coluna de data\n"
+
+
+def test_markdown_ignora_notas_vazias():
+    md = apresentacao.markdown(_r(notas=["", "nota", ""], rodape=["", "fim"]))
+    assert "- nota\n- fim\n" in md
+    assert "- \n" not in md
+
+
+def test_formatar_texto_vazio():
+    s = apresentacao._formatar(pd.Series(["a", None]), ":>3".lstrip(":"))
+    assert s.tolist() == ["  a", "  ?"]
+
+
+def test_markdown_uma_linha_em_branco_depois_do_titulo():
+    md = apresentacao.markdown(_r(descricao="  desc"))
+    assert md.startswith("## TESTE\n\ndesc\n\n| nome")
+    assert "\n\n\n" not in md
+
+
+def test_formatar_cada_valor_distinto_como_o_format():
+    casos = [
+        (pd.Series([0.0, -0.0, None, 0.0]), ",.2f"),
+        (pd.Series([1, None, 3000000], dtype="Int64"), ">6,"),
+        (pd.Series([True, 1, 1.0, "1"], dtype=object), ""),
+        (pd.Series([], dtype="float64"), ",.2f"),
+    ]
+    for s, spec in casos:
+        assert apresentacao._formatar(s, spec).tolist() == [format(v, spec) for v in s]
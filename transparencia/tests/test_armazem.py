@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import armazem
+
+
+@pytest.fixture
+def df():
+    n = 60
+    return pd.DataFrame({
+        "nipc_adjudicante": [str(500000000 + i % 6) for i in range(n)],
+        "nome_adjudicante": [f"Câmara Municipal {i % 6}" for i in range(n)],
+        "nipc_adjudicatario": [("509000101|509000102" if i % 10 == 0 else str(510000000 + i % 7))
+                               for i in range(n)],
+        "nome_adjudicatario": [None if i == 3 else f"Empresa {i % 7}" for i in range(n)],
+        "preco": np.arange(n, dtype="float64") * 100,
+        "data_celebracao": pd.to_datetime("2023-01-01") + pd.to_timedelta(np.arange(n) * 15, "D"),
+    })
+
+
+def _ordenar(t):
+    return t.sort_values("preco").reset_index(drop=True)
+
+
+def test_ida_e_volta(df, tmp_path):
+    m = armazem.gravar(df, raiz=tmp_path)
+    assert [p["ano"] for p in m["particoes"]] == [2023, 2024, 2025]
+    # Um .npy por coluna e partição; as de texto têm também o dicionário
+    assert {f.name for f in (tmp_path / "ano=2023").iterdir()} == (
+        {f"{c}.npy" for c in df.columns}
+        | {f"{c}.{x}.npy" for c in df.columns[:4] for x in ["texto", "inicio"]})
+    t, lidas = armazem.ler(raiz=tmp_path)
+    assert lidas == 3
+    t = _ordenar(t)
+    assert t["preco"].tolist() == df["preco"].tolist()
+    assert t["nome_adjudicatario"].isna().sum() == 1
+    assert t["nipc_adjudicante"].tolist() == df["nipc_adjudicante"].tolist()
+
+
+def test_filtros(df, tmp_path):
+    armazem.gravar(df, raiz=tmp_path)
+    t, lidas = armazem.ler(ano=2024, raiz=tmp_path)
+    assert lidas == 1 and (t["data_celebracao"].dt.year == 2024).all()
+
+    t, _ = armazem.ler(adjudicante="municipal 2", raiz=tmp_path)
+    assert set(t["nome_adjudicante"]) == {"Câmara Municipal 2"}
+    assert len(t) == 10
+
+    # NIF de um membro de consórcio e NIF de adjudicante
+    t, _ = armazem.ler(nif="509000102", raiz=tmp_path)
+    assert len(t) == 6
+    t, _ = armazem.ler(nif=500000004, raiz=tmp_path)
+    assert len(t) == 10 and set(t["nipc_adjudicante"]) == {"500000004"}
+
+
+def test_blocos_podados(df, tmp_path, monkeypatch):
+    monkeypatch.setattr(armazem, "BLOCO", 4)
+    m = armazem.gravar(df, raiz=tmp_path)
+    p = m["particoes"][0]
+    assert len(p["blocos"]) > 1
+    linhas = armazem._linhas_candidatas(p, "500000000")
+    assert linhas is not None and len(linhas) < p["n"]
+    t, _ = armazem.ler(nif="500000000", raiz=tmp_path)
+    assert len(t) == (df["nipc_adjudicante"] == "500000000").sum()
+
+
+def test_lotes(df, tmp_path):
+    armazem.gravar(df, raiz=tmp_path)
+    lotes = list(armazem.lotes(linhas=25, raiz=tmp_path))
+    assert sum(map(len, lotes)) == len(df)
+
+
+def test_lotes_partem_as_particoes_em_blocos(df, tmp_path, monkeypatch):
+    monkeypatch.setattr(armazem, "BLOCO", 4)
+    armazem.gravar(df, raiz=tmp_path)
+    lotes = list(armazem.lotes(linhas=8, raiz=tmp_path))
+    # Partições de ~24 linhas, lidas 8 a 8 (dois blocos de cada vez)
+    assert max(map(len, lotes)) <= 8 + 4
+    pd.testing.assert_frame_equal(pd.concat(lotes, ignore_index=True), armazem.ler(raiz=tmp_path)[0])
+    filtrados = pd.concat(armazem.lotes(nif="509000102", linhas=8, raiz=tmp_path), ignore_index=True)
+    pd.testing.assert_frame_equal(filtrados, armazem.ler(nif="509000102", raiz=tmp_path)[0])
+
+
+def test_dicionario_descodifica_so_os_usados(tmp_path):
+    v = pd.Series(["Ávila", None, "Braga", "Évora", "Faro", "Guarda", "Beja", "Braga"])
+    armazem._gravar_texto(tmp_path, "c", v)
+    d = armazem._Dicionario(tmp_path, "c")
+    codigos = np.load(tmp_path / "c.npy", mmap_mode="r")
+    assert d.valores(np.asarray(codigos[[2, 1]])).tolist() == ["Braga", None]
+    assert d._todos is None
+    assert d.valores(np.asarray(codigos)).tolist() == v.astype(object).where(v.notna(), None).tolist()
+
+
+def test_formato_antigo_ignorado(df, tmp_path):
+    armazem.gravar(df, raiz=tmp_path)
+    caminho = tmp_path / "manifesto.json"
+    caminho.write_text(caminho.read_text().replace(f'"versao": {armazem.VERSAO}', '"versao": 1'))
+    assert armazem.manifesto(tmp_path) is None
@@ -0,0 +1,148 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import bd_rails
+import extrair_base as eb
+
+CSV = """nifs_dos_adjudicantes;entidades_adjudicantes_normalizado;nifs_das_adjudicatarias;entidades_adjudicatarias_normalizado;data_de_celebracao_do_contrato;preco_contratual;objeto_do_contrato
+500000001;Hospital A;509000101;Alfa, Lda.;2024-01-05;1500;Material de escritório
+500000001;Hospital A;;Beta;2024-02-10;250.50;Limpeza
+500000002;Hospital B;509000102|509000103;Gama|Delta;2024-03-01;12000;Obras
+"""
+
+
+@pytest.fixture
+def csv(tmp_path):
+    f = tmp_path / "portal_base.csv"
+    f.write_text(CSV, encoding="utf-8")
+    return f
+
+
+def test_id_igual_no_carregamento_e_em_fluxo(csv):
+    carregado = eb.normalizar(eb.carregar(csv))
+    # A leitura em fluxo (ingestao.py) lê lotes de texto
+    lotes = pd.read_csv(csv, sep=";", encoding="utf-8-sig", dtype=str, chunksize=2)
+    em_fluxo = eb.normalizar(pd.concat(lotes, ignore_index=True))
+    assert bd_rails.id_externo(carregado).tolist() == bd_rails.id_externo(em_fluxo).tolist()
+
+
+def test_id_com_nifs_lidos_como_float(csv):
+    texto = eb.normalizar(pd.read_csv(csv, sep=";", dtype=str))
+    inferido = eb.normalizar(pd.read_csv(csv, sep=";", dtype={"preco_contratual": str}))
+    inferido["nipc_adjudicante"] = inferido["nipc_adjudicante"].astype("float64")
+    assert bd_rails.id_externo(inferido).tolist() == bd_rails.id_externo(texto).tolist()
+
+
+def test_entidades_com_nif_inteiro(csv):
+    df = eb.normalizar(pd.read_csv(csv, sep=";", dtype=str))
+    df["nipc_adjudicante"] = df["nipc_adjudicante"].astype("float64")
+    df.loc[0, "nipc_adjudicatario"] = "509000101.0"
+    entidades, contratos, vencedores = bd_rails.preparar(df)
+    nifs = set(entidades["nif"])
+    assert {"500000001", "500000002", "509000101", "509000102", "509000103"} == nifs
+    assert set(contratos["nif_adjudicante"]) == {"500000001", "500000002"}
+    assert len(vencedores) == 3
+
+
+# As tabelas de db/schema.rb que o exportar escreve ou consulta
+ESQUEMA = """
+CREATE TABLE entities (id INTEGER PRIMARY KEY, name TEXT, tax_identifier TEXT,
+  is_public_body BOOLEAN, is_company BOOLEAN, created_at TEXT NOT NULL, updated_at TEXT NOT NULL,
+  country_code TEXT DEFAULT 'PT' NOT NULL, contract_count INTEGER DEFAULT 0 NOT NULL,
+  total_contracted_value DECIMAL(15, 2) DEFAULT 0.0 NOT NULL);
+CREATE UNIQUE INDEX index_entities_on_tax_identifier_and_country_code
+  ON entities (tax_identifier, country_code);
+CREATE TABLE contracts (id INTEGER PRIMARY KEY, external_id TEXT, contracting_entity_id INTEGER,
+  object TEXT, contract_type TEXT, procedure_type TEXT, publication_date DATE,
+  celebration_date DATE, base_price DECIMAL(15, 2), total_effective_price DECIMAL(15, 2),
+  cpv_code TEXT, location TEXT, created_at TEXT NOT NULL, updated_at TEXT NOT NULL,
+  country_code TEXT DEFAULT 'PT' NOT NULL, data_source_id INTEGER);
+CREATE UNIQUE INDEX index_contracts_on_external_id_and_country_code
+  ON contracts (external_id, country_code);
+CREATE TABLE contract_winners (id INTEGER PRIMARY KEY, contract_id INTEGER NOT NULL,
+  entity_id INTEGER NOT NULL, price_share DECIMAL(15, 2), created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL);
+CREATE UNIQUE INDEX index_contract_winners_on_contract_id_and_entity_id
+  ON contract_winners (contract_id, entity_id);
+CREATE TABLE data_sources (id INTEGER PRIMARY KEY, country_code TEXT NOT NULL, name TEXT NOT NULL,
+  source_type TEXT NOT NULL, adapter_class TEXT NOT NULL, created_at TEXT NOT NULL,
+  updated_at TEXT NOT NULL);
+INSERT INTO data_sources VALUES (7, 'PT', 'Portal BASE', 'api', 'PublicContracts::PT::SnsClient', '', '');
+"""
+
+
+def _consultar(bd, sql):
+    con = sqlite3.connect(bd)
+    try:
+        return con.execute(sql).fetchall()
+    finally:
+        con.close()
+
+
+def _tabelas(bd):
+    """O conteúdo das três tabelas, sem ids nem marcas de tempo."""
+    return {
+        "entities": _consultar(bd, "SELECT tax_identifier, name, is_public_body, is_company, "
+                                   "contract_count, total_contracted_value FROM entities ORDER BY 1"),
+        "contracts": _consultar(bd, "SELECT c.external_id, c.object, c.celebration_date, c.base_price, "
+                                    "e.tax_identifier, c.data_source_id FROM contracts c "
+                                    "JOIN entities e ON e.id = c.contracting_entity_id ORDER BY 2"),
+        "contract_winners": _consultar(bd, "SELECT c.object, e.tax_identifier, w.price_share "
+                                           "FROM contract_winners w JOIN contracts c ON c.id = w.contract_id "
+                                           "JOIN entities e ON e.id = w.entity_id ORDER BY 1, 2"),
+    }
+
+
+@pytest.mark.parametrize("staging", [True, False])
+def test_exportar_duas_vezes(csv, tmp_path, staging):
+    bd = tmp_path / "development.sqlite3"
+    con = sqlite3.connect(bd)
+    con.executescript(ESQUEMA)
+    con.close()
+    df = eb.normalizar(pd.read_csv(csv, sep=";", dtype=str))
+    ids = bd_rails.id_externo(df).tolist()
+
+    assert bd_rails.exportar(df, bd, staging=staging) == {"entidades": 5, "contratos": 3, "vencedores": 3}
+    primeira = _tabelas(bd)
+    assert primeira["entities"] == [
+        ("500000001", "Hospital A", 1, 0, 2, 1500),
+        ("500000002", "Hospital B", 1, 0, 1, 6000),
+        ("509000101", "Alfa, Lda.", 0, 1, 0, 0),
+        ("509000102", "Gama", 0, 1, 0, 0),
+        ("509000103", "Delta", 0, 1, 0, 0),
+    ]
+    assert primeira["contracts"] == [
+        (ids[1], "Limpeza", "2024-02-10", 250.5, "500000001", 7),
+        (ids[0], "Material de escritório", "2024-01-05", 1500, "500000001", 7),
+        (ids[2], "Obras", "2024-03-01", 12000, "500000002", 7),
+    ]
+    assert primeira["contract_winners"] == [
+        ("Material de escritório", "509000101", 1500),
+        ("Obras", "509000102", 6000),
+        ("Obras", "509000103", 6000),
+    ]
+
+    # Campos preenchidos pela aplicação mantêm-se; os vazios completam-se
+    con = sqlite3.connect(bd)
+    con.execute("UPDATE contracts SET procedure_type = 'Concurso Público' WHERE object = 'Obras'")
+    con.execute("UPDATE entities SET name = '' WHERE tax_identifier = '509000102'")
+    con.commit()
+    con.close()
+    n = _consultar(bd, "SELECT (SELECT MAX(id) FROM entities), (SELECT MAX(id) FROM contracts), "
+                       "(SELECT MAX(id) FROM contract_winners)")
+
+    bd_rails.exportar(df, bd, staging=staging)
+    assert _tabelas(bd) == primeira
+    assert _consultar(bd, "SELECT COUNT(*) FROM entities") == [(5,)]
+    assert _consultar(bd, "SELECT (SELECT MAX(id) FROM entities), (SELECT MAX(id) FROM contracts), "
+                          "(SELECT MAX(id) FROM contract_winners)") == n
+    assert _consultar(bd, "SELECT procedure_type FROM contracts WHERE object = 'Obras'") == [
+        ("Concurso Público",)]
+
+
+def test_exportar_sem_base_de_dados(csv, tmp_path):
+    df = eb.normalizar(pd.read_csv(csv, sep=";", dtype=str))
+    with pytest.raises(FileNotFoundError):
+        bd_rails.exportar(df, tmp_path / "nao_existe.sqlite3")
@@ -0,0 +1,40 @@
+import cache_http
+
+
+class Resposta:
+    def __init__(self, etag):
+        self.headers = {"ETag": etag}
+
+
+def _gravar(raiz, url, corpo, etag):
+    g = cache_http.Gravador(url, None, Resposta(etag), raiz)
+    g.escrever(corpo)
+    return g.concluir()
+
+
+def test_grava_e_indexa(tmp_path):
+    caminho = _gravar(tmp_path, "https://x/a", b"abc", '"1"')
+    assert caminho.read_bytes() == b"abc"
+    e = cache_http.entrada("https://x/a", raiz=tmp_path)
+    assert e["etag"] == '"1"' and e["tamanho"] == 3
+
+
+def test_objeto_substituido_e_apagado(tmp_path):
+    velho = _gravar(tmp_path, "https://x/a", b"v1", '"1"')
+    novo = _gravar(tmp_path, "https://x/a", b"v2", '"2"')
+    assert not velho.exists()
+    assert novo.exists()
+    assert [p for p in (tmp_path / "objetos").rglob("*") if p.is_file()] == [novo]
+
+
+def test_objeto_partilhado_fica(tmp_path):
+    comum = _gravar(tmp_path, "https://x/a", b"igual", '"1"')
+    _gravar(tmp_path, "https://x/b", b"igual", '"1"')
+    _gravar(tmp_path, "https://x/a", b"outro", '"2"')
+    assert comum.exists()
+
+
+def test_mesmo_conteudo_nao_apaga(tmp_path):
+    c = _gravar(tmp_path, "https://x/a", b"igual", '"1"')
+    _gravar(tmp_path, "https://x/a", b"igual", '"2"')
+    assert c.exists()
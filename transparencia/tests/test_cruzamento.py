@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+import cruzamento
+
+
+def _dice(a, b):
+    ta, tb = cruzamento.trigramas(a), cruzamento.trigramas(b)
+    return 2 * len(ta & tb) / (len(ta) + len(tb))
+
+
+def _registos(nomes, nifs=None):
+    nomes = pd.Series(nomes)
+    return pd.DataFrame({
+        "nif_cod": nifs if nifs is not None else [-1] * len(nomes),
+        "nome": nomes,
+        "nome_norm": cruzamento.normalizar_nome(nomes),
+        "detalhe": "",
+        "fonte": "teste",
+    })
+
+
+def test_dice_por_forca_bruta():
+    rng = np.random.default_rng(3)
+    palavras = ["alfa", "beta", "gama", "delta", "tecno", "serv", "norte", "sul", "obras"]
+    nomes = [" ".join(rng.choice(palavras, rng.integers(1, 4))) for _ in range(300)]
+    consultas = nomes[:40] + ["alfa betta", "tecno servs norte", "", "zzz"]
+    idx = cruzamento.IndiceNomes(nomes)
+    for limiar in (0.5, 0.85):
+        q, r, s = idx.procurar_lote(consultas, limiar)
+        achado = {(int(a), int(b)): x for a, b, x in zip(q, r, s)}
+        esperado = {(i, j): _dice(c, n) for i, c in enumerate(consultas) if c
+                    for j, n in enumerate(nomes) if n and _dice(c, n) >= limiar}
+        assert achado.keys() == esperado.keys()
+        assert all(np.isclose(achado[k], esperado[k]) for k in esperado)
+
+
+def test_lote_igual_a_consultas_isoladas():
+    nomes = ["tecnoserv", "tecnoserv norte", "digital360", "construcoes silva", "silva construcoes"]
+    idx = cruzamento.IndiceNomes(nomes)
+    consultas = ["tecnoserv", "construcoes silva", "digital 360", "nada disto"]
+    # Blocos de um só nome (volume pequeno) e um bloco com todos
+    for volume in (1, 1 << 20):
+        q, r, s = idx.procurar_lote(consultas, 0.6, volume=volume)
+        for i, c in enumerate(consultas):
+            reg, sim = idx.procurar(c, 0.6)
+            assert r[q == i].tolist() == reg.tolist()
+            assert np.allclose(s[q == i], sim)
+
+
+def test_cruzar_por_nif_e_por_nome():
+    df = pd.DataFrame({
+        "nipc_adjudicatario": ["509000101|509000102", "509000103"],
+        "nome_adjudicatario": ["TecnoServ, Lda.|Digital360, Lda.", "Construções Silva, S.A."],
+    })
+    reg = _registos(["Outra Firma", "Construcoes Silva SA"], nifs=[509000102, -1])
+    h = cruzamento.cruzar(df, reg)
+    assert sorted(zip(h["contrato"], h["registo"], h["tipo"])) == [(0, 0, "nif"), (1, 1, "nome")]
+    assert h.loc[h["tipo"] == "nome", "semelhanca"].iloc[0] == 1.0
@@ -0,0 +1,140 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import extrair_base as eb
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    f = tmp_path / "portal_base.csv"
+    f.write_text("a;b\n1;2\n")
+    monkeypatch.setattr(eb, "ficheiro_local", lambda: f)
+    m = {"origem": eb.origem(f)}
+    monkeypatch.setattr(eb.armazem, "manifesto", lambda: m)
+    return f
+
+
+def _args(**kw):
+    return SimpleNamespace(**{"ano": None, "adjudicante": None, "nif": None, **kw})
+
+
+def test_armazem_desactualizado(base):
+    assert eb.armazem_actual() is not None
+    st = base.stat()
+    os.utime(base, (st.st_atime, st.st_mtime + 60))
+    assert eb.armazem_actual() is None
+
+
+def test_sem_filtros_nao_le_o_armazem(base, monkeypatch):
+    monkeypatch.setattr(eb, "carregar_tudo", lambda: "memoria")
+    monkeypatch.setattr(eb, "ler_filtrado", lambda args: "armazem")
+    assert eb.carregar_para_analise(_args()) == "memoria"
+    assert eb.carregar_para_analise(_args(ano=2024)) == "armazem"
+
+
+def test_filtrado_com_armazem_antigo_reconstroi(base, monkeypatch):
+    chamadas = []
+    monkeypatch.setattr(eb, "carregar_tudo", lambda: chamadas.append("tudo"))
+    monkeypatch.setattr(eb, "ler_filtrado", lambda args: "armazem")
+    monkeypatch.setattr(eb.armazem, "manifesto", lambda: {"origem": None})
+    assert eb.carregar_para_analise(_args(nif="500000000")) == "armazem"
+    assert chamadas == ["tudo"]
+
+
+@pytest.fixture
+def contratos():
+    import numpy as np
+    import pandas as pd
+    rng = np.random.default_rng(1)
+    n = 400
+    return pd.DataFrame({
+        "nipc_adjudicante": rng.choice(["500000001", "500000002"], n),
+        "nome_adjudicante": rng.choice(["Câmara A", "Câmara B"], n),
+        "nipc_adjudicatario": rng.choice(["509000101", "509000102", "509000101|509000103"], n),
+        "nome_adjudicatario": rng.choice(["Alfa", "Beta", "Alfa|Gama"], n),
+        "tipo_procedimento": rng.choice(["Ajuste Direto", "Concurso Público"], n),
+        "preco": rng.uniform(1000, 40000, n).round(2),
+        "data_celebracao": pd.to_datetime("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, n), "D"),
+        "objeto": rng.choice(["Obras", "Limpeza", "Consultoria"], n),
+    })
+
+
+@pytest.mark.parametrize("limiar,minimo", [(5000, 3), (20000, 5), (30000, 10)])
+def test_sensibilidade_igual_a_fragmentacao(contratos, limiar, minimo):
+    cubo = eb.analise_sensibilidade(contratos, limiares=[limiar], minimos=[minimo], faixas=[0.6]).tabela
+    f = eb.analise_fragmentacao(contratos, limiar=limiar, minimo=minimo).tabela
+    linha = cubo.iloc[0]
+    assert linha["pares"] == len(f)
+    assert linha["contratos"] == f["n"].sum()
+    assert linha["valor"] == pytest.approx(f["total"].sum())
+    assert linha["junto"] == f["junto_limiar"].sum()
+
+
+def test_sensibilidade_sem_nifs(contratos):
+    contratos["nipc_adjudicatario"] = None
+    cubo = eb.analise_sensibilidade(contratos).tabela
+    assert (cubo["pares"] == 0).all()
+
+
+def test_deriva_agrupa_por_membro_do_consorcio():
+    import numpy as np
+    import pandas as pd
+    n = 12
+    df = pd.DataFrame({
+        "nome_adjudicante": [f"Câmara {i}" for i in range(n + 1)],
+        "nipc_adjudicatario": ["509000101"] * n + ["509000101|509000102"],
+        "nome_adjudicatario": ["Alfa"] * n + ["Alfa|Beta"],
+        "objeto": [f"Contrato {i}" for i in range(n + 1)],
+        "preco": [1000.0] * (n + 1),
+        "preco_efetivo": list(1000 * (1 + np.linspace(-0.01, 0.01, n))) + [3000.0],
+    })
+    t = eb.analise_deriva(df, z_min=3.0).tabela
+    assert t["nome_adjudicatario"].tolist() == ["Alfa|Beta"]
+    assert t["motivos"].tolist() == ["adjudicatario"]
+    assert t["z_adjudicatario"].iloc[0] >= 3.0
+
+
+def test_copia_da_cache_e_uma_ligacao(tmp_path, monkeypatch):
+    monkeypatch.setattr(eb, "arquivar", lambda *a, **k: None)
+    objeto, path = tmp_path / ("a" * 64), tmp_path / "portal_base.csv"
+    objeto.write_text("a;b\n1;2\n")
+    path.write_text("antigo")
+    eb._copiar_da_cache(objeto, path, alterado=True)
+    assert os.path.samefile(objeto, path) and path.read_text() == "a;b\n1;2\n"
+    # Sem alterações fica como está; sem ligações possíveis, copia-se
+    eb._copiar_da_cache(objeto, path, alterado=False)
+    assert os.path.samefile(objeto, path)
+    path.unlink()
+
+    def sem_ligacoes(*a):
+        raise OSError("sem ligações")
+
+    monkeypatch.setattr(os, "link", sem_ligacoes)
+    eb._copiar_da_cache(objeto, path, alterado=True)
+    assert not os.path.samefile(objeto, path) and path.read_text() == "a;b\n1;2\n"
+    assert set(tmp_path.iterdir()) == {objeto, path}
+
+
+def test_funcoes_sem_importar_antes(tmp_path):
+    # Num interpretador novo: importar não carrega o pandas, e as funções
+    # usam-se directamente, sem passar por um subcomando
+    codigo = """
+import sys
+from pathlib import Path
+import extrair_base as eb
+assert "pandas" not in sys.modules
+f = Path(sys.argv[1])
+f.write_text("nifs_dos_adjudicantes;nifs_das_adjudicatarias;objeto_do_contrato;preco_contratual\\n"
+             "500000001;509000101;Limpeza;1,5\\n", encoding="utf-8")
+df = eb.tipar(eb.normalizar(eb.carregar(f)))
+print(df["preco"].tolist(), type(eb.pd).__name__)
+"""
+    import subprocess
+    import sys
+    r = subprocess.run([sys.executable, "-c", codigo, str(tmp_path / "b.csv")], cwd=tmp_path,
+                       env={**os.environ, "PYTHONPATH": os.path.dirname(eb.__file__)},
+                       capture_output=True, text=True)
+    assert r.returncode == 0, r.stderr
+    assert r.stdout.splitlines()[-1] == "[1.5] module"
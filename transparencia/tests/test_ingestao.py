@@ -0,0 +1,123 @@
+import io
+import queue
+
+import pandas as pd
+import pytest
+
+import cache_http
+import ingestao
+
+CSV = "nif;nome;preco\n" + "".join(f"5090{i:05d};Empresa {i};{i},50\n" for i in range(1000))
+
+
+class Resposta:
+    status_code = 200
+    headers = {"ETag": '"v1"'}
+
+    def __init__(self, dados, pedaço=777, falha=None):
+        self._dados, self._pedaço, self._falha = dados, pedaço, falha
+        self.raw = io.BytesIO()
+
+    def iter_content(self, _):
+        for i in range(0, len(self._dados), self._pedaço):
+            if self._falha is not None and i > len(self._dados) // 2:
+                raise self._falha
+            self.raw.seek(i + self._pedaço)
+            yield self._dados[i:i + self._pedaço]
+
+    def close(self):
+        pass
+
+
+def test_fluxo_bytes_corta_a_meio_das_linhas():
+    fila = queue.Queue()
+    dados = CSV.encode()
+    for i in range(0, len(dados), 100):
+        fila.put(dados[i:i + 100])
+    fila.put(ingestao._FIM)
+    fluxo = ingestao.FluxoBytes(fila)
+    assert fluxo.espreitar().startswith(b"nif;nome")
+    lido = pd.concat(pd.read_csv(io.BufferedReader(fluxo), sep=";", dtype=str, chunksize=64))
+    pd.testing.assert_frame_equal(lido.reset_index(drop=True),
+                                  pd.read_csv(io.StringIO(CSV), sep=";", dtype=str))
+
+
+def test_detectar_separador():
+    assert ingestao.detectar_separador(b"a;b;c\n1,5;2;3\n") == ";"
+    assert ingestao.detectar_separador(b"a\tb\n") == "\t"
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / cache_http.RAIZ
+
+
+def test_lotes_em_fluxo_grava_a_copia(cache, monkeypatch):
+    monkeypatch.setattr(cache_http, "pedido_condicional",
+                        lambda *a, **k: (Resposta(CSV.encode()), None))
+    estado = {}
+    lotes = list(ingestao.lotes_em_fluxo("http://portal/csv", linhas=300, estado=estado))
+    assert [len(l) for l in lotes] == [300, 300, 300, 100]
+    assert lotes[0].iloc[0].tolist() == ["509000000", "Empresa 0", "0,50"]
+    assert estado["objeto"].read_bytes() == CSV.encode()
+
+
+def test_lotes_em_fluxo_propaga_erro_da_rede(cache, monkeypatch):
+    monkeypatch.setattr(cache_http, "pedido_condicional",
+                        lambda *a, **k: (Resposta(CSV.encode(), falha=ConnectionError("caiu")), None))
+    with pytest.raises(ConnectionError):
+        list(ingestao.lotes_em_fluxo("http://portal/csv", linhas=300))
+    # O objeto parcial não fica na cache nem no índice
+    assert not list((cache / "objetos").rglob("*.parcial"))
+    assert cache_http.ler_indice(cache) == {}
+
+
+BASE = ("nifs_dos_adjudicantes;entidades_adjudicantes_normalizado;nifs_das_adjudicatarias;"
+        "data_de_celebracao_do_contrato;preco_contratual;objeto_do_contrato\n"
+        + "".join(f"50000000{i % 3};Câmara {i % 3};5090{i:05d};{2022 + i % 3}-03-{1 + i % 28:02d};"
+                  f"{'1.%03d,50' % i if i < 300 else '%d,25' % i};Contrato {i}\n" for i in range(700)))
+
+
+def test_carregar_em_fluxo_igual_ao_carregamento(tmp_path, monkeypatch):
+    import armazem
+    import extrair_base as eb
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "dados_base").mkdir()
+    objeto = tmp_path / ("a" * 64)
+    objeto.write_text(BASE, encoding="utf-8")
+
+    gravados = []
+
+    def lotes_em_fluxo(url, linhas, estado):
+        estado["objeto"] = objeto
+        for lote in pd.read_csv(objeto, sep=";", dtype=str, chunksize=linhas):
+            # Os lotes anteriores já estão em disco (um pedaço por ano)
+            gravados.append(len(list((armazem.RAIZ / "_lotes").rglob("*.pkl"))))
+            yield lote
+
+    monkeypatch.setattr(ingestao, "lotes_em_fluxo", lotes_em_fluxo)
+    path = eb.DIR / "portal_base.csv"
+    df = eb.carregar_em_fluxo(path, linhas=250)
+    eb.esperar_arquivos()
+    assert gravados == [0, 3, 6]
+
+    esperado = eb.normalizar(eb.carregar(path))
+    esperado["id_externo"] = eb.bd_rails.id_externo(esperado)
+    esperado = eb.tipar(esperado)
+    pd.testing.assert_frame_equal(df, esperado)
+    # Os lotes seguintes ("300,25", …) leem-se com o formato do primeiro
+    assert df["preco"].iloc[[0, 299, 300]].tolist() == [1000.5, 1299.5, 300.25]
+
+    # O armazém gravado lote a lote é o mesmo que o gravado de uma vez
+    m = armazem.manifesto()
+    assert m["origem"] == eb.origem(path) and eb.armazem_actual() is not None
+    assert not (armazem.RAIZ / "_lotes").exists()
+    lido, _ = armazem.ler()
+    armazem.gravar(esperado, raiz=tmp_path / "de_uma_vez")
+    de_uma_vez, _ = armazem.ler(raiz=tmp_path / "de_uma_vez")
+    pd.testing.assert_frame_equal(lido, de_uma_vez)
+    assert [p["n"] for p in m["particoes"]] == [234, 233, 233]
+
+    # O instantâneo foi arquivado em fundo
+    assert [e["sha256"] for e in eb.instantaneos.ler_indice()] == ["a" * 64]
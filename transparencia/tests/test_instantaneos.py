@@ -0,0 +1,67 @@
+import pytest
+
+import extrair_base as eb
+import instantaneos
+
+CABECALHO = ("nifs_dos_adjudicantes;nifs_das_adjudicatarias;data_de_celebracao_do_contrato;"
+             "preco_contratual;objeto_do_contrato\n")
+A = CABECALHO + """500000001;509000101;2024-01-05;1500;Material de escritório
+500000001;509000102;2024-02-10;250,50;Limpeza
+500000002;509000103;2024-03-01;12000;Obras
+"""
+B = CABECALHO + """500000001;509000101;2024-01-05;1650;Material de escritório
+500000002;509000103;2024-03-01;12000;Obras
+500000002;509000104;2024-04-01;800;Consultoria
+"""
+
+
+def _guardar(tmp_path, nome, texto):
+    f = tmp_path / nome
+    f.write_text(texto, encoding="utf-8")
+    return instantaneos.guardar(f, raiz=tmp_path / "inst")
+
+
+def test_preco_alterado_e_modificacao(tmp_path):
+    a, b = _guardar(tmp_path, "a.csv", A), _guardar(tmp_path, "b.csv", B)
+    t, resumo = instantaneos.diferencas(a, b, chave=eb._chave_contrato, raiz=tmp_path / "inst")
+    assert (resumo["adicionados"], resumo["removidos"], resumo["modificados"]) == (1, 1, 1)
+    assert t["estado"].tolist() == ["adicionado", "modificado", "removido"]
+    assert t["objeto_do_contrato"].tolist() == ["Consultoria", "Material de escritório", "Limpeza"]
+    assert t.loc[1, "alteracoes"] == "preco_contratual: 1500 → 1650"
+
+
+def test_sem_diferencas(tmp_path):
+    a = _guardar(tmp_path, "a.csv", A)
+    t, resumo = instantaneos.diferencas(a, a, chave=eb._chave_contrato, raiz=tmp_path / "inst")
+    assert t.empty and resumo["modificados"] == 0
+
+
+def test_chave_por_omissao_usa_idcontrato(tmp_path):
+    a = _guardar(tmp_path, "a.csv", "idcontrato;preco\n1;10\n2;20\n")
+    b = _guardar(tmp_path, "b.csv", "idcontrato;preco\n1;10\n2;25\n3;30\n")
+    t, resumo = instantaneos.diferencas(a, b, raiz=tmp_path / "inst")
+    assert t["estado"].tolist() == ["adicionado", "modificado"]
+    assert t["chave"].tolist() == ["3", "2"]
+
+
+def test_chave_repetida_emparelha_por_ocorrencia(tmp_path):
+    a = _guardar(tmp_path, "a.csv", "idcontrato;preco\n1;10\n1;11\n2;20\n")
+    b = _guardar(tmp_path, "b.csv", "idcontrato;preco\n1;10\n1;12\n1;13\n2;20\n")
+    t, resumo = instantaneos.diferencas(a, b, raiz=tmp_path / "inst")
+    assert (resumo["registos_a"], resumo["registos_b"]) == (3, 4)
+    assert (resumo["adicionados"], resumo["removidos"], resumo["modificados"]) == (1, 0, 1)
+    assert t["estado"].tolist() == ["adicionado", "modificado"]
+    assert t["preco"].tolist() == ["13", "12"]
+    assert t.loc[1, "alteracoes"] == "preco: 11 → 12"
+
+
+def test_comprimido_com_zstd(tmp_path, monkeypatch):
+    zstandard = pytest.importorskip("zstandard")
+    monkeypatch.setattr(instantaneos, "zstandard", zstandard)
+    a, b = _guardar(tmp_path, "a.csv", A), _guardar(tmp_path, "b.csv", B)
+    assert a["compressao"] == "zst"
+    assert instantaneos.caminho_objeto(a, tmp_path / "inst").read_bytes()[:4] == b"\x28\xb5\x2f\xfd"
+    with instantaneos.abrir(b, tmp_path / "inst") as f:
+        assert f.read().decode() == B
+    t, _ = instantaneos.diferencas(a, b, chave=eb._chave_contrato, raiz=tmp_path / "inst")
+    assert t["estado"].tolist() == ["adicionado", "modificado", "removido"]
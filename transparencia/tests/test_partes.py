@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+import partes
+
+
+def _df(**kw):
+    base = {
+        "nipc_adjudicante": ["500000001", "500000001", "500000002"],
+        "nome_adjudicante": ["Câmara A", "Câmara A", "Câmara B"],
+        "nipc_adjudicatario": ["509000101|509000102", "509000101", None],
+        "nome_adjudicatario": ["Alfa, Lda.|Beta, S.A.", "Alfa, Lda.", "Gama"],
+        "preco": [1000.0, 500.0, 300.0],
+    }
+    base.update(kw)
+    return pd.DataFrame(base)
+
+
+def test_consorcio_explodido():
+    e = partes.arestas(_df())
+    assert e["contrato"].tolist() == [0, 0, 1, 2]
+    assert e["nif"].astype(object).tolist()[:3] == ["509000101", "509000102", "509000101"]
+    assert e["nome"].astype(object).tolist()[:2] == ["Alfa, Lda.", "Beta, S.A."]
+    assert e["nif_cod"].tolist() == [509000101, 509000102, 509000101, -1]
+    assert e["n_partes"].tolist() == [2, 2, 1, 1]
+
+
+def test_quota_nao_conta_duas_vezes():
+    longo = partes.por_partes(_df())
+    assert len(longo) == 4
+    assert longo["quota"].sum() == 1800.0
+    assert partes.por_partes(longo) is longo
+
+
+def test_so_as_partes_e_as_colunas_pedidas():
+    df = _df(objeto=["a", "b", "c"], tipo_procedimento=["Ajuste Direto", "Concurso", None])
+    longo = partes.por_partes(df)
+    assert list(longo.columns) == [
+        "_contrato", "nipc_adjudicatario", "nif_cod_adjudicatario", "nome_adjudicatario",
+        "nipc_adjudicante", "nif_cod_adjudicante", "nome_adjudicante", "quota"]
+    assert longo["nif_cod_adjudicatario"].tolist() == [509000101, 509000102, 509000101, -1]
+    assert longo["nif_cod_adjudicante"].tolist() == [500000001] * 3 + [500000002]
+    com = partes.por_partes(df, ["tipo_procedimento", "preco", "nao_existe"])
+    assert com["tipo_procedimento"].tolist()[:3] == ["Ajuste Direto"] * 2 + ["Concurso"]
+    assert com["preco"].tolist() == [1000.0, 1000.0, 500.0, 300.0]
+    assert "nao_existe" not in com and "objeto" not in com
+
+
+def test_coluna_de_nifs_vazia():
+    df = _df(nipc_adjudicatario=[None, None, None])
+    e = partes.arestas(df)
+    assert (e["nif_cod"] == -1).all() and e["nif"].isna().all()
+    assert len(partes.por_partes(df)) == 3
+
+
+def test_sem_coluna_de_nifs():
+    df = _df().drop(columns="nipc_adjudicatario")
+    assert len(partes.arestas(df)) == 3
+    assert "nipc_adjudicatario" not in partes.por_partes(df).columns
+
+
+def test_nifs_float_sem_ponto_zero():
+    df = _df(nipc_adjudicatario=[509000101.0, np.nan, 509000103.0])
+    e = partes.arestas(df)
+    assert e["nif"].astype(object).tolist()[0] == "509000101"
+    assert e["nif_cod"].tolist() == [509000101, -1, 509000103]
@@ -0,0 +1,20 @@
+import pandas as pd
+
+from resultados import Resultado, carregar, guardar
+
+
+def test_guardar_e_carregar(tmp_path):
+    r = Resultado("top", "💰 TOP", pd.DataFrame({"nome": ["Alfa", "Beta"], "total": [1.5, 2.0]}),
+                  descricao="   x", notas=["", "nota"], rodape=["", "fim"],
+                  modelo=["  {nome}", ["  {total}", "total"]], formatos={"total": ",.2f"}, limite=5)
+    guardar(r, tmp_path / "relatorios")
+    lido = carregar("top", tmp_path / "relatorios")
+    pd.testing.assert_frame_equal(lido.tabela, r.tabela)
+    for campo in ["titulo", "descricao", "notas", "rodape", "modelo", "formatos", "limite", "separador"]:
+        assert getattr(lido, campo) == getattr(r, campo)
+
+
+def test_tabela_vazia(tmp_path):
+    guardar(Resultado("resumo", "📊 RESUMO", pd.DataFrame(), notas=["Registos: 0"]), tmp_path)
+    lido = carregar("resumo", tmp_path)
+    assert lido.tabela.empty and lido.notas == ["Registos: 0"]
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+import partes
+import risco
+from resultados import Resultado
+
+
+def _df():
+    return pd.DataFrame({
+        "nipc_adjudicante": ["500000001"] * 4,
+        "nome_adjudicante": ["Câmara A"] * 4,
+        "nipc_adjudicatario": ["509000101|509000102", "509000101", None, "509000103"],
+        "nome_adjudicatario": ["Alfa, Lda.|Beta, S.A.", "Alfa, Lda.", "Gama", "Delta"],
+        "preco": [1000.0, 500.0, 300.0, 900.0],
+    })
+
+
+def test_por_entidade_usa_membros_dos_consorcios():
+    sinais = np.array([1, 1 | 8, 1, 0], dtype="uint16")
+    pontuacao = risco.PESOS[sinais]
+    t = risco.por_entidade(_df(), sinais, pontuacao).set_index("nome_adjudicatario")
+    assert not any("|" in n for n in t.index)
+    assert sorted(t.index) == ["Alfa, Lda.", "Beta, S.A.", "Gama"]      # Delta sem sinais
+    alfa = t.loc["Alfa, Lda."]
+    assert alfa["nif"] == "509000101"
+    assert (alfa["contratos"], alfa["exposicao"], alfa["pontuacao"]) == (2, 1000.0, 110)
+    assert (alfa["fragmentacao"], alfa["dominante"]) == (2, 1)
+    assert t.loc["Beta, S.A.", "exposicao"] == 500.0
+    assert t.loc["Gama", "contratos"] == 1 and pd.isna(t.loc["Gama", "nif"])
+    assert t.index[0] == "Alfa, Lda."
+
+
+def test_por_entidade_sem_sinais():
+    t = risco.por_entidade(_df(), np.zeros(4, "uint16"), np.zeros(4, "uint16"))
+    assert t.empty and "nome_adjudicatario" in t.columns
+
+
+def _bits(*nomes):
+    return sum(1 << risco.DETECTORES[n][0] for n in nomes)
+
+
+def _contratos():
+    return pd.DataFrame({
+        "nome_adjudicante": ["Câmara A", "Câmara A", "Câmara A", "Câmara B", "Câmara B"],
+        "nome_adjudicatario": ["Alfa", "Alfa", "Alfa", "Gama", "Beta"],
+        "nipc_adjudicatario": ["509000101", "509000101", "509000101", "509000103", "509000102"],
+        "tipo_procedimento": ["Ajuste Direto", "Ajuste Direto", "Concurso Público",
+                              "Ajuste Direto Simplificado", "Concurso Público"],
+        "objeto": ["a", "b", "c", "d", "e"],
+        "preco": [800.0, 1500.0, 500.0, 100.0, 90000.0],
+        "preco_efetivo": [800.0, 1500.0, 500.0, 100.0, 200000.0],
+        "data_celebracao": pd.to_datetime(["2024-03-01", "2024-03-05", "2024-05-01",
+                                           "2024-06-01", "2024-07-01"]),
+        "id_externo": ["id0", "id1", "id2", "id3", "id4"],
+    })
+
+
+def test_fragmentacao_ate_ao_maximo_e_so_ajustes_directos():
+    df = _contratos()
+    tabela = pd.DataFrame({"nome_adjudicante": ["Câmara A"], "nome_adjudicatario": ["Alfa"],
+                           "nipc_adjudicatario": ["509000101"], "mx": [1000.0],
+                           "junto_limiar": [True]})
+    frag, junto = risco._fragmentacao(df, partes.por_partes(df), tabela)
+    # 1 passa o máximo do par; 2 é concurso público; 3 é de outro par
+    assert frag.tolist() == [0] and junto.tolist() == [0]
+    tabela["junto_limiar"] = False
+    assert risco._fragmentacao(df, partes.por_partes(df), tabela)[1].tolist() == []
+
+
+def test_por_contrato_pelo_id_externo_ou_pela_chave_natural():
+    df = _contratos()
+    assert risco._por_contrato(df, pd.DataFrame({"id_externo": ["id4", "id1", "id4"]})).tolist() == [1, 4]
+    natural = df.iloc[[3]].drop(columns="id_externo")
+    assert risco._por_contrato(df, natural).tolist() == [3]
+    assert risco._por_contrato(df, pd.DataFrame()).tolist() == []
+
+
+def test_pontuar_mascara_e_pesos():
+    df = _contratos()
+    resultados = {
+        "fragmentacao": Resultado("fragmentacao", "", pd.DataFrame({
+            "nome_adjudicante": ["Câmara A"], "nome_adjudicatario": ["Alfa"],
+            "nipc_adjudicatario": ["509000101"], "mx": [1000.0], "junto_limiar": [True]})),
+        "temporal": Resultado("temporal", "", pd.DataFrame({"mes": [3, 5], "pico": [True, False]})),
+        "dominante": Resultado("dominante", "", pd.DataFrame({
+            "nome_adjudicante": ["Câmara B"], "nome_adjudicatario": ["Gama"]})),
+        "deriva": Resultado("deriva", "", pd.DataFrame({"id_externo": ["id4"]})),
+        "cruzamentos": Resultado("cruzamentos", "", pd.DataFrame({"contrato": [2]})),
+    }
+    sinais, pontuacao = risco.pontuar(df, resultados, partes.por_partes(df))
+    assert sinais.tolist() == [
+        _bits("fragmentacao", "junto_limiar", "temporal"),
+        _bits("temporal"),
+        _bits("cruzamento"),
+        _bits("dominante"),
+        _bits("deriva"),
+    ]
+    assert pontuacao.tolist() == [40 + 20 + 10, 10, 45, 30, 40]
+    # Sem resultados nenhum detector dispara (preco_atipico precisa de grupos grandes)
+    assert not risco.pontuar(df, {}, partes.por_partes(df))[0].any()
+
+
+def test_pesos_somam_os_detectores_da_mascara():
+    assert risco.PESOS[0] == 0
+    assert risco.PESOS[_bits("fragmentacao", "cruzamento")] == 85
+    assert risco.PESOS[-1] == sum(p for _, p, _ in risco.DETECTORES.values())
+
+
+def test_top_ordem_e_empates():
+    p = np.array([10, 30, 0, 30, 20, 20, 0], dtype="uint16")
+    assert risco.top(p, 3).tolist() == [1, 3, 4]
+    assert risco.top(p, 4).tolist() == [1, 3, 4, 5]
+    assert risco.top(p, 50).tolist() == [1, 3, 4, 5, 0]       # só pontuações > 0
+    assert risco.top(np.zeros(3, "uint16"), 5).tolist() == []
+
+
+def test_preco_atipico():
+    rng = np.random.default_rng(0)
+    precos = list(np.exp(rng.normal(8, 0.1, 40))) + [1e7, -5.0]
+    df = pd.DataFrame({"preco": precos + [1e9] * 3,
+                       "tipo_procedimento": ["Concurso Público"] * 42 + ["Consulta Prévia"] * 3})
+    # O atípico do grupo grande; o grupo de 3 é pequeno e o preço negativo ignora-se
+    assert risco.preco_atipico(df).tolist() == [40]
+    assert risco.preco_atipico(df.drop(columns="tipo_procedimento")).tolist() == []
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+import tipos
+
+
+def _num(valores):
+    s = pd.Series(valores, dtype=object)
+    f = tipos.detectar_numero(s)
+    return f, tipos.converter_numero(s, f).tolist()
+
+
+def test_formato_pt():
+    f, v = _num(["1.234,56 €", "12,5", "300"])
+    assert f == "pt" and v == [1234.56, 12.5, 300.0]
+
+
+def test_formato_en():
+    f, v = _num(["1,234.56", "1234.5", "7"])
+    assert f == "en" and v == [1234.56, 1234.5, 7.0]
+
+
+def test_empate_so_milhares_e_pt():
+    f, v = _num(["1.500", "12.000", "250.000"])
+    assert f == "pt" and v == [1500.0, 12000.0, 250000.0]
+
+
+def test_empate_com_virgula_nao_e_pt():
+    assert tipos.detectar_numero(pd.Series(["1.500", "1,500"])) == "en"
+
+
+def test_valor_en_em_coluna_pt_e_rejeitado():
+    s = pd.Series(["1.234,56", "10,00", "1234.56", "1.500"])
+    v = tipos.converter_numero(s, "pt")
+    assert v.iloc[:2].tolist() == [1234.56, 10.0]
+    assert np.isnan(v.iloc[2])
+    assert v.iloc[3] == 1500.0
+
+
+def test_valor_pt_em_coluna_en_e_rejeitado():
+    v = tipos.converter_numero(pd.Series(["1,234.50", "1234,56"]), "en")
+    assert v.iloc[0] == 1234.5 and np.isnan(v.iloc[1])
+
+
+def test_tipar_conta_invalidos():
+    df = pd.DataFrame({"preco": ["1.234,56", "2,00", "1234.56", None, "x"],
+                       "data_celebracao": ["01/02/2024", "2024-02-03", "15/03/2024 10:00", None, ""]})
+    t, rel = tipos.tipar(df)
+    assert rel["preco"] == {"formato": "pt", "invalidos": 2}
+    assert rel["data_celebracao"]["formato"] == "%d/%m/%Y"
+    assert t["data_celebracao"].dt.strftime("%Y-%m-%d").tolist()[:3] == [
+        "2024-02-01", "2024-02-03", "2024-03-15"]
+    assert rel["data_celebracao"]["invalidos"] == 0
+
+
+def test_lotes_reaproveitam_os_formatos_do_primeiro():
+    formatos = {}
+    _, rel = tipos.tipar(pd.DataFrame({"preco": ["1.234,56", "10,00"]}), formatos)
+    assert formatos == {"preco": "pt"}
+    # Sozinho, este lote seria lido à inglesa (1,500 = mil e quinhentos)
+    assert tipos.detectar_numero(pd.Series(["1,500", "2,000"])) == "en"
+    t, rel = tipos.tipar(pd.DataFrame({"preco": ["1,500", "2,000"]}), formatos)
+    assert t["preco"].tolist() == [1.5, 2.0] and rel["preco"]["formato"] == "pt"
@@ -0,0 +1,177 @@
+"""
+Conversão de tipos (números e datas em formato português)
+==========================================================
+
+Corre uma vez, ao carregar: detecta numa amostra o formato dos números
+("1.234,56 €" vs "1234.56") e das datas (dd/mm/aaaa, aaaa-mm-dd, com ou
+sem hora) e converte cada coluna inteira com operações de texto
+vectorizadas e um formato explícito — sem `errors="coerce"` às cegas,
+que transforma preços portugueses em NaN, nem inferência registo a
+registo.
+
+  df, relatorio = tipar(df)
+  relatorio["preco"]  →  {"formato": "pt", "invalidos": 3}
+"""
+
+import pandas as pd
+
+NUMERICAS = ["preco", "preco_efetivo"]
+DATAS = ["data_celebracao"]
+
+# Só a parte da data interessa; a hora (quando existe) é cortada antes
+FORMATOS_DATA = ["%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d", "%d.%m.%Y"]
+
+_PT = r"^-?(?:\d{1,3}(?:\.\d{3})+|\d+)(?:,\d+)?$"     # 1.234,56
+_EN = r"^-?(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?$"     # 1,234.56 / 1234.56
+_MILHARES = r"^-?\d{1,3}(?:\.\d{3})+$"                 # 1.500, 12.000 (lê nos dois)
+_PADRAO = {"pt": _PT, "en": _EN}
+
+
+def _amostra(s, n=2000):
+    """Até n valores não vazios, espalhados pela coluna toda."""
+    s = s.dropna()
+    if len(s) > n:
+        s = s.iloc[::len(s) // n]
+    return s
+
+
+def _texto(s):
+    return s.astype("string").str.strip()
+
+
+# ════════════════════════════════════════
+# NÚMEROS
+# ════════════════════════════════════════
+
+# Limpeza completa: tira o símbolo do euro e espaços e troca os separadores
+_SEM_LIXO = {ord(c): None for c in "€ \t\u00a0\u202f"}
+_TRADUCAO = {
+    "pt": {**_SEM_LIXO, ord("."): None, ord(","): "."},
+    "en": {**_SEM_LIXO, ord(","): None},
+}
+
+
+def detectar_numero(s):
+    """"pt" (1.234,56) ou "en" (1,234.56 / 1234.56), pela amostra.
+
+    Só contam os valores que um dos formatos lê e o outro não. Em empate
+    (p.ex. só "1.500" e "12.000", que leem nos dois), grupos de três
+    dígitos depois do ponto e nenhuma vírgula indicam milhares à portuguesa.
+    """
+    a = _texto(_amostra(s)).str.translate(_SEM_LIXO)
+    pt = a.str.match(_PT)
+    en = a.str.match(_EN)
+    so_pt, so_en = int((pt & ~en).sum()), int((en & ~pt).sum())
+    if so_pt != so_en:
+        return "pt" if so_pt > so_en else "en"
+    virgulas = a.str.contains(",", regex=False).any()
+    return "pt" if a.str.match(_MILHARES).any() and not virgulas else "en"
+
+
+def converter_numero(s, formato):
+    """Converte a coluna; só os valores que falham passam pela limpeza completa.
+
+    A maioria dos valores ("1.234,56" ou "1234.56") só precisa de
+    substituições literais, muito mais baratas do que limpar tudo. Valores
+    que não seguem o formato da coluna ficam NaN em vez de serem lidos no
+    outro formato ("1234.56" numa coluna "pt" não passa a 123456).
+    """
+    t = s.astype("string")
+    if formato == "pt":
+        rapido = t.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    else:
+        rapido = t
+    v = pd.to_numeric(rapido, errors="coerce").astype("float64")
+    if formato == "pt":
+        # Um "." só pode separar milhares; o resto vai à limpeza, que valida.
+        # A regex só corre nos valores com ".", em geral poucos
+        ponto = t.str.contains(".", regex=False).fillna(False).astype(bool)
+        if ponto.any():
+            ok = ~ponto
+            ok[ponto] = t[ponto].str.fullmatch(_PT).astype(bool)
+            v = v.where(ok)
+    falta = v.isna() & s.notna()
+    if falta.any():
+        limpo = s[falta].astype("string").str.translate(_SEM_LIXO)
+        limpo = limpo.where(limpo.str.match(_PADRAO[formato]).fillna(False).astype(bool))
+        v[falta] = pd.to_numeric(limpo.str.translate(_TRADUCAO[formato]),
+                                 errors="coerce").astype("float64")
+    return v
+
+
+# ════════════════════════════════════════
+# DATAS
+# ════════════════════════════════════════
+
+def detectar_data(s):
+    """O formato da lista que lê mais valores da amostra (ou None)."""
+    a = _texto(_amostra(s)).str.slice(0, 10)
+    a = a[a.ne("")]
+    if not len(a):
+        return None
+    taxas = {f: pd.to_datetime(a, format=f, errors="coerce").notna().mean()
+             for f in FORMATOS_DATA}
+    melhor = max(taxas, key=taxas.get)
+    return melhor if taxas[melhor] > 0.5 else None
+
+
+def converter_data(s, formato):
+    """Converte com o formato detectado; o que sobrar tenta os restantes.
+
+    Colunas com formatos misturados (p.ex. exportações concatenadas) ficam
+    assim lidas por inteiro, sempre com formatos explícitos.
+    """
+    t = _texto(s).str.slice(0, 10)
+    if formato is None:
+        return pd.to_datetime(t, errors="coerce", format="mixed", dayfirst=True)
+    d = pd.to_datetime(t, format=formato, errors="coerce")
+    for f in FORMATOS_DATA:
+        falta = d.isna() & t.notna() & t.ne("")
+        if not falta.any():
+            break
+        if f != formato:
+            d[falta] = pd.to_datetime(t[falta], format=f, errors="coerce")
+    return d
+
+
+# ════════════════════════════════════════
+# ETAPA DE CONVERSÃO
+# ════════════════════════════════════════
+
+def _invalidos(original, convertido):
+    """Valores não vazios que a conversão não conseguiu ler."""
+    falhou = original[convertido.isna() & original.notna()]
+    return int(_texto(falhou).ne("").sum())
+
+
+def tipar(df, formatos=None):
+    """Converte as colunas numéricas e de datas conhecidas; devolve (df, relatório).
+
+    Colunas que já têm o tipo certo (p.ex. vindas do Excel) ficam como estão.
+    `invalidos` conta valores não vazios que não foi possível ler.
+    `formatos` (dicionário) guarda os formatos detectados; passado de novo,
+    reaproveita-os, e os lotes de um mesmo ficheiro leem-se todos com os
+    formatos do primeiro.
+    """
+    formatos = {} if formatos is None else formatos
+    df = df.copy()
+    relatorio = {}
+    for c in NUMERICAS:
+        if c not in df.columns or pd.api.types.is_numeric_dtype(df[c]):
+            continue
+        if c not in formatos:
+            formatos[c] = detectar_numero(df[c])
+        formato = formatos[c]
+        v = converter_numero(df[c], formato)
+        relatorio[c] = {"formato": formato, "invalidos": _invalidos(df[c], v)}
+        df[c] = v
+    for c in DATAS:
+        if c not in df.columns or pd.api.types.is_datetime64_any_dtype(df[c]):
+            continue
+        if c not in formatos:
+            formatos[c] = detectar_data(df[c])
+        formato = formatos[c]
+        v = converter_data(df[c], formato)
+        relatorio[c] = {"formato": formato or "misto", "invalidos": _invalidos(df[c], v)}
+        df[c] = v
+    return df, relatorio